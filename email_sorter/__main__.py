@@ -1,146 +1,346 @@
 import argparse
 import sys
 import logging
+from datetime import date
 
-from utils import setup_logger
-from imap import IMAPClient, IMAPClientError
-from parser import EmailParser, EmailClassifier
-from reporting import AttachmentHandler, ReportGenerator, EmailDatabase
+from imap.search import parse_header_filter, search_value
+from utils import load_env, parse_size, setup_logger
 
-def run_pipeline(mailbox="INBOX", status="UNSEEN", limit=None, domain=None, language="en"):
+# The pipeline modules are imported inside the commands that use them,
+# so that `--help` and argument errors do not pay for sqlite3, ssl, email...
+
+def run_pipeline(mailbox="INBOX", status="UNSEEN", limit=None, domain=None, language="en",
+                 engine="rules", model_path="output/nb_model.json",
+                 max_body_chars=None, max_stored_body=None, resume=False,
+                 incremental=False, filters=None, io_workers=4, fsync=False,
+                 attachment_policy=None, export_path=None, export_format="auto",
+                 thread_reuse=True, sender_reputation=None, explain=False):
     """
     Core ingestion logic.
     :param mailbox: The IMAP folder to scan
     :param status: The search criteria (UNSEEN, SEEN, ALL, etc.)
     :param limit: Maximum number of emails to process
+    :param engine: "rules" for keyword rules only, "nb" to let a Naive Bayes model
+        classify the emails the rules leave as "General"
+    :param model_path: Where the Naive Bayes model is loaded from and saved to
+    :param max_body_chars: Longest body (head + tail) scanned by the classifier
+    :param max_stored_body: Longest body (head + tail) stored in the database
+    :param resume: Continue the last interrupted run on this mailbox from its checkpoints
+    :param incremental: Only search the emails changed since the last complete run
+        (servers with CONDSTORE, a full search otherwise)
+    :param filters: Filters evaluated by the server along with the status
+        (since, before, sender, larger, smaller, headers, see imap.build_search_criteria)
+    :param io_workers: Threads writing attachment files
+    :param fsync: Sync attachment files to disk before recording them
+    :param attachment_policy: JSON file of the attachment size/type rules per category
+    :param export_path: Directory receiving the processed emails as partitioned Parquet
+        (compressed NDJSON without pyarrow)
+    :param export_format: "auto", "parquet" or "ndjson"
+    :param thread_reuse: Give replies the category of their thread without classifying them
+    :param sender_reputation: Options of the learned sender -> category table
+        (threshold, min_count, half_life_days), None to scan every email
+    :param explain: Store the keyword matches behind each classification in the database
     """
+    from imap import IMAPClient, IMAPClientError, build_search_criteria
+    from pipeline import MailboxRun, build_processor
+
     setup_logger()
-    logging.info("Starting email ingestion pipeline [Mailbox: {mailbox}] [Status: {status}]")
+    # programmatic callers skip main(), load the .env here too (only done once)
+    load_env()
+    logging.info(f"Starting email ingestion pipeline [Mailbox: {mailbox}] [Status: {status}]")
 
-    # Initialize handlers
-    parser = EmailParser()
-    classifier = EmailClassifier(language=language)
-    attachment_handler = AttachmentHandler()
-    report_generator = ReportGenerator()
-    database = EmailDatabase()
+    # before anything is created on disk: a filter the server cannot take fails here
+    criteria = build_search_criteria(status, **(filters or {}))
 
-    if domain:
-        classifier.internal_domain = domain.lower()
+    # Initialize handlers
+    processor = build_processor(
+        language=language,
+        domain=domain,
+        engine=engine,
+        model_path=model_path,
+        max_body_chars=max_body_chars,
+        max_stored_body=max_stored_body,
+        io_workers=io_workers,
+        fsync=fsync,
+        attachment_policy=attachment_policy,
+        export_path=export_path,
+        export_format=export_format,
+        thread_reuse=thread_reuse,
+        sender_reputation=sender_reputation,
+        explain=explain,
+    )
 
     try:
-        with IMAPClient() as client:
-            client.select_mailbox(mailbox)
-
-            email_ids = client.search(status)
-            if not email_ids:
-                logging.info(f"No emails found matching criteria: {status}")
-                return
-
-            if limit:
-                email_ids = email_ids[:limit]
-            
-            logging.info(f"{len(email_ids)} emails with status: {status} found to process")
-
-            for email_id in email_ids:
-                raw_email = None
-                try:
-                    raw_email = client.fetch_email(email_id)
-                    logging.info(f"Email {email_id.decode()} fetched")
-
-                    # Parse email
-                    email_data = parser.parse_email(raw_email)
-                    
-                    # Classify email
-                    email_category = classifier.classify_email(email_data)
-
-                    # Log email information
-                    logging.info(f"Sender: {email_data['sender']}")
-                    logging.info(f"Subject: {email_data['subject']}")
-                    logging.info(f"Date: {email_data['date']}")
-                    logging.info(f"Category: {email_category}")
-
-                    # Body preview
-                    preview_body = email_data['body'].replace('\n', ' ').replace('\r', '')[:100]
-                    logging.info(f"Body preview: {preview_body}")
-
-                    # Handle attachments
-                    has_attachments = len(email_data['attachments']) > 0
-                    saved_files = []
-                    if has_attachments:
-                        logging.info(f"Attachments found: {email_data['attachments']}")
-                        saved_files = attachment_handler.save_attachments(
-                            raw_email, 
-                            email_category, 
-                            email_id
-                        )
-                        if saved_files:
-                            logging.info(f"Saved {len(saved_files)} attachment(s)")
-                    else:
-                        logging.info("No attachments found")
-
-                    # Save to database
-                    db_email_id = database.insert_email(
-                        email_data,
-                        email_category,
-                        has_attachments=has_attachments
-                    )
-                    
-                    # Save attachments to database
-                    for file_path in saved_files:
-                        filename = file_path.split('/')[-1] if '/' in file_path else file_path.split('\\')[-1]
-                        database.insert_attachment(db_email_id, filename, file_path, email_category)
-
-                    # Record email for reporting
-                    report_generator.record_email(
-                        email_data, 
-                        email_category, 
-                        has_attachments=has_attachments
-                    )
-
-                    logging.info("-" * 40)  # Visual separator
-
-                    # Mark email as read after successful processing
-                    if status.upper() == "UNSEEN":
-                        client.mark_as_read(email_id)
-                
-                except Exception as e:
-                    logging.error(f"Failed to process email {email_id}: {e}", exc_info=True)
-                    # Record error in database and report
-                    try:
-                        email_data = parser.parse_email(raw_email)
-                        database.insert_email(email_data, "ERROR", error=str(e))
-                        report_generator.record_email(
-                            email_data, 
-                            "ERROR", 
-                            error=str(e)
-                        )
-                    except:
-                        # If parsing also fails, record minimal info
-                        error_data = {'sender': '', 'subject': '', 'date': '', 'attachments': []}
-                        database.insert_email(error_data, "ERROR", error=str(e))
-                        report_generator.record_email(
-                            error_data, 
-                            "ERROR", 
-                            error=str(e)
-                        )
+        with IMAPClient(use_uid=True) as client:
+            run = MailboxRun(
+                processor, mailbox, criteria, limit=limit, resume=resume, incremental=incremental
+            )
+            run.start(client)
+            run.process_batch(client)
+            run.finish()
 
     except IMAPClientError as e:
         logging.error(f"IMAP pipeline failed: {e}")
     except Exception as e:
         logging.exception("Unexpected error occurred")
 
-    logging.info("Generating reports...")
-    for name, path in zip(
-        ("Detail", "Summary"),
-        report_generator.generate_reports(),
-    ):
-        if path:
-            logging.info(f"{name} report saved: {path}")
-
-    # Close database connection
-    database.close()
+    processor.close()
     logging.info("Email ingestion pipeline finished")
 
+def run_fleet(config_path, workers=4, batch_size=25, status="UNSEEN", limit=None,
+              domain=None, language="en", engine="rules",
+              model_path="output/nb_model.json", max_body_chars=None,
+              max_stored_body=None, resume=False, incremental=False, filters=None,
+              io_workers=4, fsync=False, attachment_policy=None, export_path=None,
+              export_format="auto", thread_reuse=True, sender_reputation=None,
+              explain=False):
+    """
+    Ingest every account and folder listed in a JSON config file concurrently.
+    :param config_path: JSON file describing the accounts (see scheduler.load_fleet_config)
+    :param workers: Number of mailbox batches processed at the same time
+    :param batch_size: Emails processed before a mailbox yields to the others
+    :param limit: Maximum number of emails to process per mailbox
+    :param filters: Server-side search filters, as in run_pipeline
+    """
+    from imap import build_search_criteria
+    from pipeline import build_processor
+    from scheduler import FleetScheduler, load_fleet_config
+
+    setup_logger()
+    accounts = load_fleet_config(config_path)
+    logging.info(
+        f"Starting fleet ingestion: {len(accounts)} accounts, "
+        f"{sum(len(a['folders']) for a in accounts)} mailboxes, {workers} workers"
+    )
+
+    criteria = build_search_criteria(status, **(filters or {}))
+    processor = build_processor(
+        language=language,
+        domain=domain,
+        engine=engine,
+        model_path=model_path,
+        max_body_chars=max_body_chars,
+        max_stored_body=max_stored_body,
+        io_workers=io_workers,
+        fsync=fsync,
+        attachment_policy=attachment_policy,
+        export_path=export_path,
+        export_format=export_format,
+        thread_reuse=thread_reuse,
+        sender_reputation=sender_reputation,
+        explain=explain,
+    )
+
+    try:
+        FleetScheduler(
+            processor,
+            accounts,
+            workers=workers,
+            batch_size=batch_size,
+            status=criteria,
+            limit=limit,
+            resume=resume,
+            incremental=incremental,
+        ).run()
+    except Exception:
+        logging.exception("Unexpected error occurred")
+
+    processor.close()
+    logging.info("Fleet ingestion finished")
+
+def run_coordinator(queue_path, mailbox="INBOX", status="UNSEEN", shard_size=500,
+                    filters=None):
+    """
+    Split the UID space of a mailbox into shards and publish them to the work queue.
+    :param queue_path: SQLite file (*.db) or directory (local-file stand-in) of the queue
+    :param shard_size: Number of UIDs per shard
+    :param filters: Server-side search filters, as in run_pipeline
+    """
+    from imap import IMAPClient, IMAPClientError, build_search_criteria
+    from sharding import publish_shards
+    from workqueue import open_work_queue
+
+    setup_logger()
+    criteria = build_search_criteria(status, **(filters or {}))
+    work_queue = open_work_queue(queue_path)
+    try:
+        with IMAPClient(use_uid=True) as client:
+            publish_shards(client, work_queue, mailbox, criteria, shard_size)
+    except IMAPClientError as e:
+        logging.error(f"IMAP coordinator failed: {e}")
+    finally:
+        work_queue.close()
+
+def run_worker(queue_path, shard_dir="output/shards", lease_seconds=300, batch_size=25,
+               max_attempts=3, domain=None, language="en", engine="rules",
+               model_path="output/nb_model.json", max_body_chars=None,
+               max_stored_body=None, io_workers=4, fsync=False, attachment_policy=None,
+               thread_reuse=True, sender_reputation=None, explain=False):
+    """
+    Claim shards from the work queue and process each into a partial database
+    in shard_dir, until every shard is done.
+    :param lease_seconds: Time after which the shard of a silent worker is reclaimed
+    :param max_attempts: Claims of a shard failing with IMAP errors before it is marked failed
+    """
+    from imap import IMAPClient, IMAPClientError
+    from pipeline import build_processor
+    from sharding import ShardWorker
+    from workqueue import open_work_queue
+
+    setup_logger()
+    work_queue = open_work_queue(queue_path)
+
+    def processor_factory(db_path):
+        return build_processor(
+            language=language,
+            domain=domain,
+            engine=engine,
+            model_path=model_path,
+            max_body_chars=max_body_chars,
+            max_stored_body=max_stored_body,
+            db_path=db_path,
+            io_workers=io_workers,
+            fsync=fsync,
+            attachment_policy=attachment_policy,
+            thread_reuse=thread_reuse,
+            sender_reputation=sender_reputation,
+            explain=explain,
+        )
+
+    worker = ShardWorker(
+        work_queue,
+        lambda: IMAPClient(use_uid=True),
+        processor_factory,
+        shard_dir=shard_dir,
+        lease_seconds=lease_seconds,
+        batch_size=batch_size,
+        max_attempts=max_attempts,
+    )
+    try:
+        processed = worker.run()
+        logging.info(f"Worker {worker.worker_id} finished: {processed} shards processed")
+    except IMAPClientError as e:
+        logging.error(f"IMAP worker failed: {e}")
+    finally:
+        work_queue.close()
+
+def run_merge(queue_path):
+    """Merge the partial databases of the done shards and generate the reports."""
+    from pipeline import build_processor
+    from sharding import merge_shards
+    from workqueue import open_work_queue
+
+    setup_logger()
+    work_queue = open_work_queue(queue_path)
+    processor = build_processor()
+    try:
+        merged = merge_shards(work_queue, processor.database, processor.report_generator)
+        logging.info(f"{merged} shards merged")
+    finally:
+        work_queue.close()
+    processor.close()
+
+def retry_failed(max_attempts=5, base_delay=60, limit=None, domain=None, language="en",
+                 engine="rules", model_path="output/nb_model.json",
+                 max_body_chars=None, max_stored_body=None, thread_reuse=True,
+                 sender_reputation=None, explain=False):
+    """
+    Reprocess the emails of the dead-letter queue, without connecting to IMAP.
+    :param max_attempts: Attempts after which a message is marked as poisoned
+    :param base_delay: Seconds before the first retry, doubled after each failure
+    :param limit: Maximum number of dead letters to retry
+    """
+    from pipeline import build_processor
+
+    setup_logger()
+    logging.info("Retrying failed emails from the dead-letter queue")
+
+    processor = build_processor(
+        language=language,
+        domain=domain,
+        engine=engine,
+        model_path=model_path,
+        max_body_chars=max_body_chars,
+        max_stored_body=max_stored_body,
+        thread_reuse=thread_reuse,
+        sender_reputation=sender_reputation,
+        explain=explain,
+    )
+
+    resolved, rescheduled, poisoned = processor.retry_dead_letters(
+        max_attempts=max_attempts,
+        base_delay=base_delay,
+        limit=limit,
+    )
+    logging.info(
+        f"Dead letters: {resolved} resolved, {rescheduled} rescheduled, {poisoned} poisoned"
+    )
+
+    processor.close(generate_reports=False)
+
+def run_export(export_path="output/export", export_format="auto"):
+    """Export every email of the database as partitioned Parquet (or compressed NDJSON)."""
+    from reporting import EmailDatabase, export_database, open_exporter
+
+    setup_logger()
+    database = EmailDatabase()
+    try:
+        count = export_database(database, open_exporter(export_path, export_format))
+        logging.info(f"{count} emails exported to {export_path}")
+    finally:
+        database.close()
+
+def run_rule_report(language="en"):
+    """Write the keyword hit-rate report of the emails stored with an explanation."""
+    from parser import EmailClassifier
+    from reporting import EmailDatabase, ReportGenerator
+
+    setup_logger()
+    languages = ["en", "fr"] if language in ("auto", "both") else [language]
+    database = EmailDatabase()
+    try:
+        ReportGenerator().generate_rule_report(
+            database.iter_explanations(), EmailClassifier().keywords(languages)
+        )
+    finally:
+        database.close()
+
+def run_rebuild_stats():
+    """Recompute the summary tables of the database and check them against the emails."""
+    from reporting import EmailDatabase
+
+    setup_logger()
+    database = EmailDatabase()
+    try:
+        if database.rebuild_statistics():
+            logging.info("Summary tables were consistent with the emails")
+    finally:
+        database.close()
+
+def run_prune(policy_path, archive_path="output/archive.db",
+              attachments_path="output/attachments", batch_size=500, pause=0.05,
+              convert_vacuum=False):
+    """
+    Apply a retention policy to the database and attachment folders, in small batches.
+    :param convert_vacuum: Run the full VACUUM a database created before incremental
+        auto-vacuum needs once, instead of skipping the vacuum step
+    """
+    from reporting import BodyArchive, EmailDatabase, RetentionPolicy, RetentionRun
+
+    setup_logger()
+    policy = RetentionPolicy.load(policy_path)
+    database = EmailDatabase()
+    archive = BodyArchive(archive_path)
+    try:
+        counts = RetentionRun(
+            database, policy, archive, attachments_path, batch_size=batch_size, pause=pause,
+            convert_vacuum=convert_vacuum,
+        ).run()
+        logging.info("Retention: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+    finally:
+        archive.close()
+        database.close()
+
 def main():
     arg_parser = argparse.ArgumentParser(
         description="Ingest, classify, and report on emails from an IMAP server.",
@@ -160,6 +360,47 @@ def main():
         help="Search criteria for emails"
     )
     
+    arg_parser.add_argument(
+        "--since",
+        type=date.fromisoformat,
+        metavar="YYYY-MM-DD",
+        help="Only emails received on or after this date (filtered by the server)"
+    )
+
+    arg_parser.add_argument(
+        "--before",
+        type=date.fromisoformat,
+        metavar="YYYY-MM-DD",
+        help="Only emails received before this date (filtered by the server)"
+    )
+
+    arg_parser.add_argument(
+        "--from",
+        dest="sender",
+        type=search_value,
+        help="Only emails whose From header contains this text (filtered by the server)"
+    )
+
+    arg_parser.add_argument(
+        "--larger",
+        type=parse_size,
+        help="Only emails larger than this size, e.g. 500K (filtered by the server)"
+    )
+
+    arg_parser.add_argument(
+        "--smaller",
+        type=parse_size,
+        help="Only emails smaller than this size, e.g. 5M (filtered by the server)"
+    )
+
+    arg_parser.add_argument(
+        "--header",
+        type=parse_header_filter,
+        action="append",
+        metavar="NAME:VALUE",
+        help="Only emails whose NAME header contains VALUE, repeatable (filtered by the server)"
+    )
+
     arg_parser.add_argument(
         "-l", "--limit", 
         type=int, 
@@ -168,25 +409,484 @@ def main():
 
     arg_parser.add_argument(
         "-d", "--domain", 
-        help="Override the internal domain (e.g., @custom.com)"
+        help="Override the internal domains, comma-separated, '*.' for every subdomain "
+             "(e.g., @custom.com,*.custom.fr)"
     )
 
     arg_parser.add_argument(
         "-lang", "--language", 
-        choices=["en", "fr"], 
+        choices=["en", "fr", "auto", "both"], 
         default="en",
-        help="Choose the language for classification rules (English or French)."
+        help="Choose the language for classification rules (English or French), "
+             "auto to detect it for each email, or both to score every email with both rulesets."
+    )
+
+    arg_parser.add_argument(
+        "--engine",
+        choices=["rules", "nb"],
+        default="rules",
+        help="Classification engine: keyword rules only, or rules with a Naive Bayes "
+             "model trained on the database history for emails no rule matches."
+    )
+
+    arg_parser.add_argument(
+        "--model-path",
+        default="output/nb_model.json",
+        help="File the Naive Bayes model is loaded from and saved to."
+    )
+
+    arg_parser.add_argument(
+        "--max-body-chars",
+        type=int,
+        default=100_000,
+        help="Only scan the first and last half of this many body characters when classifying."
+    )
+
+    arg_parser.add_argument(
+        "--max-stored-body",
+        type=int,
+        default=1_000_000,
+        help="Only store the first and last half of this many body characters in the database."
+    )
+
+    arg_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last interrupted run on this mailbox where it stopped."
+    )
+
+    arg_parser.add_argument(
+        "--io-workers",
+        type=int,
+        default=4,
+        help="Threads writing attachment files while the next emails are processed."
+    )
+
+    arg_parser.add_argument(
+        "--fsync",
+        action="store_true",
+        help="Sync attachment files to disk before recording them in the database."
+    )
+
+    arg_parser.add_argument(
+        "--attachment-policy",
+        metavar="PATH",
+        help="JSON file of per-category attachment rules (max size, allowed/denied "
+             "types and extensions, metadata only). Skipped attachments are still "
+             "recorded in the database."
+    )
+
+    arg_parser.add_argument(
+        "--no-thread-reuse",
+        dest="thread_reuse",
+        action="store_false",
+        help="Classify every reply on its own instead of giving it the category "
+             "of the thread it belongs to."
+    )
+
+    arg_parser.add_argument(
+        "--sender-threshold",
+        type=float,
+        default=0.95,
+        help="Share of a sender's history that must be in one category for its emails "
+             "to get that category without a keyword scan."
+    )
+
+    arg_parser.add_argument(
+        "--sender-min-count",
+        type=float,
+        default=5,
+        help="Emails (decayed) a sender needs in the history before it is trusted."
+    )
+
+    arg_parser.add_argument(
+        "--sender-half-life",
+        type=float,
+        default=90,
+        metavar="DAYS",
+        help="Age at which an email counts half in the sender history (0 for no decay)."
+    )
+
+    arg_parser.add_argument(
+        "--sender-reputation",
+        action="store_true",
+        help="Classify the senders with a consistent history without scanning their "
+             "emails (reads the whole email history at startup)."
+    )
+
+    arg_parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="Store the matched keywords, their positions, the per-category scores and "
+             "the runner-up of each classification (see the rule-report command)."
+    )
+
+    arg_parser.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Lowest level of the log lines written."
+    )
+
+    arg_parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Only log warnings and errors (same as --log-level WARNING)."
+    )
+
+    arg_parser.add_argument(
+        "--log-format",
+        choices=["text", "json"],
+        default="text",
+        help="Log lines as text, or as JSON objects with email_id and stage fields."
+    )
+
+    arg_parser.add_argument(
+        "--log-sample",
+        type=float,
+        default=1.0,
+        metavar="RATE",
+        help="Share of the emails (0 to 1) whose per-email lines are logged; below 1, "
+             "aggregate counters are logged every 1000 emails instead."
+    )
+
+    arg_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only fetch the emails added or changed since the last complete run "
+             "(needs CONDSTORE on the server, full search otherwise)."
+    )
+    
+    arg_parser.add_argument(
+        "--export",
+        metavar="DIR",
+        help="Also write the processed emails to DIR as Parquet partitioned by category "
+             "and week (gzip NDJSON when pyarrow is not installed)."
+    )
+
+    arg_parser.add_argument(
+        "--export-format",
+        choices=["auto", "parquet", "ndjson"],
+        default="auto",
+        help="Format of --export and of the export command."
+    )
+
+    subparsers = arg_parser.add_subparsers(dest="command")
+    retry_parser = subparsers.add_parser(
+        "retry-failed",
+        help="Reprocess the emails that failed, from the dead-letter queue (no IMAP access).",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    retry_parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=5,
+        help="Attempts after which a failing email is marked as poisoned"
+    )
+    retry_parser.add_argument(
+        "--base-delay",
+        type=float,
+        default=60,
+        help="Seconds before retrying an email again, doubled after each failure"
+    )
+
+    fleet_parser = subparsers.add_parser(
+        "fleet",
+        help="Ingest every account and folder listed in a config file, concurrently.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    fleet_parser.add_argument(
+        "-c", "--config",
+        required=True,
+        help="JSON file listing the accounts, their folders and connection limits"
+    )
+    fleet_parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=4,
+        help="Number of mailbox batches processed concurrently"
+    )
+    fleet_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=25,
+        help="Emails processed before a mailbox yields to the others"
+    )
+
+    coordinator_parser = subparsers.add_parser(
+        "coordinator",
+        help="Split the UIDs of the mailbox into shards and publish them to a work queue.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    coordinator_parser.add_argument(
+        "-q", "--queue",
+        default="output/queue.db",
+        help="Work queue: SQLite file (*.db) or directory for the local-file queue"
+    )
+    coordinator_parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=500,
+        help="Number of UIDs per shard"
+    )
+
+    worker_parser = subparsers.add_parser(
+        "worker",
+        help="Claim and process shards from a work queue until all are done.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    worker_parser.add_argument(
+        "-q", "--queue",
+        default="output/queue.db",
+        help="Work queue: SQLite file (*.db) or directory for the local-file queue"
+    )
+    worker_parser.add_argument(
+        "--shard-dir",
+        default="output/shards",
+        help="Directory (shared by all workers) receiving the per-shard partial databases"
+    )
+    worker_parser.add_argument(
+        "--lease",
+        type=float,
+        default=300,
+        help="Seconds without renewal after which a shard is given to another worker"
+    )
+    worker_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=25,
+        help="Emails processed between two lease renewals"
+    )
+    worker_parser.add_argument(
+        "--shard-attempts",
+        type=int,
+        default=3,
+        help="Attempts of a shard failing with IMAP errors before it is marked failed"
+    )
+
+    subparsers.add_parser(
+        "export",
+        help="Export the whole database for analytics (see --export-format), "
+             "to the --export directory (output/export by default).",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    subparsers.add_parser(
+        "rule-report",
+        help="Report how often each keyword rule of the --language rulesets matched, "
+             "over the emails processed with --explain.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    subparsers.add_parser(
+        "rebuild-stats",
+        help="Recompute the per category, sender and day summary tables of the database "
+             "and report whether they were consistent.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    prune_parser = subparsers.add_parser(
+        "prune",
+        help="Apply a retention policy: archive old bodies, delete old emails, compress or "
+             "delete old attachments, sync the attachment rows with the files, vacuum.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    prune_parser.add_argument(
+        "--policy",
+        required=True,
+        metavar="PATH",
+        help="JSON file of per-category retention rules"
+    )
+    prune_parser.add_argument(
+        "--archive",
+        default="output/archive.db",
+        help="Database the archived bodies are moved to (zlib compressed)"
+    )
+    prune_parser.add_argument(
+        "--attachments-dir",
+        default="output/attachments",
+        help="Attachment folders checked for files without a database row"
+    )
+    prune_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Rows changed per transaction"
+    )
+    prune_parser.add_argument(
+        "--pause",
+        type=float,
+        default=0.05,
+        help="Seconds between two batches, leaving the database to a concurrent run"
+    )
+    prune_parser.add_argument(
+        "--convert-vacuum",
+        action="store_true",
+        help="Convert a database created before incremental auto-vacuum with one full "
+             "VACUUM (locks the database while it rewrites it); skipped otherwise"
+    )
+
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help="Merge the processed shards into the database and generate the reports.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    merge_parser.add_argument(
+        "-q", "--queue",
+        default="output/queue.db",
+        help="Work queue: SQLite file (*.db) or directory for the local-file queue"
     )
     
     args = arg_parser.parse_args()
+    # the commands below keep this configuration when they call setup_logger()
+    setup_logger(
+        level="WARNING" if args.quiet else args.log_level,
+        json_format=args.log_format == "json",
+        sample_rate=args.log_sample,
+    )
+    # credentials and INTERNAL_DOMAIN may come from a .env file
+    load_env()
+    filters = {
+        "since": args.since,
+        "before": args.before,
+        "sender": args.sender,
+        "larger": args.larger,
+        "smaller": args.smaller,
+        "headers": args.header,
+    }
+    sender_reputation = None
+    if args.sender_reputation:
+        sender_reputation = {
+            "threshold": args.sender_threshold,
+            "min_count": args.sender_min_count,
+            "half_life_days": args.sender_half_life or None,
+        }
 
     try:
+        if args.command == "retry-failed":
+            retry_failed(
+                max_attempts=args.max_attempts,
+                base_delay=args.base_delay,
+                limit=args.limit,
+                domain=args.domain,
+                language=args.language,
+                engine=args.engine,
+                model_path=args.model_path,
+                max_body_chars=args.max_body_chars,
+                max_stored_body=args.max_stored_body,
+                thread_reuse=args.thread_reuse,
+                sender_reputation=sender_reputation,
+                explain=args.explain
+            )
+            return
+
+        if args.command == "coordinator":
+            run_coordinator(
+                args.queue,
+                mailbox=args.mailbox,
+                status=args.status,
+                shard_size=args.shard_size,
+                filters=filters
+            )
+            return
+
+        if args.command == "worker":
+            run_worker(
+                args.queue,
+                shard_dir=args.shard_dir,
+                lease_seconds=args.lease,
+                batch_size=args.batch_size,
+                max_attempts=args.shard_attempts,
+                domain=args.domain,
+                language=args.language,
+                engine=args.engine,
+                model_path=args.model_path,
+                max_body_chars=args.max_body_chars,
+                max_stored_body=args.max_stored_body,
+                io_workers=args.io_workers,
+                fsync=args.fsync,
+                attachment_policy=args.attachment_policy,
+                thread_reuse=args.thread_reuse,
+                sender_reputation=sender_reputation,
+                explain=args.explain
+            )
+            return
+
+        if args.command == "export":
+            run_export(args.export or "output/export", args.export_format)
+            return
+
+        if args.command == "rule-report":
+            run_rule_report(args.language)
+            return
+
+        if args.command == "rebuild-stats":
+            run_rebuild_stats()
+            return
+
+        if args.command == "prune":
+            run_prune(
+                args.policy,
+                archive_path=args.archive,
+                attachments_path=args.attachments_dir,
+                batch_size=args.batch_size,
+                pause=args.pause,
+                convert_vacuum=args.convert_vacuum
+            )
+            return
+
+        if args.command == "merge":
+            run_merge(args.queue)
+            return
+
+        if args.command == "fleet":
+            run_fleet(
+                args.config,
+                workers=args.workers,
+                batch_size=args.batch_size,
+                status=args.status,
+                limit=args.limit,
+                domain=args.domain,
+                language=args.language,
+                engine=args.engine,
+                model_path=args.model_path,
+                max_body_chars=args.max_body_chars,
+                max_stored_body=args.max_stored_body,
+                resume=args.resume,
+                incremental=args.incremental,
+                filters=filters,
+                io_workers=args.io_workers,
+                fsync=args.fsync,
+                attachment_policy=args.attachment_policy,
+                export_path=args.export,
+                export_format=args.export_format,
+                thread_reuse=args.thread_reuse,
+                sender_reputation=sender_reputation,
+                explain=args.explain
+            )
+            return
+
         run_pipeline(
             mailbox=args.mailbox, 
             status=args.status, 
             limit=args.limit,
             domain=args.domain,
-            language=args.language
+            language=args.language,
+            engine=args.engine,
+            model_path=args.model_path,
+            max_body_chars=args.max_body_chars,
+            max_stored_body=args.max_stored_body,
+            resume=args.resume,
+            incremental=args.incremental,
+            filters=filters,
+            io_workers=args.io_workers,
+            fsync=args.fsync,
+            attachment_policy=args.attachment_policy,
+            export_path=args.export,
+            export_format=args.export_format,
+            thread_reuse=args.thread_reuse,
+            sender_reputation=sender_reputation,
+            explain=args.explain
         )
     except KeyboardInterrupt:
         print("\nProcess interrupted by user. Exiting...")
@@ -1,3 +1,5 @@
-from .client import IMAPClient, IMAPClientError
+from .client import IMAPClient, IMAPClientError, CircuitOpenError, UIDValidityChangedError
+from .search import build_search_criteria
 
-__all__ = ["IMAPClient", "IMAPClientError"]
+__all__ = ["IMAPClient", "IMAPClientError", "CircuitOpenError", "UIDValidityChangedError",
+           "build_search_criteria"]
@@ -0,0 +1,202 @@
+import re
+import secrets
+
+# quoted strings, parentheses, a literal announcement ending a chunk, atoms
+TOKEN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|\{\d+\}$|[^\s()"]+')
+
+# headers describing the original body, replaced in a pruned email
+BODY_HEADERS = (b"content-type", b"content-transfer-encoding", b"mime-version")
+
+
+class BodyPart:
+    """One leaf part of a BODYSTRUCTURE, addressed by its section number."""
+
+    __slots__ = ("section", "content_type", "params", "encoding", "size",
+                 "disposition", "filename")
+
+    def __init__(self, section, content_type, params, encoding, size,
+                 disposition=None, filename=None):
+        self.section = section
+        self.content_type = content_type
+        self.params = params
+        self.encoding = encoding
+        # encoded size on the server
+        self.size = size
+        self.disposition = disposition
+        self.filename = filename
+
+    @property
+    def is_attachment(self):
+        """Same rule as the parser: an attachment disposition with a filename."""
+        return self.disposition == "attachment" and bool(self.filename)
+
+    @property
+    def decoded_size(self):
+        """Approximate size of the decoded content."""
+        if self.encoding == "base64":
+            return self.size * 3 // 4
+        return self.size
+
+    def __repr__(self):
+        return f"BodyPart({self.section!r}, {self.content_type!r}, size={self.size})"
+
+
+def parse_bodystructure(data):
+    """
+    Leaf parts of the BODYSTRUCTURE in an imaplib FETCH response, or [] for
+    a single-part email (which cannot carry attachments).
+    """
+    items = _parse(_tokenize(data))
+    response = next((item for item in items if isinstance(item, list)), [])
+    for key, value in zip(response[::2], response[1::2]):
+        if isinstance(key, str) and key.upper() == "BODYSTRUCTURE":
+            if not value or not isinstance(value[0], list):
+                return []
+            return list(_walk(value, ""))
+    raise ValueError("No BODYSTRUCTURE in the FETCH response")
+
+
+def _tokenize(data):
+    tokens = []
+    for chunk in data:
+        literal = None
+        if isinstance(chunk, tuple):
+            chunk, literal = chunk
+        for match in TOKEN.finditer(chunk):
+            token = match.group()
+            if token.startswith(b"{"):
+                continue
+            if token.startswith(b'"'):
+                tokens.append(("string", re.sub(rb"\\(.)", rb"\1", token[1:-1]).decode(errors="replace")))
+            elif token in (b"(", b")"):
+                tokens.append((token.decode(), None))
+            else:
+                atom = token.decode(errors="replace")
+                tokens.append(("string", None if atom.upper() == "NIL" else atom))
+        if literal is not None:
+            tokens.append(("string", literal.decode(errors="replace")))
+    return tokens
+
+
+def _parse(tokens):
+    stack = [[]]
+    for kind, value in tokens:
+        if kind == "(":
+            stack.append([])
+        elif kind == ")" and len(stack) > 1:
+            nested = stack.pop()
+            stack[-1].append(nested)
+        elif kind == "string":
+            stack[-1].append(value)
+    return stack[0]
+
+
+def _walk(body, prefix):
+    """Yield the leaf parts of a multipart body, numbered like IMAP sections."""
+    # the children come first, then the subtype and the extension data
+    for number, child in enumerate(body, 1):
+        if not isinstance(child, list):
+            return
+        section = f"{prefix}{number}"
+        if child and isinstance(child[0], list):
+            yield from _walk(child, section + ".")
+        else:
+            yield _leaf(child, section)
+
+
+def _leaf(fields, section):
+    fields = fields + [None] * 12
+    main_type = (fields[0] or "").lower()
+    subtype = (fields[1] or "").lower()
+    params = _params(fields[2])
+    # the extension data follows the type-specific fields
+    if main_type == "text":
+        extension = 8
+    elif (main_type, subtype) == ("message", "rfc822"):
+        extension = 10
+    else:
+        extension = 7
+    disposition = fields[extension + 1]
+    disposition_type = None
+    filename = None
+    if isinstance(disposition, list) and disposition:
+        disposition_type = (disposition[0] or "").lower()
+        disposition_params = _params(disposition[1] if len(disposition) > 1 else None)
+        filename = _filename(disposition_params)
+    filename = filename or _filename(params)
+    try:
+        size = int(fields[6] or 0)
+    except ValueError:
+        size = 0
+    return BodyPart(
+        section,
+        f"{main_type}/{subtype}",
+        params,
+        (fields[5] or "").lower(),
+        size,
+        disposition_type,
+        filename,
+    )
+
+
+def _params(values):
+    if not isinstance(values, list):
+        return {}
+    return {
+        str(name).lower(): value
+        for name, value in zip(values[::2], values[1::2])
+        if name is not None and not isinstance(value, list)
+    }
+
+
+def _filename(params):
+    """Filename parameter, decoded from RFC 2231 or RFC 2047 if needed."""
+    from email.header import decode_header, make_header
+    from urllib.parse import unquote_to_bytes
+
+    if params.get("filename*"):
+        # charset'language'percent-encoded value
+        charset, _, value = params["filename*"].rpartition("'")
+        charset = charset.split("'")[0] or "utf-8"
+        try:
+            return unquote_to_bytes(value).decode(charset, errors="replace")
+        except LookupError:
+            return unquote_to_bytes(value).decode("utf-8", errors="replace")
+    value = params.get("filename") or params.get("name")
+    if value and "=?" in value:
+        try:
+            return str(make_header(decode_header(value)))
+        except Exception:
+            return value
+    return value
+
+
+def build_pruned_message(header, parts):
+    """
+    Rebuild an email from its header and some of its parts.
+    :param header: BODY[HEADER] of the email
+    :param parts: [(BODY[n.MIME], BODY[n]), ...] of the parts kept
+    :return: Raw multipart/mixed email holding the kept parts only
+    """
+    boundary = f"=_pruned_{secrets.token_hex(12)}".encode()
+    lines = []
+    skipping = False
+    for line in header.rstrip(b"\r\n").split(b"\r\n"):
+        if line[:1] in (b" ", b"\t"):
+            # folded continuation of the previous header
+            if not skipping:
+                lines.append(line)
+            continue
+        skipping = line.split(b":", 1)[0].strip().lower() in BODY_HEADERS
+        if not skipping:
+            lines.append(line)
+    lines.append(b"MIME-Version: 1.0")
+    lines.append(b'Content-Type: multipart/mixed; boundary="' + boundary + b'"')
+
+    message = [b"\r\n".join(lines), b"\r\n\r\n"]
+    for mime_header, body in parts:
+        if not mime_header.endswith(b"\r\n\r\n"):
+            mime_header = mime_header.rstrip(b"\r\n") + b"\r\n\r\n"
+        message += [b"--", boundary, b"\r\n", mime_header, body, b"\r\n"]
+    message += [b"--", boundary, b"--\r\n"]
+    return b"".join(message)
@@ -1,9 +1,9 @@
-import imaplib
 import logging
 import os
-from dotenv import load_dotenv
+import threading
+import time
 
-load_dotenv()
+from utils import backoff_delay, CircuitBreaker, load_env, metrics
 
 
 class IMAPClientError(Exception):
@@ -12,13 +12,65 @@ class IMAPClientError(Exception):
     pass
 
 
+class CircuitOpenError(IMAPClientError):
+    """The server failed too often, calls are refused until the circuit resets."""
+
+    pass
+
+
+class UIDValidityChangedError(IMAPClientError):
+    """The mailbox UIDVALIDITY changed on a reselection, the UIDs already listed are stale."""
+
+    pass
+
+
 class IMAPClient:
-    def __init__(self):
-        self.server = os.getenv("IMAP_SERVER")
-        self.port = int(os.getenv("IMAP_PORT", 993))
-        self.email = os.getenv("EMAIL_ADDRESS")
-        self.password = os.getenv("EMAIL_PASSWORD")
+    def __init__(self, server=None, port=None, email=None, password=None, use_uid=False,
+                 use_ssl=True, connect_timeout=None, read_timeout=None, max_retries=None,
+                 retry_delay=1.0, max_retry_delay=30, keepalive_interval=None, breaker=None,
+                 compress=None):
+        # explicit settings (multi-account config) take precedence over the environment
+        load_env()
+        self.server = server or os.getenv("IMAP_SERVER")
+        self.port = int(port or os.getenv("IMAP_PORT", 993))
+        self.email = email or os.getenv("EMAIL_ADDRESS")
+        self.password = password or os.getenv("EMAIL_PASSWORD")
+        self.use_ssl = use_ssl
         self.conn = None
+        # UIDs stay valid across sessions, sequence numbers do not
+        self.use_uid = use_uid
+        self.uidvalidity = None
+        self.mailbox = None
+
+        # Extensions, used only when the server advertises them
+        if compress is None:
+            compress = os.getenv("IMAP_COMPRESS", "1") not in ("0", "false", "no")
+        self.compress = compress
+        self.capabilities = frozenset()
+        self.compressed = False
+        # CONDSTORE (RFC 7162): mod-sequence of the selected mailbox
+        self.condstore = False
+        self.highestmodseq = None
+
+        # Resilience: a hung server times out, a dropped connection is
+        # reopened a bounded number of times, a failing server trips the breaker
+        self.connect_timeout = float(connect_timeout or os.getenv("IMAP_CONNECT_TIMEOUT", 30))
+        self.read_timeout = float(read_timeout or os.getenv("IMAP_READ_TIMEOUT", 120))
+        if max_retries is None:
+            max_retries = os.getenv("IMAP_MAX_RETRIES", 3)
+        self.max_retries = int(max_retries)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        if keepalive_interval is None:
+            keepalive_interval = os.getenv("IMAP_KEEPALIVE", 300)
+        self.keepalive_interval = float(keepalive_interval)
+        # shared by the connections of one account (see scheduler.ConnectionPool)
+        self.breaker = breaker or CircuitBreaker()
+
+        # one command at a time on the connection, the keepalive thread included
+        self._lock = threading.RLock()
+        self._last_activity = time.monotonic()
+        self._keepalive_stop = None
 
         if not all([self.server, self.email, self.password]):
             raise IMAPClientError("Configuration IMAP incomplète")
@@ -26,57 +78,193 @@ class IMAPClient:
     # Connexion
 
     def connect(self):
+        self._check_breaker()
+        self._open()
+
+    def _open(self):
+        # imaplib pulls in ssl, only import it when a connection is actually made
+        import imaplib
+
         try:
             logging.info("Connecting to IMAP server...")
-            self.conn = imaplib.IMAP4_SSL(self.server, self.port)
+            if self.use_ssl:
+                self.conn = imaplib.IMAP4_SSL(self.server, self.port, timeout=self.connect_timeout)
+            else:
+                self.conn = imaplib.IMAP4(self.server, self.port, timeout=self.connect_timeout)
+            self._set_read_timeout()
             self.conn.login(self.email, self.password)
             logging.info("IMAP connection established")
+            self._negotiate_extensions()
+        except imaplib.IMAP4.abort as e:
+            self._connection_failed()
+            raise IMAPClientError(f"IMAP connection failed: {e}") from e
         except imaplib.IMAP4.error as e:
             logging.error("IMAP authentication failed", exc_info=True)
             raise IMAPClientError("IMAP authentication failed") from e
+        except OSError as e:
+            self._connection_failed()
+            raise IMAPClientError(f"IMAP connection failed: {e}") from e
+
+        self.breaker.record_success()
+        self._touch()
+        self._start_keepalive()
 
     def logout(self):
+        self._stop_keepalive()
         if self.conn:
             logging.info("Logging out from IMAP")
-            self.conn.logout()
-            self.conn = None
+            with self._lock:
+                self.conn.logout()
+                self.conn = None
 
     # Mailbox
 
     def select_mailbox(self, mailbox="INBOX"):
-        self._ensure_connection()
-        status, _ = self.conn.select(mailbox)
+        status, _ = self._command("select", mailbox)
         if status != "OK":
             raise IMAPClientError(f"Cannot select mailbox: {mailbox}")
+        # reselected after a reconnection
+        self.mailbox = mailbox
+        self._read_selection()
+
+    def _read_selection(self):
+        """Read UIDVALIDITY and HIGHESTMODSEQ from the last SELECT response."""
+        if self.use_uid:
+            _, data = self.conn.response("UIDVALIDITY")
+            self.uidvalidity = data[0].decode() if data and data[0] else None
+        self.highestmodseq = None
+        if self.condstore:
+            # absent when the mailbox does not keep mod-sequences (NOMODSEQ)
+            _, data = self.conn.response("HIGHESTMODSEQ")
+            self.highestmodseq = int(data[0]) if data and data[0] else None
 
     # Search
 
-    def search(self, criteria="ALL"):
-        self._ensure_connection()
-        status, messages = self.conn.search(None, criteria)
+    def search(self, criteria="ALL", changed_since=None):
+        """
+        :param changed_since: Mod-sequence of a previous run, only return the
+            emails added or changed after it (ignored without CONDSTORE)
+        """
+        if changed_since is not None and self.highestmodseq is not None:
+            # MODSEQ matches values greater than or equal to the given one
+            criteria = f"MODSEQ {int(changed_since) + 1} {criteria}"
+        if self.use_uid:
+            status, messages = self._command("uid", "SEARCH", criteria)
+        else:
+            status, messages = self._command("search", None, criteria)
         if status != "OK":
             raise IMAPClientError("Search failed")
-        return messages[0].split()
+        # a MODSEQ search ends with "(MODSEQ <highest>)"
+        return messages[0].split(b"(")[0].split()
 
     # Fetch
 
     def fetch_email(self, email_id):
-        self._ensure_connection()
-        try:
-            status, data = self.conn.fetch(email_id, "(RFC822)")
-            if status != "OK":
-                raise IMAPClientError("Fetch failed")
-            return data[0][1]
-        except imaplib.IMAP4.abort:
-            logging.warning("IMAP connection aborted, reconnecting...")
-            self._reconnect()
-            return self.fetch_email(email_id)
+        if self.use_uid:
+            status, data = self._command("uid", "FETCH", email_id, "(RFC822)")
+        else:
+            status, data = self._command("fetch", email_id, "(RFC822)")
+        if status != "OK":
+            raise IMAPClientError("Fetch failed")
+        return data[0][1]
+
+    def fetch_structure(self, email_id):
+        """Leaf BodyParts of an email's BODYSTRUCTURE, without downloading it."""
+        from .bodystructure import parse_bodystructure
+
+        status, data = self._fetch(email_id, "(BODYSTRUCTURE)")
+        if status != "OK":
+            raise IMAPClientError("Fetch failed")
+        return parse_bodystructure(data)
+
+    def fetch_email_without(self, email_id, kept_parts):
+        """
+        Fetch the header and the given parts of an email only, in one command,
+        and rebuild it as a multipart/mixed email (see build_pruned_message).
+        :param kept_parts: BodyParts of the email to download
+        """
+        import re
+        from .bodystructure import build_pruned_message
+
+        items = ["BODY.PEEK[HEADER]"]
+        for part in kept_parts:
+            items += [f"BODY.PEEK[{part.section}.MIME]", f"BODY.PEEK[{part.section}]"]
+        status, data = self._fetch(email_id, f"({' '.join(items)})")
+        if status != "OK":
+            raise IMAPClientError("Fetch failed")
+
+        sections = {}
+        for chunk in data:
+            if isinstance(chunk, tuple):
+                match = re.search(rb"BODY\[([0-9.]*(?:HEADER|MIME)?)\] \{\d+\}$", chunk[0])
+                if match:
+                    sections[match.group(1).decode()] = chunk[1]
+        return build_pruned_message(
+            sections.get("HEADER", b""),
+            [
+                (sections.get(f"{part.section}.MIME", b""), sections.get(part.section, b""))
+                for part in kept_parts
+            ],
+        )
+
+    def _fetch(self, email_id, items):
+        if self.use_uid:
+            return self._command("uid", "FETCH", email_id, items)
+        return self._command("fetch", email_id, items)
 
     # Flags / actions
 
     def mark_as_read(self, email_id):
-        self._ensure_connection()
-        self.conn.store(email_id, "+FLAGS", "\\Seen")
+        if self.use_uid:
+            self._command("uid", "STORE", email_id, "+FLAGS", "\\Seen")
+        else:
+            self._command("store", email_id, "+FLAGS", "\\Seen")
+
+    def noop(self):
+        """Keep the session alive (servers drop connections idle for too long)."""
+        self._command("noop")
+
+    # Extensions
+
+    def _negotiate_extensions(self):
+        """Turn on COMPRESS=DEFLATE and CONDSTORE/QRESYNC when the server offers them."""
+        import imaplib
+
+        self.compressed = False
+        self.condstore = False
+        # servers often advertise more capabilities once logged in
+        status, data = self.conn.capability()
+        if status != "OK" or not data or not isinstance(data[-1], bytes):
+            self.capabilities = frozenset()
+            return
+        self.capabilities = frozenset(data[-1].decode().upper().split())
+        self.conn.capabilities = tuple(self.capabilities)
+
+        try:
+            if self.compress and "COMPRESS=DEFLATE" in self.capabilities:
+                self._start_compression()
+            if "ENABLE" in self.capabilities and "QRESYNC" in self.capabilities:
+                # QRESYNC implies CONDSTORE
+                self.conn.enable("QRESYNC")
+            elif "ENABLE" in self.capabilities and "CONDSTORE" in self.capabilities:
+                self.conn.enable("CONDSTORE")
+        except imaplib.IMAP4.abort:
+            raise
+        except imaplib.IMAP4.error as e:
+            logging.warning(f"IMAP extension negotiation failed, continuing without: {e}")
+        self.condstore = bool({"CONDSTORE", "QRESYNC"} & self.capabilities)
+
+    def _start_compression(self):
+        import imaplib
+        from .compression import DeflateStream
+
+        # COMPRESS (RFC 4978) is not part of imaplib's command table
+        imaplib.Commands.setdefault("COMPRESS", ("AUTH", "SELECTED"))
+        status, _ = self.conn._simple_command("COMPRESS", "DEFLATE")
+        if status == "OK":
+            DeflateStream.install(self.conn)
+            self.compressed = True
+            logging.info("IMAP compression enabled (DEFLATE)")
 
     # Internals
 
@@ -84,9 +272,124 @@ class IMAPClient:
         if not self.conn:
             raise IMAPClientError("IMAP not connected")
 
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(
+                f"IMAP server {self.server} unavailable, "
+                f"retry in {self.breaker.retry_after():.0f}s"
+            )
+
+    def _command(self, name, *args):
+        """
+        Run an imaplib command, reconnecting after a dropped or timed-out
+        connection up to max_retries times with jittered exponential backoff.
+        """
+        import imaplib
+
+        self._ensure_connection()
+        with self._lock:
+            attempt = 0
+            while True:
+                self._check_breaker()
+                try:
+                    if attempt:
+                        self._reconnect()
+                    result = getattr(self.conn, name)(*args)
+                except (imaplib.IMAP4.abort, OSError, IMAPClientError) as e:
+                    if isinstance(e, (CircuitOpenError, UIDValidityChangedError)):
+                        raise
+                    if not isinstance(e, IMAPClientError):
+                        # reconnection failures were already counted by _open()
+                        self._connection_failed()
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise IMAPClientError(
+                            f"IMAP {name} failed after {attempt} attempts: {e}"
+                        ) from e
+                    delay = backoff_delay(
+                        attempt, self.retry_delay, self.max_retry_delay, jitter=True
+                    )
+                    logging.warning(
+                        f"IMAP connection lost during {name} ({e}), "
+                        f"reconnecting in {delay:.1f}s ({attempt}/{self.max_retries})"
+                    )
+                    metrics.increment("imap.retries")
+                    time.sleep(delay)
+                    continue
+
+                self.breaker.record_success()
+                self._touch()
+                return result
+
     def _reconnect(self):
-        self.logout()
-        self.connect()
+        self._close_connection()
+        self._open()
+        if self.mailbox:
+            status, _ = self.conn.select(self.mailbox)
+            if status != "OK":
+                raise IMAPClientError(f"Cannot select mailbox: {self.mailbox}")
+            previous = self.uidvalidity
+            self._read_selection()
+            if previous and self.uidvalidity and self.uidvalidity != previous:
+                raise UIDValidityChangedError(
+                    f"UIDVALIDITY of {self.mailbox} changed from {previous} to "
+                    f"{self.uidvalidity} while reconnecting"
+                )
+
+    def _close_connection(self):
+        # the connection may already be dead, nothing to say goodbye to
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            try:
+                conn.shutdown()
+            except Exception:
+                pass
+
+    def _set_read_timeout(self):
+        sock = getattr(self.conn, "sock", None)
+        if sock is not None and hasattr(sock, "settimeout"):
+            sock.settimeout(self.read_timeout)
+
+    def _connection_failed(self):
+        metrics.increment("imap.connection_failures")
+        self.breaker.record_failure()
+
+    def _touch(self):
+        self._last_activity = time.monotonic()
+
+    # Keepalive
+
+    def _start_keepalive(self):
+        if self.keepalive_interval <= 0 or self._keepalive_stop is not None:
+            return
+        self._keepalive_stop = threading.Event()
+        thread = threading.Thread(
+            target=self._keepalive_loop,
+            args=(self._keepalive_stop,),
+            name=f"imap-keepalive-{self.email}",
+            daemon=True,
+        )
+        thread.start()
+
+    def _stop_keepalive(self):
+        if self._keepalive_stop is not None:
+            self._keepalive_stop.set()
+            self._keepalive_stop = None
+
+    def _keepalive_loop(self, stop):
+        # wake up often enough to send the NOOP close to the interval
+        while not stop.wait(self.keepalive_interval / 4):
+            if time.monotonic() - self._last_activity < self.keepalive_interval:
+                continue
+            try:
+                with self._lock:
+                    if self.conn is None or stop.is_set():
+                        continue
+                    logging.debug("Sending IMAP keepalive")
+                    self.noop()
+            except IMAPClientError as e:
+                # the next command retries or reports the failure
+                logging.warning(f"IMAP keepalive failed: {e}")
 
     # Context manager
 
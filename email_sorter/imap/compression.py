@@ -0,0 +1,69 @@
+import zlib
+
+from utils import metrics
+
+# same line limit as imaplib
+MAX_LINE = 1_000_000
+
+
+class DeflateStream:
+    """
+    COMPRESS=DEFLATE (RFC 4978) transport of an imaplib connection:
+    raw deflate in both directions, flushed after every command sent.
+    Replaces the read/readline/send methods imaplib uses for its I/O.
+    """
+
+    def __init__(self, conn):
+        # conn.file may already buffer bytes sent right after the COMPRESS answer
+        self._file = conn.file
+        self._sock = conn.sock
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._buffer = bytearray()
+
+    @classmethod
+    def install(cls, conn):
+        stream = cls(conn)
+        conn.read = stream.read
+        conn.readline = stream.readline
+        conn.send = stream.send
+        return stream
+
+    def _fill(self):
+        data = self._file.read1(65536)
+        if not data:
+            return False
+        inflated = self._decompressor.decompress(data)
+        metrics.increment("imap.compressed_bytes", len(data))
+        metrics.increment("imap.decompressed_bytes", len(inflated))
+        self._buffer += inflated
+        return True
+
+    def read(self, size):
+        while len(self._buffer) < size and self._fill():
+            pass
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self):
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end >= 0:
+                end += 1
+                break
+            start = len(self._buffer)
+            if start > MAX_LINE:
+                raise OSError(f"IMAP line longer than {MAX_LINE} bytes")
+            if not self._fill():
+                end = len(self._buffer)
+                break
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return line
+
+    def send(self, data):
+        self._sock.sendall(
+            self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        )
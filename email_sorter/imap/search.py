@@ -0,0 +1,61 @@
+from datetime import date, datetime
+
+# IMAP dates use English month names whatever the locale
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+          "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+def build_search_criteria(status="UNSEEN", since=None, before=None, sender=None,
+                          larger=None, smaller=None, headers=None):
+    """
+    Compile the filters of a run into one IMAP SEARCH expression, so the
+    server only returns the matching emails (every key must match).
+    :param since: Emails received on or after this date (date, datetime or YYYY-MM-DD)
+    :param before: Emails received strictly before this date
+    :param sender: Substring of the From header
+    :param larger: Emails larger than this many bytes
+    :param smaller: Emails smaller than this many bytes
+    :param headers: [(header name, substring of its value), ...]
+    """
+    keys = [status or "ALL"]
+    if since:
+        keys.append(f"SINCE {imap_date(since)}")
+    if before:
+        keys.append(f"BEFORE {imap_date(before)}")
+    if sender:
+        keys.append(f"FROM {quote(sender)}")
+    if larger is not None:
+        keys.append(f"LARGER {int(larger)}")
+    if smaller is not None:
+        keys.append(f"SMALLER {int(smaller)}")
+    for name, value in headers or ():
+        keys.append(f"HEADER {quote(name)} {quote(value)}")
+    return " ".join(keys)
+
+
+def imap_date(value):
+    """Format a date as an IMAP date-text (03-Jun-2024)."""
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    if isinstance(value, datetime):
+        value = value.date()
+    return f"{value.day:02d}-{MONTHS[value.month - 1]}-{value.year}"
+
+
+def quote(value):
+    """IMAP quoted string. imaplib sends commands as ASCII, so must the value be."""
+    return '"' + search_value(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def search_value(text):
+    """Check a search value can be sent as a quoted string (single-line ASCII)."""
+    if not text.isascii() or "\r" in text or "\n" in text:
+        raise ValueError(f"Search value must be single-line ASCII: {text!r}")
+    return text
+
+
+def parse_header_filter(text):
+    """Parse a NAME:VALUE header filter into (name, value)."""
+    name, separator, value = text.partition(":")
+    if not separator or not name.strip():
+        raise ValueError(f"Header filter must look like NAME:VALUE, got {text!r}")
+    return search_value(name.strip()), search_value(value.strip())
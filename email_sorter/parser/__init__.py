@@ -1,4 +1,16 @@
 from .email_parser import EmailParser
 from .classification import EmailClassifier
+from .domains import DomainMatcher
+from .statistical import NaiveBayesClassifier
+from .reputation import SenderReputation
+from .records import ParsedEmail, ClassificationResult
 
-__all__ = ["EmailParser", "EmailClassifier"]
+__all__ = [
+    "EmailParser",
+    "EmailClassifier",
+    "DomainMatcher",
+    "NaiveBayesClassifier",
+    "SenderReputation",
+    "ParsedEmail",
+    "ClassificationResult",
+]
@@ -1,17 +1,35 @@
 import os
 import re
 from collections import defaultdict
-from dotenv import load_dotenv
 
-load_dotenv()
+from utils import head_tail, load_env, metrics
+from .domains import DomainMatcher
+from .language import detect_language
+from .records import ClassificationResult
+from .text import strip_quoted_reply
+
+# language modes besides a ruleset name: detect it per email, or score every ruleset
+AUTO = "auto"
+BOTH = "both"
+# window of max_body_chars * slack chars in which quoted replies are stripped
+BODY_WINDOW_SLACK = 2
 
 
 class EmailClassifier:
-    def __init__(self, language="en"):
-        # Default to a generic placeholder if the .env key is missing
-        self.internal_domain = os.getenv("INTERNAL_DOMAIN", "@mycompany.com").lower()
-        # default to english
+    def __init__(self, language="en", max_body_chars=None, explain=False):
+        load_env()
+        # Default to a generic placeholder if the .env key is missing; a list of
+        # domains and "*.subsidiary.com" wildcards, see DomainMatcher
+        self.internal_domains = DomainMatcher.parse(
+            os.getenv("INTERNAL_DOMAIN", "@mycompany.com")
+        )
+        # default to english; "auto" picks the ruleset of each email's language,
+        # "both" scores every ruleset together
         self.language = language.lower()
+        # only a head-and-tail window of longer bodies is scanned (None = whole body)
+        self.max_body_chars = max_body_chars
+        # record the matched keywords and their positions in the results
+        self.explain = explain
 
         self._all_rules = {
             "en": {
@@ -191,34 +209,93 @@ class EmailClassifier:
                 ],
             },
         }
+        # language -> [(category, compiled keyword pattern), ...], built on first use
+        self._compiled = {}
 
     def classify_email(self, email_data):
+        return self.classify(email_data).category
+
+    def is_internal(self, sender):
+        """True if the sender address belongs to one of the internal domains."""
+        return self.internal_domains.matches(sender.lower())
+
+    def classify(self, email_data):
+        """
+        Classify an email and return a ClassificationResult with the rule scores,
+        and the keyword matches when explaining.
+        """
         subject = email_data.get("subject", "").lower()
-        body = email_data.get("body", "").lower()
+        body = self._prepare_body(email_data.get("body", ""))
         sender = email_data.get("sender", "").lower()
 
         # if it is eg from the company user is currently employed at, treat as Internal
-        if self.internal_domain in sender:
-            return "Internal"
+        if self.is_internal(sender):
+            return ClassificationResult("Internal")
 
-        # select ruleset
-        rules = self._all_rules.get(self.language, self._all_rules["en"])
         scores = defaultdict(int)
-
-        for category, keywords in rules.items():
-            for k in keywords:
-                # \b ensures "off" does not match eg "coffee"
-                pattern = r"\b" + re.escape(k) + r"\b"
-
+        matches = [] if self.explain else None
+        for language in self._languages(subject, body):
+            for category, keyword, pattern in self._rules(language):
                 # check subject (high weight)
-                if re.search(pattern, subject, re.IGNORECASE):
+                match = pattern.search(subject)
+                if match:
                     scores[category] += 3
+                    if matches is not None:
+                        matches.append((category, keyword, "subject", match.start()))
 
                 # check body (low weight)
-                if re.search(pattern, body, re.IGNORECASE):
+                match = pattern.search(body)
+                if match:
                     scores[category] += 1
+                    if matches is not None:
+                        matches.append((category, keyword, "body", match.start()))
 
         if not scores:
-            return "General"
+            return ClassificationResult("General", matches=matches)
+
+        return ClassificationResult(
+            max(scores, key=scores.get), scores=dict(scores), matches=matches
+        )
+
+    def keywords(self, languages=None):
+        """Yield (language, category, keyword) of the rulesets, all languages by default."""
+        for language in languages or self._all_rules:
+            for category, keywords in self._all_rules[language].items():
+                for keyword in keywords:
+                    yield language, category, keyword
+
+    def _languages(self, subject, body):
+        """Rulesets to score an email with."""
+        if self.language == BOTH:
+            return list(self._all_rules)
+        if self.language == AUTO:
+            language = detect_language(subject, body)
+            metrics.increment(f"classifier.language.{language}")
+            return [language]
+        return [self.language if self.language in self._all_rules else "en"]
+
+    def _rules(self, language):
+        compiled = self._compiled.get(language)
+        if compiled is None:
+            # \b ensures "off" does not match eg "coffee"
+            compiled = self._compiled[language] = [
+                (category, k, re.compile(r"\b" + re.escape(k) + r"\b", re.IGNORECASE))
+                for category, keywords in self._all_rules[language].items()
+                for k in keywords
+            ]
+        return compiled
 
-        return max(scores, key=scores.get)
+    def _prepare_body(self, body):
+        """Bound the scanned length, then strip quoted replies and signature."""
+        body = body or ""
+        limit = self.max_body_chars
+        truncated = False
+        if limit is not None:
+            # strip in a window with slack for the quoted text removed from it,
+            # so a multi-MB body costs O(limit), not O(len(body))
+            body, truncated = head_tail(body, limit * BODY_WINDOW_SLACK)
+        body = strip_quoted_reply(body)
+        body, cut = head_tail(body, limit)
+        if truncated or cut:
+            metrics.increment("classifier.body_truncated")
+        return body.lower()
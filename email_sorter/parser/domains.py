@@ -0,0 +1,57 @@
+from .text import sender_address
+
+EXACT = 1
+SUBDOMAINS = 2
+
+
+class DomainMatcher:
+    """
+    Set of domains an address can belong to.
+    Patterns are domains ("mycompany.com", the leading "@" is optional) or
+    wildcards covering every subdomain ("*.mycompany.com", not the domain
+    itself). They are kept in one dict keyed by domain, so matching an
+    address costs one probe per label of its domain, whatever the number
+    of patterns.
+    """
+
+    def __init__(self, patterns=()):
+        self._domains = {}  # domain -> EXACT | SUBDOMAINS bits
+        for pattern in patterns:
+            self.add(pattern)
+
+    @classmethod
+    def parse(cls, value):
+        """Matcher of a comma- or space-separated pattern list (INTERNAL_DOMAIN, --domain)."""
+        return cls(value.replace(",", " ").split() if value else ())
+
+    def add(self, pattern):
+        pattern = pattern.strip().lower().lstrip("@").rstrip(".")
+        kind = EXACT
+        if pattern.startswith("*."):
+            pattern = pattern[2:]
+            kind = SUBDOMAINS
+        if pattern:
+            self._domains[pattern] = self._domains.get(pattern, 0) | kind
+
+    def matches_domain(self, domain):
+        domain = domain.lower().rstrip(".")
+        if self._domains.get(domain, 0) & EXACT:
+            return True
+        # parent domains: "a.b.mycompany.com" -> "b.mycompany.com" -> "mycompany.com" -> "com"
+        dot = domain.find(".")
+        while dot >= 0:
+            domain = domain[dot + 1:]
+            if self._domains.get(domain, 0) & SUBDOMAINS:
+                return True
+            dot = domain.find(".")
+        return False
+
+    def matches(self, sender):
+        """Whether the address of a From value ("Bob <bob@x.com>") is in one of the domains."""
+        if not self._domains:
+            return False
+        local, at, domain = sender_address(sender).rpartition("@")
+        return bool(at and local and domain) and self.matches_domain(domain)
+
+    def __len__(self):
+        return len(self._domains)
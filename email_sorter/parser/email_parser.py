@@ -1,22 +1,68 @@
-import email
-from email import policy
-from email.header import decode_header, make_header
+import codecs
+import functools
+import re
+import sys
+
+from utils import head_tail, metrics
+from .fastpath import scan_email
+from .records import ParsedEmail
+from .text import html_to_text
+
+# one "<left@right>" message id of a Message-ID, In-Reply-To or References header
+MESSAGE_ID = re.compile(r"<[^<>\s]+>")
 
 
 class EmailParser:
-    def __init__(self, email_policy=policy.default):
+    def __init__(self, email_policy=None, max_part_bytes=None, fast=True):
+        # None means email.policy.default, resolved on first parse
         self.policy = email_policy
+        # text parts larger than this are cut to a head-and-tail window before decoding
+        self.max_part_bytes = max_part_bytes
+        # scan common emails without the email package (default policy only),
+        # see parser.fastpath
+        self.fast = fast and email_policy is None
 
-    def parse_email(self, raw_bytes: bytes) -> dict:
+    def parse_email(self, raw_bytes: bytes) -> ParsedEmail:
         """
-        Takes raw email bytes and returns a clean dictionary.
+        Takes raw email bytes and returns a clean ParsedEmail (a read-only mapping).
         Treating the email as an object rather than just a string.
         """
+        if self.fast:
+            scan = scan_email(raw_bytes)
+            if scan is not None:
+                metrics.increment("parser.fast_path")
+                return self._from_scan(scan)
+            metrics.increment("parser.full_parse")
+        return self._parse_full(raw_bytes)
+
+    def _from_scan(self, scan):
+        text_parts = [self._decode_payload(payload, charset) for payload, charset in scan.text_parts]
+        html_parts = [self._decode_payload(payload, charset) for payload, charset in scan.html_parts]
+        return ParsedEmail(
+            subject=scan.subject,
+            sender=sys.intern(scan.sender),
+            date=scan.date,
+            body="\n".join(text_parts).strip() or html_to_text("\n".join(html_parts)),
+            attachments=scan.attachments,
+            **_thread_fields(scan.message_id, scan.in_reply_to, scan.references),
+        )
+
+    def _parse_full(self, raw_bytes):
+        """Parse with the email package, for the emails the fast path leaves out."""
+        import email
+        from email import policy
+
+        if self.policy is None:
+            self.policy = policy.default
         msg = email.message_from_bytes(raw_bytes, policy=self.policy)
 
         subject = self._decode_str(msg.get("Subject"))
-        sender = self._decode_str(msg.get("From"))
+        # the same senders come back constantly, share one string per sender
+        sender = sys.intern(self._decode_str(msg.get("From")))
         date = msg.get("Date")
+        thread_fields = _thread_fields(
+            *(self._header_str(msg, name) for name in ("Message-ID", "In-Reply-To", "References"))
+        )
 
         text_parts = []
         html_parts = []
@@ -56,15 +102,26 @@ class EmailParser:
             elif content_type == "text/html":
                 html_parts.append(self._get_decoded_payload(msg))
 
-        body = "\n".join(text_parts).strip() or "\n".join(html_parts).strip()
+        # HTML-only emails: keep the readable text, not the markup, CSS and inline images
+        body = "\n".join(text_parts).strip() or html_to_text("\n".join(html_parts))
 
-        return {
-            "subject": subject,
-            "sender": sender,
-            "date": date,
-            "body": body,
-            "attachments": attachments,
-        }
+        return ParsedEmail(
+            subject=subject,
+            sender=sender,
+            date=date,
+            body=body,
+            attachments=attachments,
+            **thread_fields,
+        )
+
+    @staticmethod
+    def _header_str(msg, name):
+        """Header value as a string, "" when missing or unparsable."""
+        try:
+            value = msg.get(name)
+        except Exception:
+            return ""
+        return str(value) if value is not None else ""
 
     def _decode_str(self, value):
         """
@@ -74,19 +131,59 @@ class EmailParser:
         """
         if not value:
             return ""
-        return str(make_header(decode_header(value)))
+        value = str(value)
+        if "=?" not in value:
+            # no encoded word: decode_header would return the value unchanged
+            return value
+        return _decode_encoded_words(value)
 
     def _get_decoded_payload(self, part):
         """
         Decode the raw binary payload of an email part into a Python string
         """
-        payload = part.get_payload(decode=True)
+        return self._decode_payload(part.get_payload(decode=True), part.get_content_charset())
+
+    def _decode_payload(self, payload, charset):
         if not payload:
             return ""
 
-        charset = part.get_content_charset() or "utf-8"
-        try:
-            return payload.decode(charset, errors="ignore")
-        except LookupError:
-            # unknown charset
-            return payload.decode("utf-8", errors="ignore")
+        payload, truncated = head_tail(payload, self.max_part_bytes)
+        if truncated:
+            metrics.increment("parser.part_truncated")
+
+        codec = _codec(charset or "utf-8")
+        if codec in ("utf-8", "ascii") and payload.isascii():
+            return payload.decode("ascii")
+        return payload.decode(codec, errors="ignore")
+
+
+def _thread_fields(message_id, in_reply_to, references):
+    """message_id, in_reply_to and references of a ParsedEmail, from the header values."""
+    message_ids = MESSAGE_ID.findall(message_id or "")
+    parents = MESSAGE_ID.findall(in_reply_to or "")
+    return {
+        "message_id": sys.intern(message_ids[0]) if message_ids else "",
+        "in_reply_to": sys.intern(parents[0]) if parents else "",
+        "references": [sys.intern(ref) for ref in MESSAGE_ID.findall(references or "")],
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def _decode_encoded_words(value):
+    """RFC 2047 decoding, cached: the same sender names and subjects come back constantly."""
+    from email.header import decode_header, make_header
+
+    return str(make_header(decode_header(value)))
+
+
+@functools.lru_cache(maxsize=256)
+def _codec(charset):
+    """Canonical codec of a charset label, utf-8 for unknown charsets."""
+    try:
+        info = codecs.lookup(charset)
+    except LookupError:
+        return "utf-8"
+    # bytes.decode refuses the codecs that are not text encodings (base64, rot13...)
+    if not getattr(info, "_is_text_encoding", True):
+        return "utf-8"
+    return info.name
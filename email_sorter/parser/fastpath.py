@@ -0,0 +1,296 @@
+"""
+Fast path of EmailParser: reads Subject, From, Date and the text parts
+straight from the raw bytes with bytes.find, without building the
+email.message object tree.
+
+It only accepts the common, well-formed shapes whose result is known to
+match the email package (ASCII headers without encoded words, plain
+addresses, simple MIME parameters, a few levels of multipart) and returns
+None for anything else, so the caller falls back to the full parser.
+"""
+import base64
+import binascii
+import re
+
+# nested multiparts deeper than this go to the full parser
+MAX_DEPTH = 4
+
+HEADER_NAME = re.compile(rb"[\x21-\x39\x3b-\x7e]+:")
+TOKEN = r"[A-Za-z0-9!#$%&'+\-.^_`{|}~]+"
+CONTENT_TYPE = re.compile(rf"({TOKEN})/({TOKEN})")
+DISPOSITION = re.compile(TOKEN)
+PARAM = re.compile(rf'\s*({TOKEN})\s*=\s*(?:"([^"\\;]*)"|({TOKEN}))\s*')
+# From values the email package renders back unchanged: an address,
+# optionally after a display name of plain words
+ATEXT = r"[A-Za-z0-9!#$%&'*+\-/=?^_`{|}~]+"
+ADDRESS = rf"{ATEXT}(?:\.{ATEXT})*@[A-Za-z0-9\-]+(?:\.[A-Za-z0-9\-]+)*"
+PLAIN_FROM = re.compile(rf"(?:{ATEXT}(?: {ATEXT})* <{ADDRESS}>|{ADDRESS})")
+SIMPLE_ENCODINGS = ("", "7bit", "8bit", "binary")
+UUENCODE = ("x-uuencode", "uuencode", "uue", "x-uue")
+
+
+class FastScan:
+    """What the fast path extracted from a raw email."""
+
+    __slots__ = ("subject", "sender", "date", "message_id", "in_reply_to", "references",
+                 "text_parts", "html_parts", "attachments")
+
+    def __init__(self, subject, sender, date, message_id="", in_reply_to="", references=""):
+        self.subject = subject
+        self.sender = sender
+        self.date = date
+        # raw values of the threading headers
+        self.message_id = message_id
+        self.in_reply_to = in_reply_to
+        self.references = references
+        # (payload bytes, charset or None) of the text/plain and text/html parts
+        self.text_parts = []
+        self.html_parts = []
+        self.attachments = []
+
+
+def scan_email(raw):
+    """
+    :return: FastScan of a raw email, or None when it needs the full parser
+    """
+    # bare CR line endings and mbox "From " lines are split differently by email
+    if raw.startswith(b"From ") or raw.count(b"\r") != raw.count(b"\r\n"):
+        return None
+
+    parsed = _parse_headers(raw, 0, len(raw))
+    if parsed is None:
+        return None
+    headers, body_start = parsed
+
+    subject = headers.get("subject")
+    sender = headers.get("from")
+    date = headers.get("date")
+    if subject is not None and "=?" in subject:
+        return None
+    if sender is not None and ("=?" in sender or not PLAIN_FROM.fullmatch(sender)):
+        return None
+    if date is not None:
+        date = _format_date(date)
+    thread_headers = [headers.get(name) or "" for name in ("message-id", "in-reply-to", "references")]
+    # encoded words and unclosed "<id" are repaired by the email package
+    if any("=?" in value or value.count("<") != value.count(">") for value in thread_headers):
+        return None
+
+    scan = FastScan(subject or "", sender or "", date, *thread_headers)
+    if not _scan_entity(raw, headers, body_start, len(raw), scan, 0, top=True):
+        return None
+    return scan
+
+
+def _parse_headers(raw, start, end):
+    """
+    Header block of the entity raw[start:end].
+    :return: ({lowercase name: unfolded value of its first occurrence}, body offset),
+        or None if the block is not plain ASCII "Name: value" lines
+    """
+    headers = {}
+    name = None
+    value = None
+    position = start
+    while True:
+        if position >= end:
+            # headers up to the end, no body
+            body_start = end
+            break
+        newline = raw.find(b"\n", position, end)
+        if newline < 0:
+            line_end = content_end = end
+        else:
+            line_end = newline + 1
+            content_end = newline - 1 if raw[newline - 1:newline] == b"\r" else newline
+        if content_end <= position:
+            # blank line between the headers and the body
+            body_start = line_end
+            break
+
+        line = raw[position:content_end]
+        if not line.isascii():
+            return None
+        if line[:1] in (b" ", b"\t"):
+            if name is None:
+                return None
+            value.append(line.decode())
+        else:
+            match = HEADER_NAME.match(line)
+            if not match:
+                return None
+            if name is not None and name not in headers:
+                headers[name] = "".join(value)
+            name = line[:match.end() - 1].decode().lower()
+            value = [line[match.end():].decode().lstrip(" \t")]
+        position = line_end
+
+    if name is not None and name not in headers:
+        headers[name] = "".join(value)
+    return headers, body_start
+
+
+def _format_date(value):
+    """Date header as the email package renders it (normalized, or as is if invalid)."""
+    from email.utils import format_datetime, parsedate_to_datetime
+
+    try:
+        return format_datetime(parsedate_to_datetime(value))
+    except (TypeError, ValueError):
+        return value
+
+
+def _params(value):
+    """
+    (lowercase first token, {name: value}) of a Content-Type or
+    Content-Disposition value, or None for anything but simple parameters.
+    """
+    head, _, rest = value.partition(";")
+    params = {}
+    while rest:
+        piece, _, rest = rest.partition(";")
+        if not piece.strip() and not rest:
+            break
+        match = PARAM.fullmatch(piece)
+        if not match or "*" in match.group(1):
+            return None
+        name = match.group(1).lower()
+        if name not in params:
+            params[name] = match.group(2) if match.group(2) is not None else match.group(3)
+    return head.strip(), params
+
+
+def _scan_entity(raw, headers, start, end, scan, depth, top=False):
+    """Collect the text parts and attachments of the entity whose body is raw[start:end]."""
+    content_type = headers.get("content-type")
+    params = {}
+    if content_type is None:
+        main_type, subtype = "text", "plain"
+    else:
+        parsed = _params(content_type)
+        if parsed is None:
+            return False
+        head, params = parsed
+        match = CONTENT_TYPE.fullmatch(head)
+        if not match:
+            return False
+        main_type, subtype = match.group(1).lower(), match.group(2).lower()
+
+    if main_type == "multipart":
+        boundary = params.get("boundary")
+        if not boundary or subtype == "digest" or depth >= MAX_DEPTH:
+            return False
+        parts = _split_multipart(raw, start, end, boundary.rstrip().encode())
+        if parts is None:
+            return False
+        for part_start, part_end in parts:
+            parsed = _parse_headers(raw, part_start, part_end)
+            if parsed is None:
+                return False
+            part_headers, body_start = parsed
+            if not _scan_entity(raw, part_headers, body_start, part_end, scan, depth + 1):
+                return False
+        return True
+
+    if main_type == "message":
+        return False
+
+    disposition = None
+    disposition_params = {}
+    if "content-disposition" in headers:
+        parsed = _params(headers["content-disposition"])
+        if parsed is None or not DISPOSITION.fullmatch(parsed[0]):
+            return False
+        disposition = parsed[0].lower()
+        disposition_params = parsed[1]
+
+    if not top and disposition == "attachment":
+        filename = disposition_params.get("filename", params.get("name"))
+        if filename is not None:
+            if "=?" in filename:
+                return False
+            filename = filename.strip()
+            if filename:
+                scan.attachments.append(filename)
+        return True
+
+    if subtype not in ("plain", "html") or main_type != "text":
+        return True
+    payload = _decode_transfer(raw[start:end], headers.get("content-transfer-encoding", ""))
+    if payload is None:
+        return False
+    charset = params.get("charset")
+    (scan.text_parts if subtype == "plain" else scan.html_parts).append(
+        (payload, charset.lower() if charset is not None else None)
+    )
+    return True
+
+
+def _split_multipart(raw, start, end, boundary):
+    """
+    (start, end) offsets of the parts of a multipart body, cut at the
+    "--boundary" lines like the email package does; None if there is no
+    opening or closing delimiter.
+    """
+    separator = b"--" + boundary
+    parts = []
+    part_start = None
+    position = start
+    while True:
+        found = raw.find(separator, position, end)
+        if found < 0:
+            # no closing delimiter
+            return None
+        position = found + 1
+        if found != start and raw[found - 1:found] != b"\n":
+            continue
+        cursor = found + len(separator)
+        closing = raw.startswith(b"--", cursor, end)
+        if closing:
+            cursor += 2
+        while cursor < end and raw[cursor:cursor + 1] in (b" ", b"\t"):
+            cursor += 1
+        if raw.startswith(b"\r\n", cursor, end):
+            cursor += 2
+        elif raw.startswith(b"\n", cursor, end):
+            cursor += 1
+        elif cursor != end:
+            # "--boundary" followed by other text is not a delimiter
+            continue
+
+        if part_start is not None:
+            # the line break before a delimiter belongs to the delimiter
+            part_end = found
+            if raw[part_end - 2:part_end] == b"\r\n" and part_end - 2 >= part_start:
+                part_end -= 2
+            elif raw[part_end - 1:part_end] == b"\n" and part_end - 1 >= part_start:
+                part_end -= 1
+            parts.append((part_start, part_end))
+        elif closing:
+            return None
+
+        if closing:
+            return parts
+        part_start = cursor
+        position = cursor
+
+
+def _decode_transfer(payload, encoding):
+    """Content-Transfer-Encoding decoding, None when the full parser must do it."""
+    encoding = encoding.lower()
+    if encoding in SIMPLE_ENCODINGS:
+        return payload
+    if encoding == "quoted-printable":
+        return binascii.a2b_qp(payload)
+    if encoding == "base64":
+        data = b"".join(payload.splitlines())
+        if len(data) % 4:
+            return None
+        try:
+            return base64.b64decode(data, validate=True)
+        except binascii.Error:
+            return None
+    if encoding in UUENCODE:
+        return None
+    # other encodings are returned undecoded by email
+    return payload
@@ -0,0 +1,47 @@
+import re
+from html.parser import HTMLParser
+
+HORIZONTAL_SPACE = re.compile(r"[ \t\r\f\v\xa0]+")
+BLANK_LINES = re.compile(r"\s*\n\s*")
+
+
+class HTMLTextExtractor(HTMLParser):
+    """
+    Single-pass HTML to plain text conversion.
+    Drops <style>/<script> content and comments, keeps line breaks for block elements.
+    """
+
+    SKIPPED_TAGS = {"style", "script", "noscript", "template"}
+    BLOCK_TAGS = {
+        "br", "p", "div", "li", "tr", "td", "th", "table", "ul", "ol",
+        "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "hr", "section",
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._chunks = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self._chunks.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.BLOCK_TAGS:
+            self._chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag in self.BLOCK_TAGS:
+            self._chunks.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._chunks.append(data)
+
+    def get_text(self):
+        text = HORIZONTAL_SPACE.sub(" ", "".join(self._chunks))
+        return BLANK_LINES.sub("\n", text).strip()
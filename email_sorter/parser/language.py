@@ -0,0 +1,39 @@
+"""
+Stopword-profile language detection, English or French, used to pick the
+keyword ruleset of each email.
+"""
+import re
+
+# characters of the body looked at after the subject: enough stopwords to
+# tell the languages apart, for a few microseconds per email
+SAMPLE_CHARS = 512
+
+STOPWORDS = {
+    "en": frozenset(
+        "the and to of a in is you your for on this that with are be it at "
+        "we our will have from by or as not can please has was an if".split()
+    ),
+    "fr": frozenset(
+        "le la les de des du un une et est vous votre vos pour sur dans "
+        "que qui ce cette avec pas nous au aux sont par ne en merci "
+        "bonjour ou se été".split()
+    ),
+}
+# letters only found in French words, worth one French stopword
+FRENCH_LETTERS = re.compile("[éèêàâçùûôîïëœ]")
+
+
+def detect_language(subject, body, default="en"):
+    """
+    :return: "en" or "fr", whichever has more distinct stopwords in the subject
+        and the start of the body, default on a tie
+    """
+    sample = f"{subject} {body[:SAMPLE_CHARS]}".lower()
+    words = sample.split()
+    english = len(STOPWORDS["en"].intersection(words))
+    french = len(STOPWORDS["fr"].intersection(words))
+    if FRENCH_LETTERS.search(sample):
+        french += 1
+    if english == french:
+        return default
+    return "fr" if french > english else "en"
@@ -0,0 +1,85 @@
+from collections.abc import Mapping
+
+
+class ParsedEmail(Mapping):
+    """
+    Fields extracted from a raw email.
+    Slotted so that no per-instance __dict__ is allocated, and a read-only
+    Mapping so that email_data["subject"] and email_data.get(...) keep working.
+    """
+
+    __slots__ = ("subject", "sender", "date", "body", "attachments",
+                 "message_id", "in_reply_to", "references")
+    FIELDS = frozenset(__slots__)
+
+    def __init__(self, subject="", sender="", date=None, body="", attachments=None,
+                 message_id="", in_reply_to="", references=None):
+        self.subject = subject
+        self.sender = sender
+        self.date = date
+        self.body = body
+        self.attachments = attachments if attachments is not None else []
+        # "<id@host>" message ids threading the email, "" or [] when absent
+        self.message_id = message_id
+        self.in_reply_to = in_reply_to
+        self.references = references if references is not None else []
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return f"ParsedEmail(subject={self.subject!r}, sender={self.sender!r}, date={self.date!r})"
+
+
+class ClassificationResult:
+    """Outcome of classifying one email."""
+
+    __slots__ = ("category", "engine", "scores", "matches")
+
+    def __init__(self, category, engine="rules", scores=None, matches=None):
+        self.category = category
+        # "rules", "nb", "thread" or "sender", stored with the email
+        self.engine = engine
+        # {category: score} of the keyword rules, empty when not scored
+        self.scores = scores if scores is not None else {}
+        # [(category, keyword, "subject" or "body", position), ...] of the keyword
+        # matches (positions in the scanned text, see EmailClassifier), None
+        # unless the classifier explains its results
+        self.matches = matches
+
+    @property
+    def runner_up(self):
+        """Second best scored category, None with less than two."""
+        ranked = sorted(self.scores, key=self.scores.get, reverse=True)
+        return ranked[1] if len(ranked) > 1 else None
+
+    @property
+    def margin(self):
+        """Score lead of the category over the runner-up (its whole score without one)."""
+        if self.category not in self.scores:
+            return 0
+        runner_up = self.runner_up
+        return self.scores[self.category] - (self.scores[runner_up] if runner_up else 0)
+
+    @property
+    def explanation(self):
+        """Compact JSON-ready breakdown of an explained result, None otherwise."""
+        if self.matches is None:
+            return None
+        return {
+            "scores": self.scores,
+            "matches": [list(match) for match in self.matches],
+            "runner_up": self.runner_up,
+            "margin": self.margin,
+        }
+
+    def __repr__(self):
+        return f"ClassificationResult(category={self.category!r}, engine={self.engine!r})"
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from .statistical import NON_CONTENT_CATEGORIES
+from .text import sender_address
+
+
+class SenderReputation:
+    """
+    Learned sender -> category table.
+    Each sender keeps a weight per category it was classified as by the
+    keyword rules, older observations counting less (halved every
+    half_life_days, no decay when None). A sender is known once its
+    total weight reaches min_count and its top category holds at least
+    `threshold` of that weight; known senders are classified with a dict
+    lookup instead of a keyword scan.
+    """
+
+    def __init__(self, threshold=0.95, min_count=5, half_life_days=None):
+        self.threshold = threshold
+        self.min_count = min_count
+        self.half_life_days = half_life_days
+        self.weights = {}  # address -> {category: decayed weight}
+        # address -> (category, confidence, weight) of the known senders only
+        self.known = {}
+
+    def fit(self, history, now=None):
+        """
+        Learn from an iterable of (sender, category, timestamp) rows, the
+        timestamp a datetime or ISO 8601 string (None = now).
+        """
+        now = now or datetime.now()
+        touched = set()
+        for sender, category, timestamp in history:
+            address = self._observe(sender, category, self._decay(timestamp, now))
+            if address:
+                touched.add(address)
+        for address in touched:
+            self._update(address)
+        return self
+
+    def observe(self, sender, category):
+        """Online update with an email just classified by the rules."""
+        address = self._observe(sender, category, 1.0)
+        if address:
+            self._update(address)
+
+    def lookup(self, sender):
+        """
+        :return: (category, confidence, weight) of a known sender, None for
+            unknown or ambiguous senders
+        """
+        return self.known.get(sender_address(sender))
+
+    def _observe(self, sender, category, weight):
+        if category in NON_CONTENT_CATEGORIES or not weight:
+            return None
+        address = sender_address(sender)
+        if not address:
+            return None
+        categories = self.weights.setdefault(address, {})
+        categories[category] = categories.get(category, 0.0) + weight
+        return address
+
+    def _decay(self, timestamp, now):
+        if not self.half_life_days or timestamp is None:
+            return 1.0
+        if isinstance(timestamp, str):
+            try:
+                timestamp = datetime.fromisoformat(timestamp)
+            except ValueError:
+                return 1.0
+        age_days = max((now - timestamp).total_seconds() / 86400, 0.0)
+        return 0.5 ** (age_days / self.half_life_days)
+
+    def _update(self, address):
+        categories = self.weights[address]
+        total = sum(categories.values())
+        category = max(categories, key=categories.get)
+        confidence = categories[category] / total
+        if total >= self.min_count and confidence >= self.threshold:
+            self.known[address] = (category, confidence, total)
+        else:
+            self.known.pop(address, None)
+
+    def __len__(self):
+        return len(self.known)
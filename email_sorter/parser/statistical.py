@@ -0,0 +1,204 @@
+import json
+import math
+import re
+import zlib
+from itertools import repeat
+from pathlib import Path
+
+# categories that do not describe the content of an email, never learned from
+NON_CONTENT_CATEGORIES = ("General", "Internal", "ERROR")
+# token -> bucket entries kept per feature prefix before the cache starts over
+MAX_CACHED_TOKENS = 200_000
+# ASCII bytes that are not \w mapped to spaces: ASCII text is tokenized like
+# TOKEN_PATTERN by bytes.translate + split, several times faster than findall
+ASCII_SEPARATORS = bytes(
+    byte if chr(byte).isalnum() and byte < 128 or byte == ord("_") else ord(" ")
+    for byte in range(256)
+)
+
+
+class _Buckets(dict):
+    """token -> hashed bucket of one feature prefix, each token hashed once."""
+
+    __slots__ = ("seed", "n_features")
+
+    def __init__(self, prefix, n_features):
+        super().__init__()
+        # crc32(token, crc32(prefix)) == crc32(prefix + token), without the concatenation
+        self.seed = zlib.crc32(prefix.encode("utf-8"))
+        self.n_features = n_features
+
+    def __missing__(self, token):
+        if len(self) >= MAX_CACHED_TOKENS:
+            self.clear()
+        bucket = self[token] = zlib.crc32(token.encode("utf-8"), self.seed) % self.n_features
+        return bucket
+
+
+class NaiveBayesClassifier:
+    """
+    Multinomial Naive Bayes over hashed word features.
+    Learns from labeled emails (offline with fit, online with partial_fit)
+    and keeps every count sparse so a prediction only touches the
+    features present in the email.
+    """
+
+    TOKEN_PATTERN = re.compile(r"\w+")
+
+    def __init__(
+        self, n_features=2**18, alpha=1.0, subject_weight=3, max_body_chars=1000
+    ):
+        self.n_features = n_features
+        self.alpha = alpha
+        # subject words count more than body words, like in the rule engine
+        self.subject_weight = subject_weight
+        self.max_body_chars = max_body_chars
+
+        self.doc_counts = {}  # category -> number of training emails
+        self.total_counts = {}  # category -> sum of feature counts
+        self.feature_counts = {}  # bucket -> {category: count}
+        # category -> {bucket: log((count + alpha) / alpha)}, derived from counts
+        self._weights = {}
+        # crc32 is stable across processes, unlike hash(), so saved models stay valid
+        self._buckets = {
+            prefix: _Buckets(prefix, n_features) for prefix in ("s:", "b:", "f:")
+        }
+
+    # Features
+
+    def _tokens(self, text):
+        text = text.lower()
+        if text.isascii():
+            return text.encode().translate(ASCII_SEPARATORS).decode().split()
+        return self.TOKEN_PATTERN.findall(text)
+
+    def _features(self, email_data):
+        """
+        (weight, buckets) of the subject tokens and of the body and sender
+        tokens, one bucket per token occurrence.
+        """
+        subject = self._buckets["s:"]
+        body = self._buckets["b:"]
+        sender = self._buckets["f:"]
+        buckets = list(map(body.__getitem__, self._tokens(
+            (email_data.get("body") or "")[: self.max_body_chars]
+        )))
+        buckets.extend(map(sender.__getitem__, self._tokens(email_data.get("sender") or "")))
+        return (
+            (self.subject_weight,
+             list(map(subject.__getitem__, self._tokens(email_data.get("subject") or "")))),
+            (1, buckets),
+        )
+
+    def vectorize(self, email_data):
+        """Turn an email into a sparse {bucket: count} feature dict."""
+        features = {}
+        for weight, buckets in self._features(email_data):
+            for bucket in buckets:
+                features[bucket] = features.get(bucket, 0) + weight
+        return features
+
+    # Training
+
+    def fit(self, labeled_emails):
+        """Train on an iterable of (email_data, category) pairs."""
+        for email_data, category in labeled_emails:
+            self.partial_fit(email_data, category)
+        return self
+
+    def partial_fit(self, email_data, category):
+        """Update the model with a single labeled email."""
+        if category in NON_CONTENT_CATEGORIES:
+            return
+
+        features = self.vectorize(email_data)
+        self.doc_counts[category] = self.doc_counts.get(category, 0) + 1
+        self.total_counts[category] = self.total_counts.get(category, 0) + sum(
+            features.values()
+        )
+
+        weights = self._weights.setdefault(category, {})
+        for bucket, count in features.items():
+            counts = self.feature_counts.setdefault(bucket, {})
+            counts[category] = counts.get(category, 0) + count
+            weights[bucket] = math.log1p(counts[category] / self.alpha)
+
+    @property
+    def is_trained(self):
+        return bool(self.doc_counts)
+
+    # Inference
+
+    def predict(self, email_data):
+        """Return the most likely category, or None if the model is untrained."""
+        if not self.doc_counts:
+            return None
+
+        fields = self._features(email_data)
+        n_tokens = sum(weight * len(buckets) for weight, buckets in fields)
+        total_docs = sum(self.doc_counts.values())
+        smoothing = self.alpha * self.n_features
+
+        # log P(c) + sum_w n_w log P(w|c), with the unseen-word term factored out
+        # so only buckets already seen in training contribute; each category's
+        # sum runs in map() over the token buckets instead of a Python loop
+        scores = {}
+        for category, docs in self.doc_counts.items():
+            get = self._weights.get(category, {}).get
+            score = math.log(docs / total_docs) + n_tokens * (
+                math.log(self.alpha) - math.log(self.total_counts[category] + smoothing)
+            )
+            for weight, buckets in fields:
+                score += weight * sum(map(get, buckets, repeat(0.0)))
+            scores[category] = score
+
+        return max(scores, key=scores.get)
+
+    def classify_email(self, email_data):
+        """Same interface as EmailClassifier.classify_email."""
+        return self.predict(email_data) or "General"
+
+    # Persistence
+
+    def save(self, path):
+        """Serialize the model counts to a JSON file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        state = {
+            "n_features": self.n_features,
+            "alpha": self.alpha,
+            "subject_weight": self.subject_weight,
+            "max_body_chars": self.max_body_chars,
+            "doc_counts": self.doc_counts,
+            "total_counts": self.total_counts,
+            "feature_counts": self.feature_counts,
+        }
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save()."""
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+
+        model = cls(
+            n_features=state["n_features"],
+            alpha=state["alpha"],
+            subject_weight=state["subject_weight"],
+            max_body_chars=state["max_body_chars"],
+        )
+        model.doc_counts = state["doc_counts"]
+        model.total_counts = state["total_counts"]
+        # JSON object keys are strings, buckets are ints
+        model.feature_counts = {
+            int(bucket): counts for bucket, counts in state["feature_counts"].items()
+        }
+        for bucket, counts in model.feature_counts.items():
+            for category, count in counts.items():
+                model._weights.setdefault(category, {})[bucket] = math.log1p(
+                    count / model.alpha
+                )
+        return model
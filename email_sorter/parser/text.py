@@ -0,0 +1,55 @@
+import functools
+import re
+
+# "On Mon, 3 Jun 2024, Bob <bob@x.com> wrote:" / "Le 3 juin 2024, Bob a écrit :"
+REPLY_HEADER = re.compile(
+    r"^\s*(on\b.{0,200}\bwrote\s*:|le\b.{0,200}\ba\s+écrit\s*:|-{2,}\s*original message\s*-{2,})\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# RFC 3676 signature separator ("-- " alone on its line)
+SIGNATURE = re.compile(r"^-- ?$", re.MULTILINE)
+
+
+def strip_quoted_reply(text):
+    """
+    Drop the parts of a body that were not written in this email:
+    the quoted previous message, '>' quoted lines and the signature.
+    """
+    if not text:
+        return ""
+
+    match = REPLY_HEADER.search(text)
+    if match:
+        text = text[: match.start()]
+
+    match = SIGNATURE.search(text)
+    if match:
+        text = text[: match.start()]
+
+    if ">" in text:
+        text = "\n".join(
+            line for line in text.splitlines() if not line.lstrip().startswith(">")
+        )
+
+    return text.strip()
+
+
+def html_to_text(html):
+    """Extract the readable text of an HTML document."""
+    if not html:
+        return ""
+    from .html_text import HTMLTextExtractor
+
+    extractor = HTMLTextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.get_text()
+
+
+@functools.lru_cache(maxsize=65536)
+def sender_address(sender):
+    """Lowercase address of a From value ("Bob <Bob@X.com>" -> "bob@x.com")."""
+    from email.utils import parseaddr
+
+    address = parseaddr(sender or "")[1]
+    return (address or sender or "").strip().lower()
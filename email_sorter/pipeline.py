@@ -0,0 +1,720 @@
+import logging
+import threading
+import concurrent.futures
+from pathlib import Path
+
+from imap import CircuitOpenError, UIDValidityChangedError
+from parser import (
+    DomainMatcher,
+    EmailParser,
+    EmailClassifier,
+    NaiveBayesClassifier,
+    ClassificationResult,
+    ParsedEmail,
+    SenderReputation,
+)
+from reporting import (
+    AttachmentHandler,
+    AttachmentInfo,
+    AttachmentPolicy,
+    ReportGenerator,
+    EmailDatabase,
+    open_exporter,
+)
+from reporting.export import email_row
+from reporting.database import (
+    FETCHED,
+    STORED,
+    ATTACHMENTS_SAVED,
+    FLAGGED,
+    FAILED,
+    POISONED,
+    RESOLVED,
+)
+from utils import backoff_delay, load_env, log_sampling, metrics
+
+
+def load_statistical_model(model_path, database):
+    """Load the Naive Bayes model from disk, or train it on the database history."""
+    model_path = Path(model_path)
+    if model_path.exists():
+        logging.info(f"Loading statistical model: {model_path}")
+        return NaiveBayesClassifier.load(model_path)
+
+    logging.info("No saved model found, training on database history...")
+    return NaiveBayesClassifier().fit(database.get_labeled_emails())
+
+
+def build_processor(language="en", domain=None, engine="rules",
+                    model_path="output/nb_model.json", max_body_chars=None,
+                    max_stored_body=None, db_path="output/emails.db", io_workers=4,
+                    fsync=False, attachment_policy=None, export_path=None,
+                    export_format="auto", thread_reuse=True, sender_reputation=None,
+                    explain=False):
+    """
+    Create the parser, classifier, attachment, report and database handlers of a run.
+    :param thread_reuse: Classify replies like the thread they belong to,
+        without scanning their body
+    :param attachment_policy: Path of an attachment policy JSON file
+    :param export_path: Directory receiving the processed emails as partitioned
+        Parquet (or NDJSON, see reporting.open_exporter), None to not export
+    """
+    # INTERNAL_DOMAIN and the credentials may come from a .env file
+    load_env()
+    max_part_bytes = None
+    if max_body_chars and max_stored_body:
+        # a character is at most 4 bytes in UTF-8
+        max_part_bytes = 4 * max(max_body_chars, max_stored_body)
+    parser = EmailParser(max_part_bytes=max_part_bytes)
+    classifier = EmailClassifier(
+        language=language, max_body_chars=max_body_chars, explain=explain
+    )
+    policy = AttachmentPolicy.load(attachment_policy) if attachment_policy else None
+    attachment_handler = AttachmentHandler(io_workers=io_workers, fsync=fsync, policy=policy)
+    report_generator = ReportGenerator()
+    database = EmailDatabase(db_path=db_path, max_stored_body=max_stored_body)
+    exporter = open_exporter(export_path, export_format) if export_path else None
+
+    if domain:
+        classifier.internal_domains = DomainMatcher.parse(domain)
+
+    statistical_model = None
+    if engine == "nb":
+        statistical_model = load_statistical_model(model_path, database)
+
+    reputation = None
+    if sender_reputation is not None:
+        reputation = SenderReputation(**sender_reputation).fit(database.get_sender_history())
+        logging.info(f"Sender reputation loaded: {len(reputation)} known senders")
+
+    return EmailProcessor(
+        parser,
+        classifier,
+        attachment_handler,
+        report_generator,
+        database,
+        statistical_model=statistical_model,
+        model_path=model_path,
+        exporter=exporter,
+        thread_reuse=thread_reuse,
+        sender_reputation=reputation,
+    )
+
+
+class PendingAttachments:
+    """Attachment writes of a stored email, recorded in the database once done."""
+
+    __slots__ = ("email_id", "db_email_id", "category", "journal_key", "attachments", "stored")
+
+    def __init__(self, email_id, db_email_id, category, journal_key, attachments):
+        # IMAP id, for the log lines
+        self.email_id = email_id
+        self.db_email_id = db_email_id
+        self.category = category
+        self.journal_key = journal_key
+        # AttachmentInfos, written or skipped
+        self.attachments = attachments
+        self.stored = False
+
+    def done(self):
+        return all(
+            info.future is None or info.future.done() for info in self.attachments
+        )
+
+    def wait(self):
+        concurrent.futures.wait(
+            [info.future for info in self.attachments if info.future is not None]
+        )
+
+
+class EmailProcessor:
+    """Parses, classifies, stores and records raw emails, one at a time."""
+
+    def __init__(
+        self,
+        parser,
+        classifier,
+        attachment_handler,
+        report_generator,
+        database,
+        statistical_model=None,
+        model_path=None,
+        exporter=None,
+        thread_reuse=True,
+        sender_reputation=None,
+    ):
+        self.parser = parser
+        self.classifier = classifier
+        self.attachment_handler = attachment_handler
+        self.report_generator = report_generator
+        self.database = database
+        self.statistical_model = statistical_model
+        self.model_path = model_path
+        # optional analytics export of every stored email row
+        self.exporter = exporter
+        # replies take the category of their thread (see EmailDatabase.find_thread_category)
+        self.thread_reuse = thread_reuse
+        # known senders are classified from their history (see parser.SenderReputation)
+        self.sender_reputation = sender_reputation
+        # handlers are not thread-safe, concurrent runs take turns with this lock
+        self.lock = threading.RLock()
+        # database row of the last email stored by begin()
+        self.last_row_id = None
+
+    def classify(self, email_data):
+        """Return the ClassificationResult of a parsed email."""
+        # a colleague's reply stays Internal whatever the thread or sender history says
+        if self.classifier.is_internal(email_data.get("sender", "")):
+            return ClassificationResult("Internal")
+
+        if self.thread_reuse:
+            category = self.database.find_thread_category(email_data)
+            if category is not None:
+                metrics.increment("classifier.thread_reused")
+                return ClassificationResult(category, engine="thread")
+
+        if self.sender_reputation is not None:
+            known = self.sender_reputation.lookup(email_data.get("sender"))
+            if known is not None:
+                metrics.increment("classifier.sender_known")
+                return ClassificationResult(known[0], engine="sender")
+
+        result = self.classifier.classify(email_data)
+        if self.sender_reputation is not None and result.scores:
+            # keyword matches teach the table, like the history it was built from
+            self.sender_reputation.observe(email_data.get("sender"), result.category)
+        if self.statistical_model is None:
+            return result
+
+        if result.category == "General":
+            return ClassificationResult(
+                self.statistical_model.classify_email(email_data), engine="nb"
+            )
+
+        # keyword matches act as labels for online learning
+        self.statistical_model.partial_fit(email_data, result.category)
+        return result
+
+    def process(self, raw_email, email_id, run_id=None, checkpoint=None):
+        """
+        Run every stage of one email not already recorded in its checkpoint.
+        :param email_id: IMAP id (UID when checkpointing) of the email
+        :param run_id: Checkpoint journal run, None to process without journaling
+        :param checkpoint: Journal row of this email from an interrupted run
+        :return: The email category
+        """
+        category, pending = self.begin(raw_email, email_id, run_id, checkpoint)
+        if pending is not None:
+            self.store_attachments(pending)
+        return category
+
+    def begin(self, raw_email, email_id, run_id=None, checkpoint=None, skipped=()):
+        """
+        Parse, classify and store an email, and queue its attachment writes.
+        :param skipped: AttachmentInfos of the attachments left out of raw_email
+            by the attachment policy
+        :return: (category, PendingAttachments to pass to store_attachments,
+            or None if the attachments were already recorded)
+        """
+        state = checkpoint["state"] if checkpoint else FETCHED
+        journal_key = (run_id, _uid_str(email_id)) if run_id else None
+
+        # Parse email
+        email_data = self.parser.parse_email(raw_email)
+        if skipped:
+            email_data.attachments += [info.filename for info in skipped]
+        has_attachments = len(email_data["attachments"]) > 0
+
+        if state == FETCHED:
+            # Classify email
+            result = self.classify(email_data)
+            email_category = result.category
+
+            # Log email information, unless sampled out (see utils.LogSampling)
+            log_fields = _log_fields(email_id, "classify")
+            if log_sampling.keeps(log_fields["email_id"]):
+                logging.info(f"Sender: {email_data['sender']}", extra=log_fields)
+                logging.info(f"Subject: {email_data['subject']}", extra=log_fields)
+                logging.info(f"Date: {email_data['date']}", extra=log_fields)
+                logging.info(f"Category: {email_category}", extra=log_fields)
+
+                # Body preview
+                preview_body = email_data['body'].replace('\n', ' ').replace('\r', '')[:100]
+                logging.info(f"Body preview: {preview_body}", extra=log_fields)
+
+            # Save to database
+            db_email_id = self.database.insert_email(
+                email_data,
+                email_category,
+                has_attachments=has_attachments,
+                engine=result.engine,
+                checkpoint=journal_key,
+                explanation=result.explanation,
+            )
+            self.last_row_id = db_email_id
+
+            # Record email for reporting
+            self.report_generator.record_email(
+                email_data,
+                email_category,
+                has_attachments=has_attachments,
+                thread_id=self.database.get_thread_id(db_email_id),
+            )
+            if self.exporter is not None:
+                self.exporter.write(email_row(
+                    db_email_id, email_data, email_category,
+                    has_attachments=has_attachments, engine=result.engine,
+                ))
+            self._log_progress()
+        else:
+            # stored by the interrupted run, already restored in the report
+            email_category = checkpoint["category"]
+            db_email_id = checkpoint["email_row_id"]
+
+        if state not in (FETCHED, STORED):
+            return email_category, None
+
+        # Handle attachments, written by the I/O threads
+        attachments = []
+        log_fields = _log_fields(email_id, "attachments")
+        if has_attachments:
+            logging.info(f"Attachments found: {email_data['attachments']}", extra=log_fields)
+            attachments = self.attachment_handler.submit_attachments(
+                raw_email,
+                email_category,
+                email_id,
+                skipped=skipped
+            )
+        else:
+            logging.info("No attachments found", extra=log_fields)
+
+        return email_category, PendingAttachments(
+            email_id, db_email_id, email_category, journal_key, attachments
+        )
+
+    def store_attachments(self, pending):
+        """Wait for the attachment writes of an email, then record them in the database."""
+        if pending.stored:
+            return
+        records = []
+        for info in pending.attachments:
+            if info.skipped_reason:
+                records.append(
+                    (info.filename, None, info.size, info.content_type, info.skipped_reason)
+                )
+                continue
+            saved = self.attachment_handler.saved_paths([info])
+            if saved:
+                records.append(
+                    (Path(saved[0]).name, saved[0], info.size, info.content_type, None)
+                )
+        saved_count = sum(1 for record in records if record[1])
+        if saved_count:
+            logging.info(
+                f"Saved {saved_count} attachment(s)",
+                extra=_log_fields(pending.email_id, "attachments"),
+            )
+
+        # Save attachments to database, the skipped ones without a file
+        self.database.insert_attachments(
+            pending.db_email_id,
+            records,
+            pending.category,
+            checkpoint=pending.journal_key
+        )
+        pending.stored = True
+
+    def record_failure(self, raw_email, email_id, error, run_id=None, mailbox=None):
+        """
+        Record a failed email as an ERROR row in the database and report,
+        and keep its raw bytes in the dead-letter queue for retry-failed.
+        :return: True if the raw email was dead-lettered
+        """
+        journal_key = (run_id, _uid_str(email_id)) if run_id else None
+        try:
+            email_data = self.parser.parse_email(raw_email)
+        except Exception:
+            # If parsing also fails, record minimal info
+            email_data = ParsedEmail(date="")
+
+        error_row_id = self.database.insert_email(
+            email_data, "ERROR", error=str(error), checkpoint=journal_key
+        )
+        self.report_generator.record_email(
+            email_data,
+            "ERROR",
+            error=str(error)
+        )
+        if self.exporter is not None:
+            self.exporter.write(email_row(error_row_id, email_data, "ERROR", error=str(error)))
+        self._log_progress()
+
+        if raw_email is None:
+            # failed before the fetch completed, nothing to retry offline
+            return False
+        self.database.add_dead_letter(
+            raw_email,
+            error,
+            mailbox=mailbox,
+            uid=_uid_str(email_id),
+            error_row_id=error_row_id,
+            run_id=run_id,
+        )
+        return True
+
+    def _log_progress(self):
+        """In bulk log mode, aggregate counters every log_sampling.summary_every emails."""
+        count = self.report_generator.record_count
+        if not log_sampling.bulk or count % log_sampling.summary_every:
+            return
+        report = self.report_generator
+        logging.info(
+            f"{count} emails processed: {dict(report.category_counts)}, "
+            f"{report.error_count} errors, metrics {metrics.snapshot()}",
+            extra={"stage": "summary"},
+        )
+
+    def retry_dead_letters(self, max_attempts=5, base_delay=60, max_delay=86400, limit=None):
+        """
+        Reprocess the dead letters that are due, without any IMAP access.
+        A success replaces the ERROR row, a failure is retried later with
+        exponential backoff, until max_attempts marks the message as poisoned.
+        :return: (resolved, rescheduled, poisoned) counts
+        """
+        resolved = rescheduled = poisoned = 0
+
+        for letter in self.database.get_due_dead_letters(limit):
+            self.last_row_id = None
+            try:
+                category, pending = self.begin(letter["raw_email"], letter["uid"] or letter["id"])
+                if pending is not None:
+                    self.store_attachments(pending)
+            except Exception as e:
+                if self.last_row_id is not None:
+                    # stored before failing: drop it so the next retry does not duplicate it
+                    self.database.delete_email(self.last_row_id)
+                attempts = letter["attempts"] + 1
+                logging.warning(
+                    f"Retry {attempts}/{max_attempts} of dead letter {letter['id']} failed: {e}"
+                )
+                if attempts >= max_attempts:
+                    self.database.reschedule_dead_letter(letter["id"], e, 0)
+                    self.database.set_dead_letter_status(letter["id"], POISONED)
+                    poisoned += 1
+                else:
+                    delay = backoff_delay(attempts, base_delay, max_delay)
+                    self.database.reschedule_dead_letter(letter["id"], e, delay)
+                    rescheduled += 1
+                continue
+
+            if letter["error_row_id"]:
+                self.database.delete_email(letter["error_row_id"])
+            if letter["run_id"] and letter["uid"]:
+                # the journal of the run now points at the processed email
+                self.database.set_checkpoint(
+                    letter["run_id"], letter["uid"], FLAGGED,
+                    email_row_id=self.last_row_id, category=category,
+                )
+            self.database.set_dead_letter_status(letter["id"], RESOLVED)
+            resolved += 1
+
+        return resolved, rescheduled, poisoned
+
+
+    def close(self, generate_reports=True):
+        """Save the model, write the reports and close the database at the end of a run."""
+        if self.statistical_model is not None and self.model_path:
+            self.statistical_model.save(self.model_path)
+            logging.info(f"Statistical model saved: {self.model_path}")
+
+        if generate_reports:
+            logging.info("Generating reports...")
+            for name, path in zip(
+                ("Detail", "Summary", "Thread"),
+                self.report_generator.generate_reports(),
+            ):
+                if path:
+                    logging.info(f"{name} report saved: {path}")
+
+        # wait for the attachment writes still in flight
+        self.attachment_handler.close()
+
+        if self.exporter is not None:
+            self.exporter.close()
+
+        counters = metrics.snapshot()
+        if counters:
+            logging.info(f"Metrics: {counters}")
+
+        # Close database connection
+        self.database.close()
+
+
+class MailboxRun:
+    """
+    One journaled ingestion pass over a mailbox.
+    start() lists the emails to process, process_batch() can then be called
+    with any connection to the account until nothing is pending.
+    """
+
+    def __init__(self, processor, mailbox="INBOX", status="UNSEEN", limit=None,
+                 resume=False, name=None, incremental=False):
+        self.processor = processor
+        self.mailbox = mailbox
+        # search criteria: a status keyword, or a compiled filter expression
+        self.status = status
+        # unread emails are flagged as read once processed
+        self.marks_read = "UNSEEN" in status.upper().split()
+        self.limit = limit
+        self.resume = resume
+        # only search the emails changed since the last complete run (CONDSTORE)
+        self.incremental = incremental
+        self.uidvalidity = None
+        self.highestmodseq = None
+        self.complete = True
+        # journal key, account-qualified when several accounts share a database
+        self.name = name or mailbox
+        self.run_id = None
+        self.checkpoints = {}
+        self.pending = []
+        self._in_flight = []
+
+    def start(self, client):
+        """Select the mailbox, open (or resume) the journal run and search the emails."""
+        client.select_mailbox(self.mailbox)
+        self.uidvalidity = client.uidvalidity
+        database = self.processor.database
+
+        with self.processor.lock:
+            if self.resume:
+                self.run_id = database.find_resumable_run(
+                    self.name, self.status, client.uidvalidity
+                )
+            if self.run_id:
+                self.checkpoints = database.get_checkpoints(self.run_id)
+                self.processor.report_generator.restore(
+                    database.get_run_emails(self.run_id)
+                )
+                logging.info(
+                    f"Resuming run {self.run_id}: {len(self.checkpoints)} emails already journaled"
+                )
+            else:
+                self.run_id = database.start_run(
+                    self.name, self.status, client.uidvalidity
+                )
+
+        changed_since = None
+        if self.incremental and client.highestmodseq is not None:
+            # value at selection time, changes made during the run are seen next time
+            self.highestmodseq = client.highestmodseq
+            with self.processor.lock:
+                changed_since = database.get_highest_modseq(
+                    self.name, self.status, client.uidvalidity
+                )
+            if changed_since is not None:
+                logging.info(f"Incremental run: emails changed since modseq {changed_since}")
+
+        if changed_since is None:
+            email_ids = client.search(self.status)
+        else:
+            email_ids = client.search(self.status, changed_since=changed_since)
+        if not email_ids:
+            logging.info(f"No emails found matching criteria: {self.status}")
+
+        if self.limit and len(email_ids) > self.limit:
+            email_ids = email_ids[:self.limit]
+            # the emails left out must be searched again next time
+            self.complete = False
+
+        logging.info(f"{len(email_ids)} emails with status: {self.status} found to process")
+        self.pending = list(email_ids)
+        return self.pending
+
+    def process_batch(self, client, size=None):
+        """
+        Process up to `size` pending emails (all of them if None).
+        The next emails are fetched and classified while the attachments of
+        the previous ones are being written; each email is flagged once its
+        attachments are recorded.
+        :return: Number of emails still pending
+        """
+        batch = self.pending[:size] if size else self.pending
+        self.pending = self.pending[len(batch):]
+        # (email_id, raw_email, PendingAttachments) of the emails not flagged yet
+        self._in_flight = []
+        started = 0
+        try:
+            for email_id in batch:
+                self._process_email(client, email_id)
+                started += 1
+                self._finish_ready(client)
+            self._finish_ready(client, wait=True)
+        except CircuitOpenError:
+            # the server is down, not the emails: keep them for the next attempt
+            unfinished = [entry[0] for entry in self._in_flight] + batch[started:]
+            self._store_in_flight()
+            with self.processor.lock:
+                # pick them up from the stage they reached
+                self.checkpoints = self.processor.database.get_checkpoints(self.run_id)
+            self.pending = unfinished + self.pending
+            raise
+        except UIDValidityChangedError:
+            # the remaining UIDs may name other emails now: keep what was fetched, stop
+            self._store_in_flight()
+            raise
+        return len(self.pending)
+
+    def reselect(self, client):
+        """Select the mailbox again for the next batch, on a new connection."""
+        client.select_mailbox(self.mailbox)
+        if self.uidvalidity and client.uidvalidity and client.uidvalidity != self.uidvalidity:
+            raise UIDValidityChangedError(
+                f"UIDVALIDITY of {self.mailbox} changed from {self.uidvalidity} "
+                f"to {client.uidvalidity} between two batches"
+            )
+
+    def finish(self):
+        """Close the journal run so it is not resumed."""
+        with self.processor.lock:
+            self.processor.database.finish_run(self.run_id)
+            if self.highestmodseq is not None and self.complete:
+                self.processor.database.set_highest_modseq(
+                    self.name, self.status, self.uidvalidity, self.highestmodseq
+                )
+
+    def _process_email(self, client, email_id):
+        processor = self.processor
+        database = processor.database
+        uid = email_id.decode()
+
+        checkpoint = self.checkpoints.get(uid)
+        if checkpoint and checkpoint["state"] in (FLAGGED, FAILED):
+            return
+
+        raw_email = None
+        pending = None
+        try:
+            if not checkpoint or checkpoint["state"] != ATTACHMENTS_SAVED:
+                raw_email, skipped = self._fetch(client, email_id)
+                logging.info(f"Email {uid} fetched", extra=_log_fields(uid, "fetch"))
+                with processor.lock:
+                    if not checkpoint:
+                        database.set_checkpoint(self.run_id, uid, FETCHED)
+                    _, pending = processor.begin(
+                        raw_email, email_id, self.run_id, checkpoint, skipped=skipped
+                    )
+        except (CircuitOpenError, UIDValidityChangedError):
+            raise
+        except Exception as e:
+            self._record_failure(client, email_id, raw_email, e)
+            return
+
+        self._in_flight.append((email_id, raw_email, pending))
+
+    def _fetch(self, client, email_id):
+        """
+        Download an email, without the attachments the policy rejects in
+        every category when BODYSTRUCTURE tells them apart beforehand.
+        :return: (raw email, AttachmentInfos of the parts left on the server)
+        """
+        policy = self.processor.attachment_handler.policy
+        if policy is None or not policy.filters_before_download:
+            return client.fetch_email(email_id), []
+
+        parts = client.fetch_structure(email_id)
+        kept, skipped = [], []
+        for part in parts:
+            reason = None
+            if part.is_attachment:
+                reason = policy.reject_everywhere(
+                    part.filename, part.content_type, part.decoded_size
+                )
+            if reason:
+                skipped.append(AttachmentInfo(
+                    part.filename, part.content_type, part.decoded_size,
+                    skipped_reason=reason,
+                ))
+            else:
+                kept.append(part)
+
+        if not skipped:
+            return client.fetch_email(email_id), []
+        metrics.increment("attachments.skipped_before_download", len(skipped))
+        return client.fetch_email_without(email_id, kept), skipped
+
+    def _finish_ready(self, client, wait=False):
+        """Flag the in-flight emails whose attachments are written (all of them if wait)."""
+        for entry in list(self._in_flight):
+            email_id, raw_email, pending = entry
+            if pending is not None and not wait and not pending.done():
+                continue
+            self._finish_email(client, email_id, raw_email, pending)
+            self._in_flight.remove(entry)
+
+    def _finish_email(self, client, email_id, raw_email, pending):
+        processor = self.processor
+        try:
+            if pending is not None:
+                # wait outside the lock, other mailboxes may be using the processor
+                pending.wait()
+                with processor.lock:
+                    processor.store_attachments(pending)
+
+            logging.info("-" * 40, extra=_log_fields(email_id, "flag"))  # Visual separator
+
+            # Mark email as read after successful processing
+            if self.marks_read:
+                client.mark_as_read(email_id)
+            with processor.lock:
+                processor.database.set_checkpoint(self.run_id, email_id.decode(), FLAGGED)
+
+        except (CircuitOpenError, UIDValidityChangedError):
+            raise
+        except Exception as e:
+            self._record_failure(client, email_id, raw_email, e)
+
+    def _store_in_flight(self):
+        """Record the attachments already queued, so only the flagging is left to redo."""
+        processor = self.processor
+        for email_id, _, pending in self._in_flight:
+            if pending is None or pending.stored:
+                continue
+            pending.wait()
+            try:
+                with processor.lock:
+                    processor.store_attachments(pending)
+            except Exception as e:
+                # still journaled as stored, the attachments are saved again next time
+                logging.warning(f"Could not record the attachments of email {email_id}: {e}")
+
+    def _record_failure(self, client, email_id, raw_email, error):
+        processor = self.processor
+        logging.error(
+            f"Failed to process email {email_id}: {error}",
+            exc_info=error,
+            extra=_log_fields(email_id, "failed"),
+        )
+        # Record error in database and report, keep the raw email for retry-failed
+        with processor.lock:
+            dead_lettered = processor.record_failure(
+                raw_email, email_id, error, self.run_id, self.mailbox
+            )
+        if dead_lettered:
+            try:
+                # the dead-letter queue owns the message now
+                if self.marks_read:
+                    client.mark_as_read(email_id)
+            except Exception:
+                logging.warning(f"Could not flag dead-lettered email {email_id}")
+        else:
+            # kept nowhere, an incremental search must find it again
+            self.complete = False
+
+
+def _log_fields(email_id, stage):
+    """extra= fields of a per-email log record."""
+    return {"email_id": _uid_str(email_id), "stage": stage}
+
+
+def _uid_str(email_id):
+    return email_id.decode() if isinstance(email_id, bytes) else str(email_id)
@@ -1,5 +1,20 @@
-from .attachment import AttachmentHandler
-from .reporting import ReportGenerator
+from .attachment import AttachmentHandler, AttachmentInfo
+from .attachment_policy import AttachmentPolicy
+from .reporting import ReportGenerator, ReportRecord
 from .database import EmailDatabase
+from .export import open_exporter, export_database
+from .retention import BodyArchive, RetentionPolicy, RetentionRun
 
-__all__ = ["AttachmentHandler", "ReportGenerator", "EmailDatabase"]
+__all__ = [
+    "AttachmentHandler",
+    "AttachmentInfo",
+    "AttachmentPolicy",
+    "ReportGenerator",
+    "ReportRecord",
+    "EmailDatabase",
+    "open_exporter",
+    "export_database",
+    "BodyArchive",
+    "RetentionPolicy",
+    "RetentionRun",
+]
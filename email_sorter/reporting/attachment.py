@@ -1,22 +1,50 @@
 import os
 import logging
-import email
-from email.header import decode_header, make_header
+import threading
 from pathlib import Path
 
+from .attachment_writer import AttachmentWriter
+
+
+class AttachmentInfo:
+    """
+    One attachment of an email: queued for writing (future resolves to the
+    saved path) or skipped by the attachment policy (future is None).
+    """
+
+    __slots__ = ("filename", "content_type", "size", "future", "skipped_reason")
+
+    def __init__(self, filename, content_type, size, future=None, skipped_reason=None):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.future = future
+        self.skipped_reason = skipped_reason
+
+    def __repr__(self):
+        return f"AttachmentInfo({self.filename!r}, size={self.size}, skipped={self.skipped_reason!r})"
+
 
 class AttachmentHandler:
     """Handles saving email attachments to categorized folders."""
 
-    def __init__(self, base_path="output/attachments"):
+    def __init__(self, base_path="output/attachments", io_workers=4, fsync=False, policy=None):
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
+        self.writer = AttachmentWriter(max_workers=io_workers, fsync=fsync)
+        # AttachmentPolicy deciding what is saved, None to save everything
+        self.policy = policy
+        # category folders already created
+        self._category_paths = {}
+        self._lock = threading.Lock()
         logging.info(f"Attachment handler initialized: {self.base_path}")
 
     def decode_str(self, value):
         """Decode RFC 2047 encoded email headers."""
         if not value:
             return ""
+        from email.header import decode_header, make_header
+
         decoded_parts = decode_header(value)
         header = make_header(decoded_parts)
         return str(header)
@@ -36,6 +64,8 @@ class AttachmentHandler:
 
     def extract_attachments(self, raw_email_bytes):
         """Extract attachment data from raw email bytes."""
+        import email
+
         msg = email.message_from_bytes(raw_email_bytes)
         attachments = []
 
@@ -58,53 +88,96 @@ class AttachmentHandler:
             payload = part.get_payload(decode=True)
 
             if payload:
-                attachments.append({"filename": decoded_filename, "data": payload})
+                attachments.append({
+                    "filename": decoded_filename,
+                    "content_type": part.get_content_type(),
+                    "data": payload,
+                })
 
         return attachments
 
-    def save_attachments(self, raw_email_bytes, category, email_id=None):
-        """Save attachments to category folder."""
+    def category_path(self, category):
+        """Folder of a category, created the first time it is needed."""
+        with self._lock:
+            path = self._category_paths.get(category)
+            if path is None:
+                path = self.base_path / category
+                path.mkdir(parents=True, exist_ok=True)
+                self._category_paths[category] = path
+            return path
+
+    def submit_attachments(self, raw_email_bytes, category, email_id=None, skipped=()):
+        """
+        Queue the attachments allowed by the policy for writing to the category folder.
+        :param skipped: AttachmentInfos already skipped before the download
+        :return: One AttachmentInfo per attachment, whose future resolves to
+            the saved path (or fails), or skipped with a reason
+        """
         attachments = self.extract_attachments(raw_email_bytes)
+        infos = list(skipped)
 
         if not attachments:
-            return []
+            return infos
 
-        category_path = self.base_path / category
-        category_path.mkdir(parents=True, exist_ok=True)
-
-        saved_files = []
+        email_id_str = None
+        if email_id:
+            email_id_str = (
+                email_id.decode() if isinstance(email_id, bytes) else str(email_id)
+            )
 
         for attachment in attachments:
-            try:
-                filename = self.sanitize_filename(attachment["filename"])
-                file_path = category_path / filename
-
-                # Handle duplicate filenames
-                counter = 1
-                original_path = file_path
-                while file_path.exists():
-                    name, ext = os.path.splitext(original_path.name)
-                    file_path = category_path / f"{name}_{counter}{ext}"
-                    counter += 1
-
-                with open(file_path, "wb") as f:
-                    f.write(attachment["data"])
-
-                saved_files.append(str(file_path))
-
-                log_msg = f"Saved attachment: {filename} to {category}/"
-                if email_id:
-                    email_id_str = (
-                        email_id.decode()
-                        if isinstance(email_id, bytes)
-                        else str(email_id)
+            info = AttachmentInfo(
+                attachment["filename"], attachment["content_type"], len(attachment["data"])
+            )
+            infos.append(info)
+            if self.policy is not None:
+                info.skipped_reason = self.policy.check(
+                    category, info.filename, info.content_type, info.size
+                )
+                if info.skipped_reason:
+                    logging.info(
+                        f"Skipped attachment {info.filename} in {category}: {info.skipped_reason}"
                     )
-                    log_msg += f" (Email ID: {email_id_str})"
-                logging.info(log_msg)
-
-            except Exception as e:
-                logging.error(
-                    f"Failed to save attachment {attachment['filename']}: {e}"
+                    continue
+
+            filename = self.sanitize_filename(attachment["filename"])
+            info.future = self.writer.write(
+                self.category_path(category), filename, attachment["data"]
+            )
+            info.future.add_done_callback(
+                lambda f, name=attachment["filename"]: self._log_saved(
+                    f, name, category, email_id_str
                 )
+            )
+        return infos
+
+    @staticmethod
+    def _log_saved(future, filename, category, email_id_str):
+        error = future.exception()
+        if error is not None:
+            logging.error(f"Failed to save attachment {filename}: {error}")
+            return
+
+        log_msg = f"Saved attachment: {os.path.basename(future.result())} to {category}/"
+        if email_id_str:
+            log_msg += f" (Email ID: {email_id_str})"
+        logging.info(log_msg)
+
+    @staticmethod
+    def saved_paths(infos):
+        """Wait for submitted attachments and return the paths of those written."""
+        return [
+            info.future.result()
+            for info in infos
+            if info.future is not None and info.future.exception() is None
+        ]
+
+    def save_attachments(self, raw_email_bytes, category, email_id=None):
+        """Save attachments to category folder."""
+        return self.saved_paths(
+            self.submit_attachments(raw_email_bytes, category, email_id)
+        )
 
-        return saved_files
+    def close(self):
+        """Wait for the pending writes."""
+        self.writer.close()
@@ -0,0 +1,119 @@
+import json
+import os
+
+from utils import parse_size
+
+RULE_KEYS = frozenset({
+    "max_size",
+    "allowed_types",
+    "denied_types",
+    "allowed_extensions",
+    "denied_extensions",
+    "metadata_only",
+})
+
+
+class AttachmentPolicy:
+    """
+    Which attachments are saved, per category.
+    A policy file holds a default rule and per-category overrides:
+        {"default": {"max_size": "20M", "denied_types": ["video/*"]},
+         "categories": {"Finance": {"allowed_extensions": [".pdf", ".xlsx"]},
+                        "Newsletter": {"metadata_only": true}}}
+    A category rule is the default rule updated with the category's keys.
+    Types match exactly or by main type ("video/*"), extensions case-insensitively.
+    """
+
+    def __init__(self, default=None, categories=None):
+        self.default = self._normalize(default or {})
+        self.categories = {
+            category: self._normalize({**(default or {}), **rule})
+            for category, rule in (categories or {}).items()
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config.get("default"), config.get("categories"))
+
+    @staticmethod
+    def _normalize(rule):
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown attachment policy keys: {', '.join(sorted(unknown))}")
+
+        def lowered(key, prefix=""):
+            values = rule.get(key)
+            if values is None:
+                return None
+            return {
+                value.lower() if value.startswith(prefix) else prefix + value.lower()
+                for value in values
+            }
+
+        max_size = rule.get("max_size")
+        return {
+            "max_size": parse_size(max_size) if max_size is not None else None,
+            "allowed_types": lowered("allowed_types"),
+            "denied_types": lowered("denied_types"),
+            "allowed_extensions": lowered("allowed_extensions", "."),
+            "denied_extensions": lowered("denied_extensions", "."),
+            "metadata_only": bool(rule.get("metadata_only")),
+        }
+
+    def rule(self, category):
+        return self.categories.get(category, self.default)
+
+    def check(self, category, filename, content_type, size):
+        """
+        :return: Why the attachment must not be saved in this category, or None
+        """
+        return self._check(self.rule(category), filename, content_type, size)
+
+    def reject_everywhere(self, filename, content_type, size):
+        """
+        Reason to skip an attachment before the email is classified: only when
+        every category would skip it (the default reason), else None.
+        """
+        reason = self._check(self.default, filename, content_type, size)
+        if reason is None:
+            return None
+        for rule in self.categories.values():
+            if self._check(rule, filename, content_type, size) is None:
+                return None
+        return reason
+
+    @property
+    def filters_before_download(self):
+        """Whether reject_everywhere can reject anything."""
+        default = self.default
+        return bool(
+            default["metadata_only"]
+            or default["max_size"] is not None
+            or default["allowed_types"] is not None
+            or default["denied_types"]
+            or default["allowed_extensions"] is not None
+            or default["denied_extensions"]
+        )
+
+    @staticmethod
+    def _check(rule, filename, content_type, size):
+        if rule["metadata_only"]:
+            return "metadata only"
+        if rule["max_size"] is not None and size > rule["max_size"]:
+            return f"size {size} over {rule['max_size']} bytes"
+
+        content_type = (content_type or "application/octet-stream").lower()
+        wildcard = content_type.split("/")[0] + "/*"
+        if rule["denied_types"] and {content_type, wildcard} & rule["denied_types"]:
+            return f"type {content_type} denied"
+        if rule["allowed_types"] is not None and not {content_type, wildcard} & rule["allowed_types"]:
+            return f"type {content_type} not allowed"
+
+        extension = os.path.splitext(filename or "")[1].lower()
+        if rule["denied_extensions"] and extension in rule["denied_extensions"]:
+            return f"extension {extension} denied"
+        if rule["allowed_extensions"] is not None and extension not in rule["allowed_extensions"]:
+            return f"extension {extension or '(none)'} not allowed"
+        return None
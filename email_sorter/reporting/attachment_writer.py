@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AttachmentWriter:
+    """
+    Writes attachment files on a bounded pool of I/O threads.
+    write() returns a Future of the final path, and blocks once max_pending
+    writes are in flight (back-pressure) so a slow disk cannot let
+    attachments pile up in memory.
+    Files are written to a temporary name then linked or renamed into place,
+    so a reader never sees a partial file. With fsync, file data is synced
+    by the writing thread and directory entries every fsync_batch files.
+    """
+
+    def __init__(self, max_workers=4, max_pending=64, fsync=False, fsync_batch=32):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="attachment-io"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.fsync = fsync
+        self.fsync_batch = fsync_batch
+        self._lock = threading.Lock()
+        self._dirty_dirs = set()
+        self._unsynced = 0
+
+    def write(self, directory, filename, data):
+        """Schedule a write of data to directory/filename (renamed if taken)."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._write, directory, filename, data)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _write(self, directory, filename, data):
+        directory = str(directory)
+        # a random name: other writers, and files left by a crashed run, never collide
+        # (unlike mkstemp, the file gets the usual umask permissions)
+        tmp_path = os.path.join(directory, f".attachment-{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "xb") as f:
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        try:
+            path = self._link_unique(tmp_path, directory, filename)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        if self.fsync:
+            self._mark_dirty(directory)
+        return path
+
+    @staticmethod
+    def _link_unique(tmp_path, directory, filename):
+        """Give the file its first free name: report.pdf, report_1.pdf, report_2.pdf..."""
+        name, ext = os.path.splitext(filename)
+        counter = 0
+        while True:
+            candidate = filename if counter == 0 else f"{name}_{counter}{ext}"
+            path = os.path.join(directory, candidate)
+            try:
+                # unlike rename, link fails instead of replacing an existing file
+                os.link(tmp_path, path)
+                return path
+            except FileExistsError:
+                counter += 1
+            except OSError:
+                # filesystem without hard links: reserve the name atomically,
+                # then move the written file over the placeholder we own
+                try:
+                    os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+                except FileExistsError:
+                    counter += 1
+                    continue
+                os.replace(tmp_path, path)
+                return path
+
+    def _mark_dirty(self, directory):
+        with self._lock:
+            self._dirty_dirs.add(directory)
+            self._unsynced += 1
+            if self._unsynced < self.fsync_batch:
+                return
+            dirty, self._dirty_dirs = self._dirty_dirs, set()
+            self._unsynced = 0
+        self._sync_dirs(dirty)
+
+    def flush(self):
+        """Sync the directories of the files written since the last batch."""
+        with self._lock:
+            dirty, self._dirty_dirs = self._dirty_dirs, set()
+            self._unsynced = 0
+        self._sync_dirs(dirty)
+
+    @staticmethod
+    def _sync_dirs(directories):
+        for directory in directories:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                logging.warning(f"Could not sync directory {directory}: {e}")
+            finally:
+                os.close(fd)
+
+    def close(self):
+        """Wait for the pending writes and stop the I/O threads."""
+        self._executor.shutdown(wait=True)
+        if self.fsync:
+            self.flush()
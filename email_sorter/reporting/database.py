@@ -1,14 +1,35 @@
-import sqlite3
+import json
 import logging
-from datetime import datetime
+import zlib
+from datetime import datetime, timedelta
 from pathlib import Path
 
+from utils import head_tail, metrics
+
+# Checkpoint journal states, in processing order
+FETCHED = "fetched"
+STORED = "stored"
+ATTACHMENTS_SAVED = "attachments_saved"
+FLAGGED = "flagged"
+FAILED = "failed"
+
+# Dead-letter statuses
+PENDING = "pending"
+RESOLVED = "resolved"
+POISONED = "poisoned"
+
+# Summary tables, maintained incrementally by the writes to emails and attachments
+STATISTICS_TABLES = ("stats_category", "stats_category_day", "stats_sender_day",
+                     "stats_attachment_day")
+
 
 class EmailDatabase:
     """Manages SQLite database for storing email data."""
 
-    def __init__(self, db_path="output/emails.db"):
+    def __init__(self, db_path="output/emails.db", max_stored_body=None):
         self.db_path = Path(db_path)
+        # longer bodies are stored as a head-and-tail window (None = whole body)
+        self.max_stored_body = max_stored_body
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self.conn = None
         self._init_database()
@@ -16,10 +37,15 @@ class EmailDatabase:
 
     def _init_database(self):
         """Create database tables if they don't exist."""
-        self.conn = sqlite3.connect(str(self.db_path))
+        import sqlite3
+
+        # shared by the concurrent mailbox runs, which serialize their access
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
 
         cursor = self.conn.cursor()
+        # only effective on a new database (see incremental_vacuum for older ones)
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
 
         # Emails table
         cursor.execute("""
@@ -34,9 +60,49 @@ class EmailDatabase:
                 attachment_count INTEGER DEFAULT 0,
                 body TEXT,
                 error TEXT,
+                engine TEXT DEFAULT 'rules',
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        # Databases created by older versions miss the newer columns
+        self._ensure_columns(
+            cursor,
+            "emails",
+            {
+                "engine": "TEXT DEFAULT 'rules'",
+                "message_id": "TEXT",
+                "in_reply_to": "TEXT",
+                # space-separated References ids
+                "reference_ids": "TEXT",
+                "thread_id": "INTEGER",
+                # compact JSON of ClassificationResult.explanation, NULL when not explained
+                "explanation": "TEXT",
+                # set when the retention policy moved the body to the archive database
+                "archived_at": "TEXT",
+            },
+        )
+
+        # Conversations, grouped by Message-ID / In-Reply-To / References
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS threads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                root_message_id TEXT,
+                subject TEXT,
+                category TEXT,
+                message_count INTEGER DEFAULT 0,
+                first_seen TEXT,
+                last_seen TEXT
+            )
+        """)
+
+        # Every message id seen in a thread, including referenced messages not processed
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS thread_messages (
+                message_id TEXT PRIMARY KEY,
+                thread_id INTEGER NOT NULL,
+                FOREIGN KEY (thread_id) REFERENCES threads(id)
+            )
+        """)
 
         # Attachments table
         cursor.execute("""
@@ -50,6 +116,75 @@ class EmailDatabase:
                 FOREIGN KEY (email_id) REFERENCES emails(id)
             )
         """)
+        # file_path is NULL for the attachments skipped by the attachment policy
+        self._ensure_columns(
+            cursor,
+            "attachments",
+            {"size": "INTEGER", "content_type": "TEXT", "skipped_reason": "TEXT"},
+        )
+
+        # Ingestion runs and their per-message checkpoint journal
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mailbox TEXT,
+                criteria TEXT,
+                uidvalidity TEXT,
+                started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                finished_at TEXT
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                run_id INTEGER,
+                uid TEXT,
+                state TEXT NOT NULL,
+                email_row_id INTEGER,
+                category TEXT,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (run_id, uid),
+                FOREIGN KEY (run_id) REFERENCES runs(id),
+                FOREIGN KEY (email_row_id) REFERENCES emails(id)
+            )
+        """)
+
+        # HIGHESTMODSEQ (CONDSTORE) of the last complete run, for incremental searches
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                mailbox TEXT,
+                criteria TEXT,
+                uidvalidity TEXT,
+                highestmodseq INTEGER,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (mailbox, criteria)
+            )
+        """)
+
+        # Raw messages that failed processing, kept (zlib compressed) for retries
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mailbox TEXT,
+                uid TEXT,
+                raw_email BLOB NOT NULL,
+                error_class TEXT,
+                error TEXT,
+                error_row_id INTEGER,
+                attempts INTEGER DEFAULT 1,
+                status TEXT DEFAULT 'pending',
+                next_attempt_at TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (error_row_id) REFERENCES emails(id)
+            )
+        """)
+        # journal run of the failed message, updated when a retry resolves it
+        self._ensure_columns(cursor, "dead_letters", {"run_id": "INTEGER"})
+
+        # Summary tables kept up to date in the transactions that change the
+        # emails and attachments, so statistics never scan the emails table
+        created = self._create_statistics_tables(cursor)
 
         # Create indexes for better query performance
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_category ON emails(category)")
@@ -57,69 +192,964 @@ class EmailDatabase:
         cursor.execute(
             "CREATE INDEX IF NOT EXISTS idx_email_id ON attachments(email_id)"
         )
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_thread ON emails(thread_id)")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_thread_messages_thread ON thread_messages(thread_id)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_dead_letter_due ON dead_letters(status, next_attempt_at)"
+        )
 
         self.conn.commit()
+        if created and cursor.execute("SELECT 1 FROM emails LIMIT 1").fetchone():
+            # database of an older version: summarize its existing emails once
+            self._compute_statistics(cursor)
+            self.conn.commit()
+
+    def _create_statistics_tables(self, cursor):
+        """:return: True if the summary tables did not exist yet"""
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_category'"
+        ).fetchone()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_category (
+                category TEXT PRIMARY KEY,
+                emails INTEGER DEFAULT 0,
+                errors INTEGER DEFAULT 0,
+                with_attachments INTEGER DEFAULT 0
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_category_day (
+                day TEXT,
+                category TEXT,
+                emails INTEGER DEFAULT 0,
+                errors INTEGER DEFAULT 0,
+                with_attachments INTEGER DEFAULT 0,
+                PRIMARY KEY (day, category)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_sender_day (
+                day TEXT,
+                sender TEXT,
+                emails INTEGER DEFAULT 0,
+                errors INTEGER DEFAULT 0,
+                PRIMARY KEY (day, sender)
+            )
+        """)
+        # skipped attachments count in skipped / skipped_bytes, not files / bytes
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_attachment_day (
+                day TEXT,
+                category TEXT,
+                files INTEGER DEFAULT 0,
+                bytes INTEGER DEFAULT 0,
+                skipped INTEGER DEFAULT 0,
+                skipped_bytes INTEGER DEFAULT 0,
+                PRIMARY KEY (day, category)
+            )
+        """)
+        return exists is None
+
+    def _ensure_columns(self, cursor, table, columns):
+        """Add the given {name: definition} columns if the table lacks them."""
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row["name"] for row in cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    def insert_email(
+        self,
+        email_data,
+        category,
+        has_attachments=False,
+        error=None,
+        engine="rules",
+        checkpoint=None,
+        explanation=None,
+    ):
+        """
+        Insert email record into database, and link it to its thread
+        (unless it is an error row).
+        checkpoint: optional (run_id, uid), journaled as stored (or failed)
+        in the same transaction as the row.
+        explanation: optional classification breakdown, stored as compact JSON.
+        """
+        body, truncated = head_tail(email_data.get("body") or "", self.max_stored_body)
+        if truncated:
+            metrics.increment("database.body_truncated")
 
-    def insert_email(self, email_data, category, has_attachments=False, error=None):
-        """Insert email record into database."""
         cursor = self.conn.cursor()
+        timestamp = datetime.now().isoformat()
 
         cursor.execute(
             """
             INSERT INTO emails (
                 timestamp, sender, subject, date, category,
-                has_attachments, attachment_count, body, error
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                has_attachments, attachment_count, body, error, engine,
+                message_id, in_reply_to, reference_ids, explanation
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
             (
-                datetime.now().isoformat(),
+                timestamp,
                 email_data.get("sender", ""),
                 email_data.get("subject", ""),
                 email_data.get("date", ""),
                 category,
                 1 if has_attachments else 0,
                 len(email_data.get("attachments", [])),
-                email_data.get("body", ""),
+                body,
                 error or "",
+                engine,
+                email_data.get("message_id") or "",
+                email_data.get("in_reply_to") or "",
+                " ".join(email_data.get("references") or []),
+                json.dumps(explanation, ensure_ascii=False, separators=(",", ":"))
+                if explanation is not None else None,
             ),
         )
 
         email_id = cursor.lastrowid
+        self._count_email(
+            cursor, timestamp, email_data.get("sender", ""), category, error, has_attachments
+        )
+        if not error:
+            self._link_thread(cursor, email_id, email_data, category)
+        if checkpoint:
+            run_id, uid = checkpoint
+            state = FAILED if error else STORED
+            self._set_checkpoint(cursor, run_id, uid, state, email_id, category)
         self.conn.commit()
         return email_id
 
+    # Summary tables
+
+    def _count_email(self, cursor, timestamp, sender, category, error, has_attachments, sign=1):
+        """Add (sign=1) or remove (sign=-1) an email row from the summary tables."""
+        day = (timestamp or "")[:10]
+        emails, errors = (0, sign) if error else (sign, 0)
+        attached = sign if has_attachments and not error else 0
+        cursor.execute(
+            """
+            INSERT INTO stats_category (category, emails, errors, with_attachments)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (category) DO UPDATE SET
+                emails = emails + excluded.emails,
+                errors = errors + excluded.errors,
+                with_attachments = with_attachments + excluded.with_attachments
+        """,
+            (category, emails, errors, attached),
+        )
+        cursor.execute(
+            """
+            INSERT INTO stats_category_day (day, category, emails, errors, with_attachments)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (day, category) DO UPDATE SET
+                emails = emails + excluded.emails,
+                errors = errors + excluded.errors,
+                with_attachments = with_attachments + excluded.with_attachments
+        """,
+            (day, category, emails, errors, attached),
+        )
+        cursor.execute(
+            """
+            INSERT INTO stats_sender_day (day, sender, emails, errors)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (day, sender) DO UPDATE SET
+                emails = emails + excluded.emails,
+                errors = errors + excluded.errors
+        """,
+            (day, sender or "", emails, errors),
+        )
+
+    def _count_attachments(self, cursor, day, category, files, sign=1):
+        """Add or remove (filename, file_path, size, ...) attachment entries from the byte counts."""
+        saved = skipped = saved_bytes = skipped_bytes = 0
+        for entry in files:
+            size = (entry[2] if len(entry) > 2 else None) or 0
+            if entry[1] is not None:
+                saved += 1
+                saved_bytes += size
+            else:
+                skipped += 1
+                skipped_bytes += size
+        if not files:
+            return
+        cursor.execute(
+            """
+            INSERT INTO stats_attachment_day (day, category, files, bytes, skipped, skipped_bytes)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (day, category) DO UPDATE SET
+                files = files + excluded.files,
+                bytes = bytes + excluded.bytes,
+                skipped = skipped + excluded.skipped,
+                skipped_bytes = skipped_bytes + excluded.skipped_bytes
+        """,
+            (day, category, sign * saved, sign * saved_bytes, sign * skipped, sign * skipped_bytes),
+        )
+
+    @staticmethod
+    def _email_day(cursor, email_id):
+        row = cursor.execute("SELECT timestamp FROM emails WHERE id = ?", (email_id,)).fetchone()
+        return (row["timestamp"] or "")[:10] if row else ""
+
+    def rebuild_statistics(self):
+        """
+        Recompute the summary tables from the emails and attachments tables.
+        :return: True if the incrementally maintained tables matched the rebuilt ones
+        """
+        cursor = self.conn.cursor()
+        keys = ("day", "category", "sender")
+
+        def snapshot():
+            # rows brought down to zero by deletions are equivalent to no row
+            return {
+                table: sorted(
+                    tuple(row) for row in cursor.execute(f"SELECT * FROM {table}")
+                    if any(row[name] for name in row.keys() if name not in keys)
+                )
+                for table in STATISTICS_TABLES
+            }
+
+        before = snapshot()
+        try:
+            self._compute_statistics(cursor)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        consistent = snapshot() == before
+        if not consistent:
+            logging.warning("Summary tables were out of sync with the emails, rebuilt")
+        return consistent
+
+    def _compute_statistics(self, cursor):
+        """Fill the summary tables from the emails and attachments tables."""
+        for table in STATISTICS_TABLES:
+            cursor.execute(f"DELETE FROM {table}")
+        error = "(error != '' AND error IS NOT NULL)"
+        cursor.execute(f"""
+            INSERT INTO stats_category (category, emails, errors, with_attachments)
+            SELECT category, SUM(NOT {error}), SUM({error}),
+                   SUM(has_attachments != 0 AND NOT {error})
+            FROM emails GROUP BY category
+        """)
+        cursor.execute(f"""
+            INSERT INTO stats_category_day (day, category, emails, errors, with_attachments)
+            SELECT substr(timestamp, 1, 10), category, SUM(NOT {error}), SUM({error}),
+                   SUM(has_attachments != 0 AND NOT {error})
+            FROM emails GROUP BY substr(timestamp, 1, 10), category
+        """)
+        cursor.execute(f"""
+            INSERT INTO stats_sender_day (day, sender, emails, errors)
+            SELECT substr(timestamp, 1, 10), COALESCE(sender, ''), SUM(NOT {error}), SUM({error})
+            FROM emails GROUP BY substr(timestamp, 1, 10), COALESCE(sender, '')
+        """)
+        cursor.execute("""
+            INSERT INTO stats_attachment_day (day, category, files, bytes, skipped, skipped_bytes)
+            SELECT COALESCE(substr(emails.timestamp, 1, 10), ''), attachments.category,
+                   SUM(attachments.file_path IS NOT NULL),
+                   SUM(CASE WHEN attachments.file_path IS NOT NULL
+                            THEN COALESCE(attachments.size, 0) ELSE 0 END),
+                   SUM(attachments.file_path IS NULL),
+                   SUM(CASE WHEN attachments.file_path IS NULL
+                            THEN COALESCE(attachments.size, 0) ELSE 0 END)
+            FROM attachments LEFT JOIN emails ON emails.id = attachments.email_id
+            GROUP BY COALESCE(substr(emails.timestamp, 1, 10), ''), attachments.category
+        """)
+
+    def get_daily_statistics(self, since=None):
+        """Per day and category counts (non-error emails, errors, with attachments)."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT * FROM stats_category_day WHERE day >= ? ORDER BY day, category",
+            (since or "",),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_sender_statistics(self, since=None, limit=None):
+        """Senders with the most emails since a day (YYYY-MM-DD), all days by default."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT sender, SUM(emails) AS emails, SUM(errors) AS errors
+            FROM stats_sender_day WHERE day >= ?
+            GROUP BY sender HAVING SUM(emails) + SUM(errors) > 0
+            ORDER BY emails DESC, sender LIMIT ?
+        """,
+            (since or "", -1 if limit is None else limit),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_attachment_statistics(self):
+        """Attachment files and bytes per category, saved and skipped."""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT category, SUM(files) AS files, SUM(bytes) AS bytes,
+                   SUM(skipped) AS skipped, SUM(skipped_bytes) AS skipped_bytes
+            FROM stats_attachment_day GROUP BY category ORDER BY bytes DESC
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+
+    # Threads
+
+    @staticmethod
+    def _thread_ids(email_data):
+        """(message id, parent ids oldest first) of an email mapping or row."""
+        references = email_data.get("references")
+        if references is None:
+            references = (email_data.get("reference_ids") or "").split()
+        parents = list(references)
+        in_reply_to = email_data.get("in_reply_to")
+        if in_reply_to and in_reply_to not in parents:
+            parents.append(in_reply_to)
+        return email_data.get("message_id") or "", parents
+
+    def _find_thread(self, cursor, message_ids):
+        """Thread row holding one of the message ids (the latest one first), or None."""
+        for message_id in reversed(message_ids):
+            row = cursor.execute(
+                """
+                SELECT threads.* FROM thread_messages
+                JOIN threads ON threads.id = thread_messages.thread_id
+                WHERE thread_messages.message_id = ?
+            """,
+                (message_id,),
+            ).fetchone()
+            if row is not None:
+                return row
+        return None
+
+    def _link_thread(self, cursor, email_id, email_data, category):
+        """Attach a stored email to the thread of its parents, or start a new thread."""
+        message_id, parents = self._thread_ids(email_data)
+        message_ids = parents + [message_id] if message_id else parents
+        if not message_ids:
+            return None
+
+        now = datetime.now().isoformat()
+        thread = self._find_thread(cursor, message_ids)
+        if thread is None:
+            cursor.execute(
+                """
+                INSERT INTO threads (
+                    root_message_id, subject, category, message_count, first_seen, last_seen
+                ) VALUES (?, ?, ?, 1, ?, ?)
+            """,
+                (message_ids[0], email_data.get("subject", ""), category, now, now),
+            )
+            thread_id = cursor.lastrowid
+        else:
+            thread_id = thread["id"]
+            # a thread keeps the first specific category it was given
+            cursor.execute(
+                """
+                UPDATE threads SET
+                    message_count = message_count + 1,
+                    last_seen = ?,
+                    category = CASE WHEN category IS NULL OR category = 'General'
+                                    THEN ? ELSE category END
+                WHERE id = ?
+            """,
+                (now, category, thread_id),
+            )
+
+        cursor.executemany(
+            "INSERT OR IGNORE INTO thread_messages (message_id, thread_id) VALUES (?, ?)",
+            [(message_id, thread_id) for message_id in message_ids],
+        )
+        cursor.execute("UPDATE emails SET thread_id = ? WHERE id = ?", (thread_id, email_id))
+        metrics.increment("database.thread_linked")
+        return thread_id
+
+    def find_thread_category(self, email_data):
+        """
+        Category established by the thread an email replies to, None when it
+        is not a reply, its thread is unknown or still only "General".
+        """
+        _, parents = self._thread_ids(email_data)
+        if not parents:
+            return None
+        thread = self._find_thread(self.conn.cursor(), parents)
+        if thread is None or thread["category"] in (None, "General"):
+            return None
+        return thread["category"]
+
+    def get_thread_id(self, email_id):
+        """Thread of a stored email, None if it has none."""
+        row = self.conn.execute(
+            "SELECT thread_id FROM emails WHERE id = ?", (email_id,)
+        ).fetchone()
+        return row["thread_id"] if row else None
+
+    def get_threads(self):
+        """Thread rows with their stored message count, most active first."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM threads ORDER BY message_count DESC, id")
+        return [dict(row) for row in cursor.fetchall()]
+
     def insert_attachment(self, email_id, filename, file_path, category):
         """Insert attachment record into database."""
+        self.insert_attachments(email_id, [(filename, file_path)], category)
+
+    def insert_attachments(self, email_id, files, category, checkpoint=None):
+        """
+        Insert attachment records in one transaction, each a (filename, file_path)
+        or (filename, file_path, size, content_type, skipped_reason) tuple.
+        checkpoint: optional (run_id, uid), journaled as attachments_saved.
+        """
         cursor = self.conn.cursor()
 
+        cursor.executemany(
+            """
+            INSERT INTO attachments (
+                email_id, filename, file_path, category, size, content_type, skipped_reason
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+            [
+                (email_id, entry[0], entry[1], category, *(tuple(entry[2:]) + (None,) * 3)[:3])
+                for entry in files
+            ],
+        )
+        self._count_attachments(cursor, self._email_day(cursor, email_id), category, files)
+        if checkpoint:
+            run_id, uid = checkpoint
+            self._set_checkpoint(cursor, run_id, uid, ATTACHMENTS_SAVED)
+
+        self.conn.commit()
+
+    # Checkpoint journal
+
+    def start_run(self, mailbox, criteria, uidvalidity=None):
+        """Open a new ingestion run and return its id."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "INSERT INTO runs (mailbox, criteria, uidvalidity) VALUES (?, ?, ?)",
+            (mailbox, criteria, uidvalidity),
+        )
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def find_resumable_run(self, mailbox, criteria, uidvalidity=None):
+        """Return the id of the latest unfinished run on this mailbox, if any."""
+        cursor = self.conn.cursor()
         cursor.execute(
             """
-            INSERT INTO attachments (email_id, filename, file_path, category)
-            VALUES (?, ?, ?, ?)
+            SELECT id, uidvalidity FROM runs
+            WHERE mailbox = ? AND criteria = ? AND finished_at IS NULL
+            ORDER BY id DESC LIMIT 1
+        """,
+            (mailbox, criteria),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        # UIDs from another UIDVALIDITY epoch point to different messages
+        if uidvalidity and row["uidvalidity"] and row["uidvalidity"] != uidvalidity:
+            logging.warning(f"UIDVALIDITY changed on {mailbox}, cannot resume run {row['id']}")
+            return None
+        return row["id"]
+
+    def finish_run(self, run_id):
+        """Mark a run as completed so it is no longer resumed."""
+        self.conn.execute(
+            "UPDATE runs SET finished_at = ? WHERE id = ?",
+            (datetime.now().isoformat(), run_id),
+        )
+        self.conn.commit()
+
+    def get_highest_modseq(self, mailbox, criteria, uidvalidity=None):
+        """Mod-sequence up to which a mailbox was fully processed, None if unknown."""
+        row = self.conn.execute(
+            "SELECT uidvalidity, highestmodseq FROM sync_state WHERE mailbox = ? AND criteria = ?",
+            (mailbox, criteria),
+        ).fetchone()
+        if row is None:
+            return None
+        # mod-sequences of another UIDVALIDITY epoch mean nothing
+        if uidvalidity and row["uidvalidity"] and row["uidvalidity"] != uidvalidity:
+            return None
+        return row["highestmodseq"]
+
+    def set_highest_modseq(self, mailbox, criteria, uidvalidity, highestmodseq):
+        self.conn.execute(
+            """
+            INSERT INTO sync_state (mailbox, criteria, uidvalidity, highestmodseq, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(mailbox, criteria) DO UPDATE SET
+                uidvalidity = excluded.uidvalidity,
+                highestmodseq = excluded.highestmodseq,
+                updated_at = excluded.updated_at
+        """,
+            (mailbox, criteria, uidvalidity, highestmodseq, datetime.now().isoformat()),
+        )
+        self.conn.commit()
+
+    def set_checkpoint(self, run_id, uid, state, email_row_id=None, category=None):
+        """Record the state reached by a message in a run."""
+        self._set_checkpoint(
+            self.conn.cursor(), run_id, uid, state, email_row_id, category
+        )
+        self.conn.commit()
+
+    def _set_checkpoint(
+        self, cursor, run_id, uid, state, email_row_id=None, category=None
+    ):
+        cursor.execute(
+            """
+            INSERT INTO checkpoints (run_id, uid, state, email_row_id, category, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (run_id, uid) DO UPDATE SET
+                state = excluded.state,
+                email_row_id = COALESCE(excluded.email_row_id, email_row_id),
+                category = COALESCE(excluded.category, category),
+                updated_at = excluded.updated_at
+        """,
+            (run_id, uid, state, email_row_id, category, datetime.now().isoformat()),
+        )
+
+    def get_checkpoints(self, run_id):
+        """Return {uid: checkpoint row} for a run."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM checkpoints WHERE run_id = ?", (run_id,))
+        return {row["uid"]: dict(row) for row in cursor.fetchall()}
+
+    def get_run_emails(self, run_id):
+        """Return the email rows already stored by a run, in processing order."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT emails.* FROM checkpoints
+            JOIN emails ON emails.id = checkpoints.email_row_id
+            WHERE checkpoints.run_id = ?
+            ORDER BY emails.id
+        """,
+            (run_id,),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def delete_email(self, email_id):
+        """Delete an email record and its attachment records."""
+        self.delete_emails([email_id])
+
+    def delete_emails(self, email_ids):
+        """Delete email records and their attachment records in one transaction."""
+        cursor = self.conn.cursor()
+        for email_id in email_ids:
+            self._delete_email(cursor, email_id)
+        self.conn.commit()
+
+    def _delete_email(self, cursor, email_id):
+        email = cursor.execute("SELECT * FROM emails WHERE id = ?", (email_id,)).fetchone()
+        if email is not None:
+            day = (email["timestamp"] or "")[:10]
+            attachments = cursor.execute(
+                "SELECT category, filename, file_path, size FROM attachments WHERE email_id = ?",
+                (email_id,),
+            ).fetchall()
+            for row in attachments:
+                self._count_attachments(
+                    cursor, day, row["category"], [tuple(row)[1:]], sign=-1
+                )
+            self._count_email(
+                cursor, email["timestamp"], email["sender"], email["category"],
+                email["error"], email["has_attachments"], sign=-1,
+            )
+            if email["thread_id"] is not None:
+                cursor.execute(
+                    "UPDATE threads SET message_count = message_count - 1 WHERE id = ?",
+                    (email["thread_id"],),
+                )
+        cursor.execute("DELETE FROM attachments WHERE email_id = ?", (email_id,))
+        cursor.execute("DELETE FROM emails WHERE id = ?", (email_id,))
+
+    # Retention
+
+    def get_categories(self):
+        """Categories with at least one email row, from the summary table."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT category FROM stats_category WHERE emails + errors > 0 ORDER BY category"
+        )
+        return [row["category"] for row in cursor.fetchall()]
+
+    def find_emails_before(self, category, before, limit, after_id=0, unarchived=False):
+        """
+        Up to limit emails of a category stored before a timestamp, by id
+        from after_id (id and timestamp columns).
+        :param unarchived: Only the emails whose body is still in this database, with their body
+        """
+        query = """
+            SELECT id, timestamp FROM emails
+            WHERE category = ? AND timestamp < ? AND id > ?
+        """
+        if unarchived:
+            query = query.replace("timestamp FROM", "timestamp, body FROM")
+            query += " AND archived_at IS NULL AND body IS NOT NULL"
+        cursor = self.conn.cursor()
+        cursor.execute(query + " ORDER BY id LIMIT ?", (category, before, after_id, limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def mark_archived(self, email_ids):
+        """Drop the bodies of emails copied to the archive database."""
+        self.conn.executemany(
+            "UPDATE emails SET body = NULL, archived_at = ? WHERE id = ?",
+            [(datetime.now().isoformat(), email_id) for email_id in email_ids],
+        )
+        self.conn.commit()
+
+    def find_attachments_before(self, category, before, limit, after_id=0):
+        """Up to limit saved attachments of the emails of a category stored before a timestamp."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT attachments.* FROM attachments
+            JOIN emails ON emails.id = attachments.email_id
+            WHERE attachments.category = ? AND emails.timestamp < ?
+                AND attachments.id > ? AND attachments.file_path IS NOT NULL
+            ORDER BY attachments.id LIMIT ?
+        """,
+            (category, before, after_id, limit),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_attachment_paths(self, email_ids):
+        """Paths of the saved attachment files of some emails."""
+        cursor = self.conn.cursor()
+        placeholders = ", ".join("?" for _ in email_ids)
+        cursor.execute(
+            f"""
+            SELECT file_path FROM attachments
+            WHERE email_id IN ({placeholders}) AND file_path IS NOT NULL
+        """,
+            tuple(email_ids),
+        )
+        return [row["file_path"] for row in cursor.fetchall()]
+
+    def iter_attachment_files(self, batch_size=1000):
+        """Yield (id, file_path) of every saved attachment, batch_size rows at a time."""
+        after_id = 0
+        while True:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                SELECT id, file_path FROM attachments
+                WHERE file_path IS NOT NULL AND id > ? ORDER BY id LIMIT ?
+            """,
+                (after_id, batch_size),
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row["id"], row["file_path"]
+            after_id = rows[-1]["id"]
+
+    def update_attachment_files(self, updates):
+        """
+        Record where attachment files went, in one transaction: each update is
+        (attachment id, new file_path, skipped_reason), a None file_path for
+        a file that no longer exists.
+        """
+        cursor = self.conn.cursor()
+        for attachment_id, file_path, reason in updates:
+            row = cursor.execute(
+                """
+                SELECT attachments.*, emails.timestamp FROM attachments
+                LEFT JOIN emails ON emails.id = attachments.email_id
+                WHERE attachments.id = ?
+            """,
+                (attachment_id,),
+            ).fetchone()
+            if row is None:
+                continue
+            day = (row["timestamp"] or "")[:10]
+            self._count_attachments(
+                cursor, day, row["category"], [(row["filename"], row["file_path"], row["size"])],
+                sign=-1,
+            )
+            self._count_attachments(
+                cursor, day, row["category"], [(row["filename"], file_path, row["size"])]
+            )
+            cursor.execute(
+                "UPDATE attachments SET file_path = ?, skipped_reason = ? WHERE id = ?",
+                (file_path, reason, attachment_id),
+            )
+        self.conn.commit()
+
+    def incremental_vacuum(self, pages=1000, convert=False):
+        """
+        Give up to `pages` free pages back to the filesystem.
+        :param convert: Convert a database created before incremental auto-vacuum
+            with a full VACUUM (rewrites the whole file, locking it meanwhile);
+            without it such a database is left as it is
+        :return: Number of free pages left, 0 when incremental vacuum is unavailable
+        """
+        cursor = self.conn.cursor()
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            if not convert:
+                logging.warning(
+                    "Incremental vacuum is unavailable on this database until it is "
+                    "converted (prune --convert-vacuum runs a full VACUUM once)"
+                )
+                return 0
+            logging.info("Converting the database to incremental auto-vacuum (full VACUUM)")
+            self.conn.commit()
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        self.conn.commit()
+        return cursor.execute("PRAGMA freelist_count").fetchone()[0]
+
+    # Dead-letter queue
+
+    def add_dead_letter(
+        self, raw_email, error, mailbox=None, uid=None, error_row_id=None, retry_in=0,
+        run_id=None,
+    ):
+        """
+        Store a raw email that failed processing, first retry due in retry_in seconds.
+        :param mailbox: IMAP folder of the message
+        :param run_id: Checkpoint journal run the message failed in
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO dead_letters (
+                mailbox, uid, raw_email, error_class, error, error_row_id, next_attempt_at,
+                run_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                mailbox,
+                uid,
+                zlib.compress(raw_email),
+                type(error).__name__,
+                str(error),
+                error_row_id,
+                (datetime.now() + timedelta(seconds=retry_in)).isoformat(),
+                run_id,
+            ),
+        )
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def get_due_dead_letters(self, limit=None):
+        """Return pending dead letters whose next attempt is due, raw bytes decompressed."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT * FROM dead_letters
+            WHERE status = ? AND next_attempt_at <= ?
+            ORDER BY next_attempt_at
+            LIMIT ?
         """,
-            (email_id, filename, file_path, category),
+            (PENDING, datetime.now().isoformat(), -1 if limit is None else limit),
         )
+        letters = []
+        for row in cursor.fetchall():
+            letter = dict(row)
+            letter["raw_email"] = zlib.decompress(letter["raw_email"])
+            letters.append(letter)
+        return letters
 
+    def reschedule_dead_letter(self, letter_id, error, retry_in):
+        """Record a failed retry and schedule the next one in retry_in seconds."""
+        now = datetime.now()
+        self.conn.execute(
+            """
+            UPDATE dead_letters SET
+                attempts = attempts + 1, error_class = ?, error = ?,
+                next_attempt_at = ?, updated_at = ?
+            WHERE id = ?
+        """,
+            (
+                type(error).__name__,
+                str(error),
+                (now + timedelta(seconds=retry_in)).isoformat(),
+                now.isoformat(),
+                letter_id,
+            ),
+        )
         self.conn.commit()
 
+    def set_dead_letter_status(self, letter_id, status):
+        """Close a dead letter as resolved or poisoned."""
+        self.conn.execute(
+            "UPDATE dead_letters SET status = ?, updated_at = ? WHERE id = ?",
+            (status, datetime.now().isoformat(), letter_id),
+        )
+        self.conn.commit()
+
+    def merge_from(self, other_db_path):
+        """
+        Copy the emails, attachments and dead letters of another database
+        (e.g. a shard's partial results) into this one, in one transaction.
+        :return: The merged email rows, as stored in this database
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("ATTACH DATABASE ? AS other", (str(other_db_path),))
+        try:
+            email_ids = {}
+            merged = []
+            for row in cursor.execute("SELECT * FROM other.emails ORDER BY id").fetchall():
+                email = dict(row)
+                old_id = email.pop("id")
+                # thread ids are local to each database, link the email again here
+                email.pop("thread_id", None)
+                email_ids[old_id] = self._insert_row(cursor, "emails", email)
+                self._count_email(
+                    cursor, email["timestamp"], email.get("sender"), email["category"],
+                    email.get("error"), email.get("has_attachments"),
+                )
+                email["id"] = email_ids[old_id]
+                email["thread_id"] = None
+                if not email.get("error"):
+                    email["thread_id"] = self._link_thread(
+                        cursor, email["id"], email, email["category"]
+                    )
+                merged.append(email)
+
+            for row in cursor.execute("SELECT * FROM other.attachments").fetchall():
+                attachment = dict(row)
+                del attachment["id"]
+                attachment["email_id"] = email_ids.get(attachment["email_id"])
+                self._insert_row(cursor, "attachments", attachment)
+                self._count_attachments(
+                    cursor,
+                    self._email_day(cursor, attachment["email_id"]),
+                    attachment["category"],
+                    [(attachment["filename"], attachment["file_path"], attachment.get("size"))],
+                )
+
+            for row in cursor.execute("SELECT * FROM other.dead_letters").fetchall():
+                letter = dict(row)
+                del letter["id"]
+                letter["error_row_id"] = email_ids.get(letter["error_row_id"])
+                # the shard's journal runs are not merged, the same ids name other runs here
+                letter["run_id"] = None
+                self._insert_row(cursor, "dead_letters", letter)
+
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.execute("DETACH DATABASE other")
+
+        return merged
+
+    def _insert_row(self, cursor, table, row):
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        cursor.execute(
+            f"INSERT INTO main.{table} ({columns}) VALUES ({placeholders})",
+            tuple(row.values()),
+        )
+        return cursor.lastrowid
+
+    def get_skipped_attachments(self, email_id=None):
+        """Attachments skipped by the attachment policy, of one email or all."""
+        cursor = self.conn.cursor()
+        query = "SELECT * FROM attachments WHERE skipped_reason IS NOT NULL"
+        params = ()
+        if email_id is not None:
+            query += " AND email_id = ?"
+            params = (email_id,)
+        cursor.execute(query + " ORDER BY id", params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    def iter_emails(self, batch_size=1000):
+        """Yield every email row (without its body), fetched batch_size rows at a time."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, timestamp, sender, subject, date, category,
+                   has_attachments, attachment_count, error, engine
+            FROM emails ORDER BY id
+            """
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+
     def get_emails_by_category(self, category):
         """Get all emails in a specific category."""
         cursor = self.conn.cursor()
         cursor.execute("SELECT * FROM emails WHERE category = ?", (category,))
         return [dict(row) for row in cursor.fetchall()]
 
+    def get_labeled_emails(self, exclude=("General", "Internal", "ERROR")):
+        """
+        Yield (email_data, category) pairs labeled by the keyword rules,
+        used as training history for the statistical engine.
+        """
+        placeholders = ", ".join("?" for _ in exclude)
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT sender, subject, body, category
+            FROM emails
+            WHERE (error = '' OR error IS NULL)
+              AND (engine = 'rules' OR engine IS NULL)
+              AND category NOT IN ({placeholders})
+        """,
+            tuple(exclude),
+        )
+        for row in cursor:
+            email_data = {
+                "sender": row["sender"] or "",
+                "subject": row["subject"] or "",
+                "body": row["body"] or "",
+            }
+            yield email_data, row["category"]
+
+    def get_sender_history(self, exclude=("General", "Internal", "ERROR")):
+        """
+        Yield (sender, category, timestamp) of the emails labeled by the
+        keyword rules, used to build the sender reputation table.
+        """
+        placeholders = ", ".join("?" for _ in exclude)
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT sender, category, timestamp
+            FROM emails
+            WHERE (error = '' OR error IS NULL)
+              AND (engine = 'rules' OR engine IS NULL)
+              AND category NOT IN ({placeholders})
+        """,
+            tuple(exclude),
+        )
+        for row in cursor:
+            yield row["sender"] or "", row["category"], row["timestamp"]
+
+    def iter_explanations(self, batch_size=1000):
+        """Yield (category, explanation dict) of the emails stored with one."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT category, explanation FROM emails WHERE explanation IS NOT NULL ORDER BY id"
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row["category"], json.loads(row["explanation"])
+
     def get_statistics(self):
         """Get category statistics from database."""
         cursor = self.conn.cursor()
 
         cursor.execute("""
-            SELECT 
-                category,
-                COUNT(*) as count,
-                SUM(has_attachments) as attachment_count
-            FROM emails
-            WHERE error = '' OR error IS NULL
-            GROUP BY category
+            SELECT category, emails AS count, with_attachments AS attachment_count
+            FROM stats_category
+            WHERE emails > 0
             ORDER BY count DESC
         """)
 
@@ -128,15 +1158,13 @@ class EmailDatabase:
     def get_total_count(self):
         """Get total number of processed emails."""
         cursor = self.conn.cursor()
-        cursor.execute("SELECT COUNT(*) as total FROM emails")
+        cursor.execute("SELECT COALESCE(SUM(emails + errors), 0) AS total FROM stats_category")
         return cursor.fetchone()["total"]
 
     def get_error_count(self):
         """Get number of emails with errors."""
         cursor = self.conn.cursor()
-        cursor.execute(
-            "SELECT COUNT(*) as total FROM emails WHERE error != '' AND error IS NOT NULL"
-        )
+        cursor.execute("SELECT COALESCE(SUM(errors), 0) AS total FROM stats_category")
         return cursor.fetchone()["total"]
 
     def close(self):
@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Exported columns and their types, shared by the Parquet and NDJSON writers
+COLUMNS = (
+    ("id", "int64"),
+    ("timestamp", "timestamp"),
+    ("sent_at", "timestamp_utc"),
+    ("date", "string"),
+    ("sender", "string"),
+    ("subject", "string"),
+    ("category", "string"),
+    ("has_attachments", "bool"),
+    ("attachment_count", "int32"),
+    ("error", "string"),
+    ("engine", "string"),
+)
+
+
+def open_exporter(path, format="auto", row_group_size=10000):
+    """
+    Parquet exporter when pyarrow is installed (or format="parquet"),
+    gzip-compressed NDJSON exporter otherwise (or format="ndjson").
+    """
+    if format == "auto":
+        try:
+            import pyarrow  # noqa: F401
+            format = "parquet"
+        except ImportError:
+            logging.info("pyarrow is not installed, exporting as compressed NDJSON")
+            format = "ndjson"
+    if format == "parquet":
+        return ParquetExporter(path, row_group_size)
+    if format == "ndjson":
+        return NDJSONExporter(path, row_group_size)
+    raise ValueError(f"Unknown export format: {format!r}")
+
+
+def export_database(database, exporter):
+    """Write every email row of an EmailDatabase to an exporter and close it."""
+    count = 0
+    try:
+        for row in database.iter_emails():
+            exporter.write(row)
+            count += 1
+    finally:
+        exporter.close()
+    return count
+
+
+def email_row(email_id, email_data, category, has_attachments=False, error=None,
+              engine="rules"):
+    """Export row of an email being processed, shaped like its database row."""
+    return {
+        "id": email_id,
+        "timestamp": datetime.now().isoformat(),
+        "sender": email_data.get("sender") or "",
+        "subject": email_data.get("subject") or "",
+        "date": str(email_data.get("date") or ""),
+        "category": category,
+        "has_attachments": has_attachments,
+        "attachment_count": len(email_data.get("attachments") or []),
+        "error": error or "",
+        "engine": engine,
+    }
+
+
+def _parse_sent_at(value):
+    """UTC datetime of an email Date header, None if missing or malformed."""
+    if not value:
+        return None
+    from email.utils import parsedate_to_datetime
+
+    try:
+        sent_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if sent_at.tzinfo is None:
+        sent_at = sent_at.replace(tzinfo=timezone.utc)
+    return sent_at.astimezone(timezone.utc)
+
+
+class _PartitionedExporter(ABC):
+    """
+    Rows partitioned by category and week (category=Finance/week=2024-W23/,
+    the week of the email date, else of its processing), buffered and
+    written one row group of row_group_size rows at a time.
+    """
+
+    extension = ""
+
+    def __init__(self, path, row_group_size=10000):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.row_group_size = row_group_size
+        # files of different runs never collide
+        self._file_prefix = f"part-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self._buffers = {}
+        self.rows_written = 0
+
+    def write(self, row):
+        row = self._convert(row)
+        moment = row["sent_at"] or row["timestamp"] or datetime.now()
+        key = (row["category"] or "", moment.strftime("%Y-W%W"))
+        buffer = self._buffers.setdefault(key, [])
+        buffer.append(row)
+        if len(buffer) >= self.row_group_size:
+            self._flush(key)
+
+    @staticmethod
+    def _convert(row):
+        timestamp = row.get("timestamp")
+        if isinstance(timestamp, str):
+            try:
+                timestamp = datetime.fromisoformat(timestamp)
+            except ValueError:
+                timestamp = None
+        error = row.get("error") or None
+        return {
+            "id": int(row["id"]) if row.get("id") is not None else None,
+            "timestamp": timestamp,
+            "sent_at": _parse_sent_at(row.get("date")),
+            "date": row.get("date") or None,
+            "sender": row.get("sender") or None,
+            "subject": row.get("subject") or None,
+            "category": row.get("category"),
+            "has_attachments": bool(row.get("has_attachments")),
+            "attachment_count": int(row.get("attachment_count") or 0),
+            "error": error,
+            "engine": row.get("engine") or None,
+        }
+
+    def partition_path(self, key, part=0):
+        """File of a partition; part > 0 names the further files of this run."""
+        from urllib.parse import quote
+
+        category, week = key
+        directory = self.path / f"category={quote(category, safe=' ')}" / f"week={week}"
+        directory.mkdir(parents=True, exist_ok=True)
+        suffix = f"-{part}" if part else ""
+        return directory / f"{self._file_prefix}{suffix}{self.extension}"
+
+    def _flush(self, key):
+        rows = self._buffers.pop(key, None)
+        if rows:
+            self._write_rows(key, rows)
+            self.rows_written += len(rows)
+
+    @abstractmethod
+    def _write_rows(self, key, rows):
+        """Write one row group of a partition to its file."""
+
+    def close(self):
+        """Write the rows still buffered and close the files."""
+        for key in list(self._buffers):
+            self._flush(key)
+        logging.info(f"Exported {self.rows_written} emails to {self.path}")
+
+
+class ParquetExporter(_PartitionedExporter):
+    """
+    Partitioned Parquet files, one file per partition and run. At most
+    max_open_files writers stay open: the least recently used one is closed
+    and its partition continues in a new part file if it gets more rows.
+    """
+
+    extension = ".parquet"
+
+    def __init__(self, path, row_group_size=10000, max_open_files=64):
+        import pyarrow as pa
+
+        super().__init__(path, row_group_size)
+        types = {
+            "int64": pa.int64(),
+            "int32": pa.int32(),
+            "bool": pa.bool_(),
+            "string": pa.string(),
+            "timestamp": pa.timestamp("us"),
+            "timestamp_utc": pa.timestamp("us", tz="UTC"),
+        }
+        self.schema = pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+        self.max_open_files = max_open_files
+        # a Parquet file cannot be appended to, its writer stays open (least recent first)
+        self._writers = OrderedDict()
+        # partition -> part files written so far
+        self._parts = {}
+
+    def _write_rows(self, key, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = self._writers.get(key)
+        if writer is None:
+            if len(self._writers) >= self.max_open_files:
+                _, oldest = self._writers.popitem(last=False)
+                oldest.close()
+            part = self._parts.get(key, 0)
+            self._parts[key] = part + 1
+            writer = pq.ParquetWriter(
+                self.partition_path(key, part), self.schema, compression="zstd"
+            )
+            self._writers[key] = writer
+        else:
+            self._writers.move_to_end(key)
+        writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        super().close()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = OrderedDict()
+
+
+class NDJSONExporter(_PartitionedExporter):
+    """
+    Fallback without pyarrow: gzip-compressed JSON lines per partition, one
+    gzip member per row group, with the column types in _schema.json
+    (timestamps as ISO 8601 strings, null for missing values).
+    """
+
+    extension = ".ndjson.gz"
+
+    def __init__(self, path, row_group_size=10000):
+        super().__init__(path, row_group_size)
+        schema = {"format": "ndjson+gzip", "columns": [
+            {"name": name, "type": kind} for name, kind in COLUMNS
+        ]}
+        with open(self.path / "_schema.json", "w", encoding="utf-8") as f:
+            json.dump(schema, f, indent=2)
+
+    def _write_rows(self, key, rows):
+        import gzip
+
+        lines = "".join(
+            json.dumps(
+                {name: self._json_value(row[name]) for name, _ in COLUMNS},
+                ensure_ascii=False,
+            ) + "\n"
+            for row in rows
+        )
+        with gzip.open(self.partition_path(key), "at", encoding="utf-8") as f:
+            f.write(lines)
+
+    @staticmethod
+    def _json_value(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+
+def read_ndjson(path):
+    """Yield the rows of an NDJSON export, with their timestamps parsed back."""
+    import gzip
+
+    path = Path(path)
+    with open(path / "_schema.json", encoding="utf-8") as f:
+        columns = json.load(f)["columns"]
+    timestamps = [c["name"] for c in columns if c["type"].startswith("timestamp")]
+
+    for file_path in sorted(path.rglob("*.ndjson.gz")):
+        with gzip.open(file_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                for name in timestamps:
+                    if row[name] is not None:
+                        row[name] = datetime.fromisoformat(row[name])
+                yield row
@@ -1,9 +1,53 @@
-import csv
 import logging
+import sys
+import time
+from array import array
 from datetime import datetime
 from pathlib import Path
 from collections import defaultdict
 
+FIELDNAMES = [
+    "timestamp",
+    "sender",
+    "subject",
+    "date",
+    "category",
+    "has_attachments",
+    "attachment_count",
+    "error",
+]
+
+RULE_FIELDNAMES = [
+    "language",
+    "category",
+    "keyword",
+    "emails_matched",
+    "subject_hits",
+    "body_hits",
+    "decisive",
+    "hit_rate",
+]
+
+
+class ReportRecord:
+    """One row of the detail report."""
+
+    __slots__ = tuple(FIELDNAMES)
+
+    def __init__(self, timestamp, sender, subject, date, category,
+                 has_attachments, attachment_count, error):
+        self.timestamp = timestamp
+        self.sender = sender
+        self.subject = subject
+        self.date = date
+        self.category = category
+        self.has_attachments = has_attachments
+        self.attachment_count = attachment_count
+        self.error = error
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
 
 class ReportGenerator:
     """Generates CSV reports of processed emails and statistics."""
@@ -12,27 +56,37 @@ class ReportGenerator:
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
 
-        self.processed_emails = []
+        self._reset_columns()
         self.category_counts = defaultdict(int)
         self.error_count = 0
         self.attachment_count = 0
 
         logging.info(f"Report generator initialized: {self.base_path}")
 
-    def record_email(self, email_data, category, has_attachments=False, error=None):
+    def record_email(
+        self,
+        email_data,
+        category,
+        has_attachments=False,
+        error=None,
+        attachment_count=None,
+        thread_id=None,
+    ):
         """Record a processed email for reporting."""
-        record = {
-            "timestamp": datetime.now().isoformat(),
-            "sender": email_data.get("sender", ""),
-            "subject": email_data.get("subject", ""),
-            "date": email_data.get("date", ""),
-            "category": category,
-            "has_attachments": has_attachments,
-            "attachment_count": len(email_data.get("attachments", [])),
-            "error": error or "",
-        }
-
-        self.processed_emails.append(record)
+        if attachment_count is None:
+            attachment_count = len(email_data.get("attachments", []))
+        date = email_data.get("date")
+
+        # senders, categories and errors repeat a lot, keep one string of each
+        self._timestamps.append(time.time())
+        self._senders.append(sys.intern(email_data.get("sender") or ""))
+        self._subjects.append(email_data.get("subject") or "")
+        self._dates.append(str(date) if date else "")
+        self._categories.append(sys.intern(category))
+        self._has_attachments.append(1 if has_attachments else 0)
+        self._attachment_counts.append(attachment_count)
+        self._errors.append(sys.intern(error or ""))
+        self._thread_ids.append(thread_id or 0)
 
         if error:
             self.error_count += 1
@@ -41,9 +95,56 @@ class ReportGenerator:
             if has_attachments:
                 self.attachment_count += 1
 
+    def _reset_columns(self):
+        # one list or typed array per column rather than one dict per email,
+        # long runs keep every record until the reports are written
+        self._timestamps = array("d")
+        self._senders = []
+        self._subjects = []
+        self._dates = []
+        self._categories = []
+        self._has_attachments = array("b")
+        self._attachment_counts = array("L")
+        self._errors = []
+        # EmailDatabase thread of each email, 0 for none
+        self._thread_ids = array("q")
+
+    @property
+    def record_count(self):
+        return len(self._categories)
+
+    def _record(self, index):
+        return ReportRecord(
+            datetime.fromtimestamp(self._timestamps[index]).isoformat(),
+            self._senders[index],
+            self._subjects[index],
+            self._dates[index],
+            self._categories[index],
+            bool(self._has_attachments[index]),
+            self._attachment_counts[index],
+            self._errors[index],
+        )
+
+    @property
+    def processed_emails(self):
+        """The recorded emails as ReportRecord objects, in recording order."""
+        return [self._record(index) for index in range(self.record_count)]
+
+    def restore(self, email_rows):
+        """Rebuild the counters of an interrupted run from its stored email rows."""
+        for row in email_rows:
+            self.record_email(
+                row,
+                row["category"],
+                has_attachments=bool(row["has_attachments"]),
+                error=row["error"] or None,
+                attachment_count=row["attachment_count"],
+                thread_id=row.get("thread_id"),
+            )
+
     def generate_detail_report(self):
         """Generate one CSV with all emails, full columns, sorted by category then date then subject."""
-        if not self.processed_emails:
+        if not self.record_count:
             logging.warning("No emails processed, skipping report generation")
             return None
 
@@ -51,27 +152,19 @@ class ReportGenerator:
         week_str = now.strftime("%Y-W%W")
         report_filename = f"email_report_{week_str}.csv"
         report_path = self.base_path / report_filename
-        fieldnames = [
-            "timestamp",
-            "sender",
-            "subject",
-            "date",
-            "category",
-            "has_attachments",
-            "attachment_count",
-            "error",
-        ]
 
         try:
-            sorted_emails = sorted(
-                self.processed_emails,
-                key=lambda r: (r["category"], r.get("date", ""), r.get("subject", "")),
+            import csv
+
+            order = sorted(
+                range(self.record_count),
+                key=lambda i: (self._categories[i], self._dates[i], self._subjects[i]),
             )
             with open(report_path, "w", newline="", encoding="utf-8") as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
                 writer.writeheader()
-                for record in sorted_emails:
-                    writer.writerow(record)
+                for index in order:
+                    writer.writerow(self._record(index).to_dict())
 
             logging.info(f"Detail report generated: {report_path}")
             return report_path
@@ -82,7 +175,7 @@ class ReportGenerator:
 
     def generate_summary_report(self):
         """Generate summary CSV report with category statistics."""
-        if not self.processed_emails:
+        if not self.record_count:
             return None
 
         now = datetime.now()
@@ -91,13 +184,15 @@ class ReportGenerator:
         summary_path = self.base_path / summary_filename
 
         try:
+            import csv
+
             with open(summary_path, "w", newline="", encoding="utf-8") as csvfile:
                 fieldnames = ["category", "count", "percentage"]
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
                 writer.writeheader()
 
-                total = len(self.processed_emails) - self.error_count
+                total = self.record_count - self.error_count
                 if total > 0:
                     # Sort categories by count (descending)
                     sorted_categories = sorted(
@@ -118,7 +213,7 @@ class ReportGenerator:
 
                 if self.error_count > 0:
                     error_percentage = (
-                        self.error_count / len(self.processed_emails)
+                        self.error_count / self.record_count
                     ) * 100
                     writer.writerow(
                         {
@@ -131,13 +226,13 @@ class ReportGenerator:
                 writer.writerow(
                     {
                         "category": "TOTAL",
-                        "count": len(self.processed_emails),
+                        "count": self.record_count,
                         "percentage": "100.00%",
                     }
                 )
 
             logging.info(f"Summary report generated: {summary_path}")
-            logging.info(f"Total emails: {len(self.processed_emails)}")
+            logging.info(f"Total emails: {self.record_count}")
             logging.info(f"Categories: {dict(self.category_counts)}")
             logging.info(f"Attachments: {self.attachment_count}")
             logging.info(f"Errors: {self.error_count}")
@@ -148,16 +243,151 @@ class ReportGenerator:
             logging.error(f"Failed to generate summary report: {e}")
             return None
 
+    def thread_rollups(self):
+        """
+        Per-thread rollup of the recorded emails, largest threads first:
+        [{thread_id, subject, category, message_count, participants,
+          first_date, last_date}, ...]
+        """
+        threads = {}
+        for index in range(self.record_count):
+            thread_id = self._thread_ids[index]
+            if not thread_id:
+                continue
+            thread = threads.get(thread_id)
+            if thread is None:
+                thread = threads[thread_id] = {
+                    "thread_id": thread_id,
+                    "subject": self._subjects[index],
+                    "categories": defaultdict(int),
+                    "message_count": 0,
+                    "senders": set(),
+                    "timestamps": [],
+                }
+            thread["categories"][self._categories[index]] += 1
+            thread["message_count"] += 1
+            thread["senders"].add(self._senders[index])
+            thread["timestamps"].append(self._timestamps[index])
+
+        rollups = []
+        for thread in threads.values():
+            rollups.append({
+                "thread_id": thread["thread_id"],
+                "subject": thread["subject"],
+                # most common category, the first one recorded on a tie
+                "category": max(thread["categories"], key=thread["categories"].get),
+                "message_count": thread["message_count"],
+                "participants": len(thread["senders"]),
+                "first_date": datetime.fromtimestamp(min(thread["timestamps"])).isoformat(),
+                "last_date": datetime.fromtimestamp(max(thread["timestamps"])).isoformat(),
+            })
+        rollups.sort(key=lambda rollup: (-rollup["message_count"], rollup["thread_id"]))
+        return rollups
+
+    def generate_thread_report(self):
+        """Generate CSV report with one row per conversation thread."""
+        rollups = self.thread_rollups()
+        if not rollups:
+            return None
+
+        now = datetime.now()
+        week_str = now.strftime("%Y-W%W")
+        thread_path = self.base_path / f"thread_report_{week_str}.csv"
+
+        try:
+            import csv
+
+            with open(thread_path, "w", newline="", encoding="utf-8") as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=list(rollups[0]))
+                writer.writeheader()
+                writer.writerows(rollups)
+
+            logging.info(f"Thread report generated: {thread_path} ({len(rollups)} threads)")
+            return thread_path
+
+        except Exception as e:
+            logging.error(f"Failed to generate thread report: {e}")
+            return None
+
+    def generate_rule_report(self, explanations, keywords):
+        """
+        Generate CSV report of how often each keyword rule fires.
+        :param explanations: (category, explanation) of the explained emails,
+            see EmailDatabase.iter_explanations
+        :param keywords: (language, category, keyword) of every rule, see
+            EmailClassifier.keywords; rules that never fired get a 0 row
+        """
+        hits = {}
+        total = 0
+        for category, explanation in explanations:
+            total += 1
+            seen = set()
+            for matched_category, keyword, field, _ in explanation["matches"]:
+                counts = hits.setdefault(
+                    (matched_category, keyword),
+                    {"emails": 0, "subject": 0, "body": 0, "decisive": 0},
+                )
+                counts[field] += 1
+                if (matched_category, keyword) not in seen:
+                    seen.add((matched_category, keyword))
+                    counts["emails"] += 1
+                    if matched_category == category:
+                        counts["decisive"] += 1
+        if not total:
+            logging.warning("No explained emails, skipping rule report generation")
+            return None
+
+        now = datetime.now()
+        week_str = now.strftime("%Y-W%W")
+        rule_path = self.base_path / f"rule_hits_{week_str}.csv"
+
+        rows = []
+        for language, category, keyword in keywords:
+            counts = hits.get((category, keyword), {})
+            emails = counts.get("emails", 0)
+            rows.append({
+                "language": language,
+                "category": category,
+                "keyword": keyword,
+                "emails_matched": emails,
+                "subject_hits": counts.get("subject", 0),
+                "body_hits": counts.get("body", 0),
+                # matched emails that ended in the rule's category
+                "decisive": counts.get("decisive", 0),
+                "hit_rate": f"{emails / total * 100:.2f}%",
+            })
+        rows.sort(key=lambda row: (-row["emails_matched"], row["language"], row["category"]))
+
+        try:
+            import csv
+
+            with open(rule_path, "w", newline="", encoding="utf-8") as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=RULE_FIELDNAMES)
+                writer.writeheader()
+                writer.writerows(rows)
+
+            unused = sum(1 for row in rows if not row["emails_matched"])
+            logging.info(
+                f"Rule report generated: {rule_path} "
+                f"({total} emails, {unused} of {len(rows)} rules never matched)"
+            )
+            return rule_path
+
+        except Exception as e:
+            logging.error(f"Failed to generate rule report: {e}")
+            return None
+
     def generate_reports(self):
-        """Generate detail report (all emails, sorted by category) and summary report."""
+        """Generate detail report (all emails, sorted by category), summary report and thread report."""
         return (
             self.generate_detail_report(),
             self.generate_summary_report(),
+            self.generate_thread_report(),
         )
 
     def reset(self):
         """Reset statistics for a new reporting period."""
-        self.processed_emails = []
+        self._reset_columns()
         self.category_counts = defaultdict(int)
         self.error_count = 0
         self.attachment_count = 0
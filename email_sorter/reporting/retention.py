@@ -0,0 +1,282 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+RULE_KEYS = frozenset({
+    "archive_after_days",
+    "delete_after_days",
+    "attachments_after_days",
+    "attachments",
+})
+ATTACHMENT_ACTIONS = ("keep", "compress", "delete")
+# formats gzip cannot shrink, left as they are by the compress action
+COMPRESSED_EXTENSIONS = frozenset({
+    ".gz", ".zip", ".7z", ".rar", ".bz2", ".xz", ".zst", ".jpg", ".jpeg", ".png", ".gif",
+    ".webp", ".mp3", ".mp4", ".mov", ".avi", ".docx", ".xlsx", ".pptx", ".odt", ".ods",
+})
+
+
+class RetentionPolicy:
+    """
+    How long emails and attachments are kept, per category.
+    A policy file holds a default rule and per-category overrides:
+        {"default": {"archive_after_days": 180, "attachments_after_days": 365,
+                     "attachments": "compress"},
+         "categories": {"Newsletter": {"delete_after_days": 30, "attachments": "delete",
+                                       "attachments_after_days": 7},
+                        "Finance": {"archive_after_days": null}}}
+    archive_after_days moves the bodies to the archive database,
+    delete_after_days deletes the emails, attachments_after_days applies the
+    attachments action ("keep", "compress" with gzip, "delete" the file).
+    A missing or null age never expires. A category rule is the default rule
+    updated with the category's keys.
+    """
+
+    def __init__(self, default=None, categories=None):
+        self.default = self._normalize(default or {})
+        self.categories = {
+            category: self._normalize({**(default or {}), **rule})
+            for category, rule in (categories or {}).items()
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config.get("default"), config.get("categories"))
+
+    @staticmethod
+    def _normalize(rule):
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown retention policy keys: {', '.join(sorted(unknown))}")
+        action = rule.get("attachments") or "keep"
+        if action not in ATTACHMENT_ACTIONS:
+            raise ValueError(f"Unknown attachments action: {action!r}")
+        normalized = {"attachments": action}
+        for key in ("archive_after_days", "delete_after_days", "attachments_after_days"):
+            days = rule.get(key)
+            if days is not None and days < 0:
+                raise ValueError(f"{key} must not be negative")
+            normalized[key] = days
+        return normalized
+
+    def rule(self, category):
+        return self.categories.get(category, self.default)
+
+
+class BodyArchive:
+    """Cold archive database of the email bodies, zlib compressed, by email id."""
+
+    def __init__(self, db_path="output/archive.db"):
+        import sqlite3
+
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS bodies (
+                email_id INTEGER PRIMARY KEY,
+                category TEXT,
+                timestamp TEXT,
+                body BLOB,
+                archived_at TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def store(self, category, emails):
+        """Archive (id, timestamp, body) email dicts; storing one again replaces it."""
+        now = datetime.now().isoformat()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO bodies VALUES (?, ?, ?, ?, ?)",
+            [
+                (email["id"], category, email["timestamp"],
+                 zlib.compress(email["body"].encode("utf-8")), now)
+                for email in emails
+            ],
+        )
+        self.conn.commit()
+
+    def get(self, email_id):
+        """Archived body of an email, None if it is not archived."""
+        row = self.conn.execute(
+            "SELECT body FROM bodies WHERE email_id = ?", (email_id,)
+        ).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def delete(self, email_ids):
+        self.conn.executemany(
+            "DELETE FROM bodies WHERE email_id = ?", [(email_id,) for email_id in email_ids]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class RetentionRun:
+    """
+    Applies a RetentionPolicy to an EmailDatabase and its attachment folders.
+    Every step works batch_size rows per transaction, sleeping `pause`
+    seconds between two batches, so a live ingestion run is never locked
+    out of the database for long.
+    """
+
+    def __init__(self, database, policy, archive, attachments_path="output/attachments",
+                 batch_size=500, pause=0.0, now=None, convert_vacuum=False):
+        self.database = database
+        self.policy = policy
+        self.archive = archive
+        self.attachments_path = Path(attachments_path)
+        self.batch_size = batch_size
+        self.pause = pause
+        self.now = now or datetime.now()
+        # allow the one-off full VACUUM an older database needs for incremental vacuum
+        self.convert_vacuum = convert_vacuum
+        self.counts = dict.fromkeys((
+            "archived", "deleted", "attachments_compressed", "attachments_deleted",
+            "attachments_missing", "orphan_files",
+        ), 0)
+
+    def run(self):
+        """Apply every step, then vacuum. :return: Counts of what was done"""
+        for category in self.database.get_categories():
+            rule = self.policy.rule(category)
+            if rule["delete_after_days"] is not None:
+                self.delete_emails(category, self._cutoff(rule["delete_after_days"]))
+            if rule["archive_after_days"] is not None:
+                self.archive_bodies(category, self._cutoff(rule["archive_after_days"]))
+            if rule["attachments_after_days"] is not None and rule["attachments"] != "keep":
+                self.expire_attachments(
+                    category, self._cutoff(rule["attachments_after_days"]), rule["attachments"]
+                )
+        self.sync_attachments()
+        self.vacuum()
+        return self.counts
+
+    def _cutoff(self, days):
+        return (self.now - timedelta(days=days)).isoformat()
+
+    def _batches(self, find):
+        """Yield the batches find(after_id) returns, until an empty one."""
+        after_id = 0
+        while True:
+            rows = find(after_id)
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1]["id"]
+            if self.pause:
+                time.sleep(self.pause)
+
+    def delete_emails(self, category, before):
+        batches = self._batches(
+            lambda after_id: self.database.find_emails_before(
+                category, before, self.batch_size, after_id
+            )
+        )
+        for emails in batches:
+            email_ids = [email["id"] for email in emails]
+            for file_path in self.database.get_attachment_paths(email_ids):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+            self.database.delete_emails(email_ids)
+            self.archive.delete(email_ids)
+            self.counts["deleted"] += len(email_ids)
+
+    def archive_bodies(self, category, before):
+        batches = self._batches(
+            lambda after_id: self.database.find_emails_before(
+                category, before, self.batch_size, after_id, unarchived=True
+            )
+        )
+        for emails in batches:
+            # committed to the archive first: a crash in between archives them again
+            self.archive.store(category, emails)
+            self.database.mark_archived([email["id"] for email in emails])
+            self.counts["archived"] += len(emails)
+
+    def expire_attachments(self, category, before, action):
+        batches = self._batches(
+            lambda after_id: self.database.find_attachments_before(
+                category, before, self.batch_size, after_id
+            )
+        )
+        for attachments in batches:
+            updates = []
+            for attachment in attachments:
+                update = self._expire_file(attachment, action)
+                if update is not None:
+                    updates.append(update)
+            self.database.update_attachment_files(updates)
+
+    def _expire_file(self, attachment, action):
+        """:return: (id, file_path, skipped_reason) if the attachment row changes"""
+        path = attachment["file_path"]
+        if not os.path.exists(path):
+            self.counts["attachments_missing"] += 1
+            return attachment["id"], None, "missing"
+        try:
+            if action == "delete":
+                os.remove(path)
+                self.counts["attachments_deleted"] += 1
+                return attachment["id"], None, "expired"
+            if Path(path).suffix.lower() in COMPRESSED_EXTENSIONS:
+                return None
+            compressed = path + ".gz"
+            with open(path, "rb") as source, gzip.open(compressed, "wb") as target:
+                shutil.copyfileobj(source, target)
+        except FileNotFoundError:
+            # removed since the exists() check, e.g. by a concurrent prune
+            self.counts["attachments_missing"] += 1
+            return attachment["id"], None, "missing"
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.counts["attachments_compressed"] += 1
+        return attachment["id"], compressed, None
+
+    def sync_attachments(self):
+        """
+        Clear the file_path of attachment rows whose file is gone, and count
+        the files of the attachment folders no row refers to (left in place).
+        """
+        known = set()
+        missing = []
+        for attachment_id, file_path in self.database.iter_attachment_files(self.batch_size):
+            if os.path.exists(file_path):
+                known.add(os.path.normcase(os.path.abspath(file_path)))
+                continue
+            missing.append((attachment_id, None, "missing"))
+            if len(missing) >= self.batch_size:
+                self.database.update_attachment_files(missing)
+                self.counts["attachments_missing"] += len(missing)
+                missing = []
+        if missing:
+            self.database.update_attachment_files(missing)
+            self.counts["attachments_missing"] += len(missing)
+
+        if self.attachments_path.is_dir():
+            for root, _, files in os.walk(self.attachments_path):
+                for name in files:
+                    path = os.path.normcase(os.path.abspath(os.path.join(root, name)))
+                    if path not in known:
+                        self.counts["orphan_files"] += 1
+                        logging.debug(f"Attachment file without a database row: {path}")
+
+    def vacuum(self, pages=None):
+        """Free the pages of the deleted rows, pages (default batch_size) at a time."""
+        pages = pages or self.batch_size
+        while self.database.incremental_vacuum(pages, convert=self.convert_vacuum):
+            if self.pause:
+                time.sleep(self.pause)
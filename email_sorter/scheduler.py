@@ -0,0 +1,279 @@
+import collections
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from imap import IMAPClient, IMAPClientError, CircuitOpenError
+from pipeline import MailboxRun
+from utils import CircuitBreaker
+
+
+def load_fleet_config(config_path):
+    """
+    Read the accounts and folders to ingest from a JSON file:
+    {"accounts": [{"name": "support", "server": "imap.example.com", "port": 993,
+                   "email": "support@example.com", "password_env": "SUPPORT_PASSWORD",
+                   "max_connections": 2, "folders": ["INBOX", "Billing"]}]}
+    Passwords are read from the environment variable named by password_env
+    (or given directly as password).
+    """
+    with open(config_path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    accounts = []
+    for index, entry in enumerate(config.get("accounts", [])):
+        password = entry.get("password")
+        if entry.get("password_env"):
+            password = os.getenv(entry["password_env"])
+        accounts.append(
+            {
+                "name": entry.get("name") or entry.get("email") or f"account{index}",
+                "server": entry.get("server"),
+                "port": entry.get("port"),
+                "email": entry.get("email"),
+                "password": password,
+                "max_connections": int(entry.get("max_connections", 2)),
+                "folders": entry.get("folders") or ["INBOX"],
+            }
+        )
+    return accounts
+
+
+class ConnectionPool:
+    """Up to `size` logged-in IMAP connections to one account, reused across batches."""
+
+    def __init__(self, account, size):
+        self.account = account
+        # every connection to the account trips and waits on the same breaker
+        self.breaker = CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Return a connected client, or None if every slot is still busy after timeout."""
+        if not self.reserve(timeout):
+            return None
+        return self.connect()
+
+    def reserve(self, timeout=None):
+        """Take a connection slot, blocking up to timeout (0 = only if one is free)."""
+        if timeout == 0:
+            return self._slots.acquire(blocking=False)
+        return self._slots.acquire(timeout=timeout)
+
+    def connect(self):
+        """Connected client for a reserved slot, the slot is given back if connecting fails."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            client = IMAPClient(
+                server=self.account["server"],
+                port=self.account["port"],
+                email=self.account["email"],
+                password=self.account["password"],
+                use_uid=True,
+                breaker=self.breaker,
+            )
+            client.connect()
+            return client
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, client, broken=False):
+        """Give a connection back, or drop it if it can no longer be trusted."""
+        if broken:
+            try:
+                client.logout()
+            except Exception:
+                pass
+        else:
+            with self._lock:
+                self._idle.append(client)
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for client in idle:
+            try:
+                client.logout()
+            except Exception:
+                pass
+
+
+class FleetScheduler:
+    """
+    Ingests every folder of every account concurrently into one processor.
+    Mailboxes are processed in batches taken round-robin from a shared queue,
+    so a huge mailbox goes back to the end of the queue after each batch
+    instead of holding a worker until it is empty. A mailbox never holds a
+    worker while it waits: one whose account has no free connection is
+    parked until a connection is released, one whose server is down is
+    kept in a heap until its breaker's retry time.
+    """
+
+    def __init__(self, processor, accounts, workers=4, batch_size=25,
+                 status="UNSEEN", limit=None, resume=False, max_deferrals=10,
+                 incremental=False):
+        self.processor = processor
+        self.accounts = accounts
+        self.workers = workers
+        self.batch_size = batch_size
+        self.status = status
+        self.limit = limit
+        self.resume = resume
+        self.incremental = incremental
+        # times a mailbox waits for its account's circuit breaker before giving up
+        self.max_deferrals = max_deferrals
+        self._deferrals = {}
+        self.pools = {
+            account["name"]: ConnectionPool(account, account["max_connections"])
+            for account in accounts
+        }
+        self._cond = threading.Condition()
+        self._ready = collections.deque()
+        # (due time, sequence, job) of the deferred mailboxes
+        self._delayed = []
+        # account name -> jobs waiting for a free connection
+        self._waiting = {name: collections.deque() for name in self.pools}
+        # jobs ready, delayed, waiting or running; the run ends when none is left
+        self._outstanding = 0
+        self._sequence = itertools.count()
+
+    def run(self):
+        """Process every mailbox and return once they are all done."""
+        for account in self.accounts:
+            for folder in account["folders"]:
+                run = MailboxRun(
+                    self.processor,
+                    folder,
+                    self.status,
+                    limit=self.limit,
+                    resume=self.resume,
+                    name=f"{account['name']}/{folder}",
+                    incremental=self.incremental,
+                )
+                self._schedule((account["name"], run, False))
+
+        threads = [
+            threading.Thread(target=self._worker, name=f"fleet-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for pool in self.pools.values():
+            pool.close()
+
+    def _schedule(self, job, delay=0):
+        with self._cond:
+            self._outstanding += 1
+            if delay:
+                heapq.heappush(
+                    self._delayed, (time.monotonic() + delay, next(self._sequence), job)
+                )
+            else:
+                self._ready.append(job)
+            self._cond.notify()
+
+    def _next_job(self):
+        """Next ready job, waiting for a deferred one to be due; None once all are done."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._delayed)[2])
+                if self._ready:
+                    return self._ready.popleft()
+                if not self._outstanding:
+                    return None
+                self._cond.wait(self._delayed[0][0] - now if self._delayed else None)
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._run_batch(*job)
+            finally:
+                with self._cond:
+                    self._outstanding -= 1
+                    self._cond.notify_all()
+
+    def _release(self, account_name, client=None, broken=False):
+        """Give a connection slot back and wake a mailbox waiting for it."""
+        pool = self.pools[account_name]
+        if client is not None:
+            pool.release(client, broken=broken)
+        with self._cond:
+            waiting = self._waiting[account_name]
+            if waiting:
+                self._ready.append(waiting.popleft())
+                self._cond.notify()
+
+    def _run_batch(self, account_name, run, started):
+        pool = self.pools[account_name]
+        with self._cond:
+            # reserving under the condition: a slot released meanwhile wakes this job
+            if not pool.reserve(timeout=0):
+                # account at its connection limit, parked until a connection is released
+                self._waiting[account_name].append((account_name, run, started))
+                self._outstanding += 1
+                return
+        try:
+            client = pool.connect()
+        except CircuitOpenError as e:
+            self._release(account_name)
+            self._defer(account_name, run, started, e)
+            return
+        except IMAPClientError as e:
+            self._release(account_name)
+            logging.error(f"[{run.name}] IMAP connection failed: {e}")
+            return
+
+        broken = False
+        circuit_open = None
+        try:
+            if started:
+                run.reselect(client)
+            else:
+                run.start(client)
+            remaining = run.process_batch(client, self.batch_size)
+        except CircuitOpenError as e:
+            broken = True
+            circuit_open = e
+        except Exception as e:
+            logging.error(f"[{run.name}] mailbox run failed: {e}", exc_info=True)
+            broken = True
+            return
+        finally:
+            self._release(account_name, client, broken=broken)
+
+        if circuit_open:
+            self._defer(account_name, run, started, circuit_open)
+        elif remaining:
+            self._schedule((account_name, run, True))
+        else:
+            run.finish()
+            logging.info(f"[{run.name}] done")
+
+    def _defer(self, account_name, run, started, error):
+        """Requeue a mailbox for when its account's circuit breaker lets calls through again."""
+        deferrals = self._deferrals.get(run.name, 0) + 1
+        self._deferrals[run.name] = deferrals
+        if deferrals > self.max_deferrals:
+            logging.error(f"[{run.name}] giving up, server still unavailable: {error}")
+            return
+
+        delay = max(self.pools[account_name].breaker.retry_after(), 1)
+        logging.warning(f"[{run.name}] {error}, retrying in {delay:.0f}s")
+        self._schedule((account_name, run, started), delay)
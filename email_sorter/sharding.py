@@ -0,0 +1,182 @@
+import logging
+import os
+import socket
+import time
+from pathlib import Path
+
+from imap import IMAPClientError
+from pipeline import MailboxRun
+from workqueue import DONE, FAILED, MERGED, split_into_shards
+
+
+def publish_shards(client, work_queue, mailbox="INBOX", status="UNSEEN", shard_size=500):
+    """
+    Coordinator: split the UIDs of a mailbox matching `status` into shards
+    of consecutive UIDs and publish them to the work queue.
+    :return: The published (first_uid, last_uid) ranges
+    """
+    client.select_mailbox(mailbox)
+    ranges = split_into_shards(client.search(status), shard_size)
+    work_queue.publish(mailbox, status, ranges)
+    logging.info(f"Published {len(ranges)} shards of {mailbox} ({status})")
+    return ranges
+
+
+class ShardWorker:
+    """
+    Claims shards from the work queue and processes each of them into its
+    own partial database, renewing its lease between batches.
+    Each lease writes to its own shard_<id>.<attempt>.db.part file, renamed
+    to shard_<id>.db only while the lease is still held, so a worker that
+    lost its lease never writes into the file of the new lease holder.
+    A shard reclaimed after a worker died resumes from a copy of the
+    previous attempt's checkpoint journal.
+    A shard failing with IMAP errors is handed back to the queue, and marked
+    failed after max_attempts claims; the worker itself stops after
+    max_failures IMAP failures in a row (bad credentials, server down).
+    """
+
+    def __init__(self, work_queue, client_factory, processor_factory,
+                 shard_dir="output/shards", lease_seconds=300, batch_size=25,
+                 poll_interval=5, worker_id=None, max_attempts=3, max_failures=5):
+        self.work_queue = work_queue
+        # client_factory() -> connected IMAPClient in UID mode
+        self.client_factory = client_factory
+        # processor_factory(db_path) -> EmailProcessor writing to that database
+        self.processor_factory = processor_factory
+        self.shard_dir = Path(shard_dir)
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.max_attempts = max_attempts
+        self.max_failures = max_failures
+
+    def run(self):
+        """
+        Process shards until every shard of the queue is done or failed, or
+        until max_failures IMAP failures in a row. Returns the count processed.
+        """
+        processed = 0
+        failures = 0
+        while True:
+            shard = self.work_queue.claim(self.worker_id, self.lease_seconds)
+            if shard is None:
+                unfinished = [
+                    s for s in self.work_queue.shards()
+                    if s["status"] not in (DONE, MERGED, FAILED)
+                ]
+                if not unfinished:
+                    return processed
+                # other workers hold the remaining leases, wait in case one of them dies
+                time.sleep(self.poll_interval)
+                continue
+
+            try:
+                done = self.process_shard(shard)
+            except IMAPClientError as e:
+                logging.error(f"[{self.worker_id}] shard {shard['id']} failed: {e}")
+                if shard["attempts"] >= self.max_attempts:
+                    logging.error(
+                        f"[{self.worker_id}] giving up on shard {shard['id']} "
+                        f"after {shard['attempts']} attempts"
+                    )
+                    self.work_queue.fail(shard["id"], self.worker_id)
+                else:
+                    # server trouble: hand the shard back for a later attempt
+                    self.work_queue.release(shard["id"], self.worker_id)
+                failures += 1
+                if failures >= self.max_failures:
+                    logging.error(
+                        f"[{self.worker_id}] stopping after {failures} IMAP failures in a row"
+                    )
+                    return processed
+                time.sleep(self.poll_interval)
+                continue
+            failures = 0
+            if done:
+                processed += 1
+
+    def process_shard(self, shard):
+        """Process one claimed shard. Returns False if the lease was lost on the way."""
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        result_path = self.shard_dir / f"shard_{shard['id']}.db"
+        work_path = self.shard_dir / f"shard_{shard['id']}.{shard['attempts']}.db.part"
+        logging.info(
+            f"[{self.worker_id}] shard {shard['id']}: UIDs {shard['first_uid']}:{shard['last_uid']} "
+            f"(attempt {shard['attempts']})"
+        )
+        self._resume_from_previous_attempt(shard, work_path)
+
+        processor = self.processor_factory(work_path)
+        try:
+            with self.client_factory() as client:
+                run = MailboxRun(
+                    processor,
+                    shard["mailbox"],
+                    f"UID {shard['first_uid']}:{shard['last_uid']} {shard['criteria']}",
+                    resume=True,
+                    name=f"shard-{shard['id']}",
+                )
+                run.start(client)
+                while run.process_batch(client, self.batch_size):
+                    if not self.work_queue.renew(shard["id"], self.worker_id, self.lease_seconds):
+                        logging.warning(f"[{self.worker_id}] lost the lease of shard {shard['id']}")
+                        return False
+                run.finish()
+        finally:
+            processor.close(generate_reports=False)
+
+        # a renewed lease cannot be taken over for lease_seconds: time to publish the result
+        if not self.work_queue.renew(shard["id"], self.worker_id, self.lease_seconds):
+            logging.warning(f"[{self.worker_id}] shard {shard['id']} was reclaimed before completion")
+            return False
+        work_path.replace(result_path)
+        if not self.work_queue.complete(shard["id"], self.worker_id, result_path):
+            logging.warning(f"[{self.worker_id}] shard {shard['id']} was reclaimed before completion")
+            return False
+        for stale in self.shard_dir.glob(f"shard_{shard['id']}.*.db.part"):
+            stale.unlink(missing_ok=True)
+        return True
+
+    def _resume_from_previous_attempt(self, shard, work_path):
+        """Seed a reclaimed shard's file with a consistent copy of the latest earlier attempt."""
+        import sqlite3
+
+        previous = [
+            path for path in self.shard_dir.glob(f"shard_{shard['id']}.*.db.part")
+            if path != work_path
+        ]
+        if not previous or work_path.exists():
+            return
+        latest = max(previous, key=lambda path: int(path.name.split(".")[1]))
+        # backup API: a worker still writing to it cannot leave a torn copy
+        source = sqlite3.connect(str(latest))
+        target = sqlite3.connect(str(work_path))
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        logging.info(f"[{self.worker_id}] shard {shard['id']}: resuming from {latest.name}")
+
+
+def merge_shards(work_queue, database, report_generator):
+    """
+    Merge the partial databases of the done shards into the main database
+    and record their emails in the report.
+    :return: Number of shards merged
+    """
+    for shard in work_queue.shards(status=FAILED):
+        logging.warning(
+            f"Shard {shard['id']} failed after {shard['attempts']} attempts, "
+            f"UIDs {shard['first_uid']}:{shard['last_uid']} were not ingested"
+        )
+    merged = 0
+    for shard in work_queue.shards(status=DONE):
+        rows = database.merge_from(shard["result_path"])
+        report_generator.restore(rows)
+        work_queue.mark_merged(shard["id"])
+        logging.info(f"Merged shard {shard['id']}: {len(rows)} emails")
+        merged += 1
+    return merged
@@ -1,3 +1,18 @@
-from .logger import setup_logger
+from .env import load_env
+from .logger import log_sampling, setup_logger, stop_logger
+from .metrics import Metrics, metrics
+from .retry import backoff_delay, CircuitBreaker
+from .text import head_tail, parse_size
 
-__all__ = ["setup_logger"]
+__all__ = [
+    "load_env",
+    "setup_logger",
+    "stop_logger",
+    "log_sampling",
+    "Metrics",
+    "metrics",
+    "backoff_delay",
+    "CircuitBreaker",
+    "head_tail",
+    "parse_size",
+]
@@ -0,0 +1,11 @@
+_loaded = False
+
+
+def load_env():
+    """Load the .env file into os.environ, once, on first use instead of at import time."""
+    global _loaded
+    if not _loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _loaded = True
@@ -1,7 +1,140 @@
+import atexit
+import json
 import logging
+import zlib
+from datetime import datetime
 
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+# LogRecord attributes added by the pipeline (logging.info(..., extra={...}))
+RECORD_FIELDS = ("email_id", "stage")
 
-def setup_logger():
-    logging.basicConfig(
-        level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s"
-    )
+
+class LogSampling:
+    """
+    Share of the emails whose per-email INFO lines are logged. Below 1
+    (bulk mode) the pipeline logs aggregate counters every summary_every
+    emails instead.
+    """
+
+    def __init__(self, rate=1.0, summary_every=1000):
+        self.rate = rate
+        self.summary_every = summary_every
+
+    @property
+    def bulk(self):
+        return self.rate < 1
+
+    def keeps(self, email_id):
+        """Same answer for every line of an email, so sampled emails are logged whole."""
+        if self.rate >= 1:
+            return True
+        return zlib.crc32(str(email_id).encode()) % 10000 < self.rate * 10000
+
+
+# process-wide sampling, configured by setup_logger
+log_sampling = LogSampling()
+
+
+class SamplingFilter(logging.Filter):
+    """Drops the per-email records (those with an email_id) of the emails not sampled."""
+
+    def filter(self, record):
+        email_id = getattr(record, "email_id", None)
+        if email_id is None or record.levelno >= logging.WARNING:
+            return True
+        return log_sampling.keeps(email_id)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the email_id and stage fields when present."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in RECORD_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _record_queue_handler(log_queue):
+    """
+    QueueHandler whose records keep their exception for the formatter of the
+    logging thread (the standard prepare() folds the traceback into the
+    message and drops exc_info). Built here: logging.handlers is slow to import.
+    """
+    import copy
+    from logging.handlers import QueueHandler
+
+    class RecordQueueHandler(QueueHandler):
+        def prepare(self, record):
+            # only the message is merged with its arguments now
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            return record
+
+    return RecordQueueHandler(log_queue)
+
+
+_queue_handler = None
+_listener = None
+
+
+def setup_logger(level=None, json_format=None, sample_rate=None, stream=None):
+    """
+    Log through a queue: callers only enqueue their records, a background
+    thread formats and writes them (to stream, stderr by default).
+    :param level: Root level name or number, INFO by default
+    :param json_format: JSON lines instead of text lines
+    :param sample_rate: Share of the emails whose per-email lines are kept, see LogSampling
+    Once configured, a call without arguments keeps the configuration.
+    """
+    global _queue_handler, _listener
+    import queue
+    from logging.handlers import QueueListener
+
+    options = (level, json_format, sample_rate, stream)
+    if _listener is not None and all(option is None for option in options):
+        return _listener
+    stop_logger()
+
+    if sample_rate is not None:
+        log_sampling.rate = sample_rate
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JSONFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _record_queue_handler(log_queue)
+    # sampled out records are dropped before they are queued
+    _queue_handler.addFilter(SamplingFilter())
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level or logging.INFO)
+
+    _listener = QueueListener(log_queue, handler)
+    _listener.start()
+    return _listener
+
+
+def stop_logger():
+    """Write the queued records and stop the logging thread."""
+    global _queue_handler, _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+atexit.register(stop_logger)
@@ -0,0 +1,31 @@
+import threading
+from collections import Counter
+
+
+class Metrics:
+    """Named counters shared by the pipeline components (thread-safe)."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counts[name] += value
+
+    def get(self, name):
+        with self._lock:
+            return self._counts[name]
+
+    def snapshot(self):
+        """Return a plain dict copy of every counter."""
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+# process-wide registry
+metrics = Metrics()
@@ -0,0 +1,83 @@
+import random
+import threading
+import time
+
+
+def backoff_delay(attempt, base_delay, max_delay=None, jitter=False):
+    """
+    Exponential backoff: base_delay, 2 * base_delay, 4 * base_delay... capped at max_delay.
+    With jitter the delay is drawn between half and all of that value, so
+    clients that failed together do not all retry at the same instant.
+    """
+    delay = base_delay * 2 ** max(attempt - 1, 0)
+    if max_delay is not None:
+        delay = min(delay, max_delay)
+    if jitter:
+        delay = random.uniform(delay / 2, delay)
+    return delay
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while (thread-safe).
+    After failure_threshold consecutive failures the circuit opens and
+    allow() refuses calls for reset_timeout seconds; then a single trial
+    call is let through (half-open), which closes the circuit on success
+    or opens it again on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=60, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self.clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """True if a call may be attempted now."""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def retry_after(self):
+        """Seconds until the next call is allowed, 0 if it is allowed now."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(self._opened_at + self.reset_timeout - self.clock(), 0)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+            self._trial_running = False
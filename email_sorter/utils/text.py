@@ -0,0 +1,25 @@
+import re
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def head_tail(text, limit):
+    """
+    Keep at most `limit` items of `text` (str or bytes): the first half and the last half.
+    Returns (window, truncated).
+    """
+    if limit is None or len(text) <= limit:
+        return text, False
+
+    head = limit - limit // 2
+    tail = limit // 2
+    separator = b"\n" if isinstance(text, bytes) else "\n"
+    return text[:head] + separator + (text[-tail:] if tail else text[:0]), True
+
+
+def parse_size(text):
+    """Parse a size such as 500, 20K or 5M into bytes."""
+    match = re.fullmatch(r"\s*(\d+)\s*([KMG]?)B?\s*", str(text).upper())
+    if not match:
+        raise ValueError(f"Invalid size: {text!r}")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
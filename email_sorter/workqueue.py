@@ -0,0 +1,333 @@
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Shard statuses
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+MERGED = "merged"
+# given up after too many attempts, left out of the run
+FAILED = "failed"
+
+
+def split_into_shards(uids, shard_size):
+    """Split a list of UIDs into consecutive (first_uid, last_uid) ranges of shard_size UIDs."""
+    uids = sorted(int(uid) for uid in uids)
+    return [
+        (chunk[0], chunk[-1])
+        for chunk in (uids[i:i + shard_size] for i in range(0, len(uids), shard_size))
+    ]
+
+
+def open_work_queue(location):
+    """SQLite queue for a *.db path, local-file queue for a directory."""
+    if str(location).endswith(".db"):
+        return SQLiteWorkQueue(location)
+    return FileWorkQueue(location)
+
+
+class SQLiteWorkQueue:
+    """
+    Shard queue in a SQLite file shared by the coordinator and the workers.
+    Workers claim shards with a time-limited lease; a shard whose lease
+    expired (dead worker) can be claimed again by anyone.
+    """
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS shards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mailbox TEXT NOT NULL,
+                criteria TEXT NOT NULL,
+                first_uid INTEGER NOT NULL,
+                last_uid INTEGER NOT NULL,
+                status TEXT DEFAULT 'pending',
+                worker TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER DEFAULT 0,
+                result_path TEXT
+            )
+        """)
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def publish(self, mailbox, criteria, ranges):
+        """Add one pending shard per (first_uid, last_uid) range."""
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO shards (mailbox, criteria, first_uid, last_uid) VALUES (?, ?, ?, ?)",
+                [(mailbox, criteria, first, last) for first, last in ranges],
+            )
+
+    def claim(self, worker, lease_seconds):
+        """Lease the next pending (or abandoned) shard to a worker, None if there is none."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                """
+                SELECT * FROM shards
+                WHERE status = ? OR (status = ? AND lease_expires_at < ?)
+                ORDER BY id LIMIT 1
+            """,
+                (PENDING, CLAIMED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """
+                UPDATE shards SET status = ?, worker = ?, lease_expires_at = ?,
+                    attempts = attempts + 1
+                WHERE id = ?
+            """,
+                (CLAIMED, worker, now + lease_seconds, row["id"]),
+            )
+        shard = dict(row)
+        shard.update(status=CLAIMED, worker=worker, attempts=row["attempts"] + 1)
+        return shard
+
+    def renew(self, shard_id, worker, lease_seconds):
+        """Extend a lease. Returns False if the worker lost it to another one."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE shards SET lease_expires_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (time.time() + lease_seconds, shard_id, worker, CLAIMED),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, shard_id, worker, result_path):
+        """Mark a leased shard as done. Returns False if the lease was lost."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE shards SET status = ?, result_path = ?, lease_expires_at = NULL
+                WHERE id = ? AND worker = ? AND status = ?
+            """,
+                (DONE, str(result_path), shard_id, worker, CLAIMED),
+            )
+        return cursor.rowcount == 1
+
+    def release(self, shard_id, worker):
+        """Give a leased shard back to the queue, for another worker or a later attempt."""
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                UPDATE shards SET status = ?, worker = NULL, lease_expires_at = NULL
+                WHERE id = ? AND worker = ? AND status = ?
+            """,
+                (PENDING, shard_id, worker, CLAIMED),
+            )
+
+    def fail(self, shard_id, worker):
+        """Give up on a leased shard: no worker claims it again."""
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                UPDATE shards SET status = ?, lease_expires_at = NULL
+                WHERE id = ? AND worker = ? AND status = ?
+            """,
+                (FAILED, shard_id, worker, CLAIMED),
+            )
+
+    def mark_merged(self, shard_id):
+        with self._transaction() as conn:
+            conn.execute("UPDATE shards SET status = ? WHERE id = ?", (MERGED, shard_id))
+
+    def shards(self, status=None):
+        """Return every shard, or those with the given status."""
+        if status is None:
+            rows = self.conn.execute("SELECT * FROM shards ORDER BY id").fetchall()
+        else:
+            rows = self.conn.execute(
+                "SELECT * FROM shards WHERE status = ? ORDER BY id", (status,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+class FileWorkQueue:
+    """
+    Same interface as SQLiteWorkQueue, stored as a JSON file in a directory.
+    Meant for tests and single-host runs; a lock file serializes the updates.
+    The lock file holds its owner's host, pid and time, so a lock left by a
+    crashed process (dead pid on this host, or older than stale_after
+    seconds) is broken instead of blocking every worker.
+    """
+
+    def __init__(self, directory, lock_timeout=30, stale_after=60):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.directory / "shards.json"
+        self.lock_path = self.directory / "shards.lock"
+        self.lock_timeout = lock_timeout
+        self.stale_after = stale_after
+
+    @contextmanager
+    def _transaction(self):
+        deadline = time.time() + self.lock_timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                if self._break_stale_lock():
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"Work queue locked: {self.lock_path}")
+                time.sleep(0.01)
+        try:
+            os.write(fd, json.dumps(
+                {"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}
+            ).encode())
+            shards = []
+            if self.state_path.exists():
+                shards = json.loads(self.state_path.read_text(encoding="utf-8"))
+            yield shards
+            tmp_path = self.state_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(shards), encoding="utf-8")
+            tmp_path.replace(self.state_path)
+        finally:
+            os.close(fd)
+            os.unlink(self.lock_path)
+
+    def _break_stale_lock(self):
+        """Remove the lock file if its owner is clearly gone. Returns True if it was removed."""
+        try:
+            content = self.lock_path.read_text(encoding="utf-8")
+            modified = self.lock_path.stat().st_mtime
+        except FileNotFoundError:
+            return True
+        if not self._is_stale(content, modified):
+            return False
+
+        # move it aside first: only one waiter gets it, and a fresh lock taken
+        # in between is put back
+        aside = self.lock_path.with_name(f"{self.lock_path.name}.{os.getpid()}.stale")
+        try:
+            os.rename(self.lock_path, aside)
+        except FileNotFoundError:
+            return True
+        if aside.read_text(encoding="utf-8") != content:
+            try:
+                os.link(aside, self.lock_path)
+            except FileExistsError:
+                pass
+        aside.unlink()
+        return True
+
+    def _is_stale(self, content, modified):
+        try:
+            owner = json.loads(content)
+        except ValueError:
+            # owner died between creating and writing the file, or is writing it now
+            return time.time() - modified > self.stale_after
+        if owner.get("host") == socket.gethostname():
+            try:
+                os.kill(owner["pid"], 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+        return time.time() - owner.get("time", modified) > self.stale_after
+
+    def publish(self, mailbox, criteria, ranges):
+        with self._transaction() as shards:
+            next_id = max((shard["id"] for shard in shards), default=0) + 1
+            for offset, (first, last) in enumerate(ranges):
+                shards.append(
+                    {
+                        "id": next_id + offset,
+                        "mailbox": mailbox,
+                        "criteria": criteria,
+                        "first_uid": first,
+                        "last_uid": last,
+                        "status": PENDING,
+                        "worker": None,
+                        "lease_expires_at": None,
+                        "attempts": 0,
+                        "result_path": None,
+                    }
+                )
+
+    def claim(self, worker, lease_seconds):
+        now = time.time()
+        with self._transaction() as shards:
+            for shard in shards:
+                abandoned = shard["status"] == CLAIMED and shard["lease_expires_at"] < now
+                if shard["status"] == PENDING or abandoned:
+                    shard.update(
+                        status=CLAIMED,
+                        worker=worker,
+                        lease_expires_at=now + lease_seconds,
+                        attempts=shard["attempts"] + 1,
+                    )
+                    return dict(shard)
+        return None
+
+    def renew(self, shard_id, worker, lease_seconds):
+        with self._transaction() as shards:
+            shard = self._owned(shards, shard_id, worker)
+            if shard:
+                shard["lease_expires_at"] = time.time() + lease_seconds
+        return shard is not None
+
+    def complete(self, shard_id, worker, result_path):
+        with self._transaction() as shards:
+            shard = self._owned(shards, shard_id, worker)
+            if shard:
+                shard.update(status=DONE, result_path=str(result_path), lease_expires_at=None)
+        return shard is not None
+
+    def release(self, shard_id, worker):
+        with self._transaction() as shards:
+            shard = self._owned(shards, shard_id, worker)
+            if shard:
+                shard.update(status=PENDING, worker=None, lease_expires_at=None)
+
+    def fail(self, shard_id, worker):
+        with self._transaction() as shards:
+            shard = self._owned(shards, shard_id, worker)
+            if shard:
+                shard.update(status=FAILED, lease_expires_at=None)
+
+    def mark_merged(self, shard_id):
+        with self._transaction() as shards:
+            for shard in shards:
+                if shard["id"] == shard_id:
+                    shard["status"] = MERGED
+
+    def shards(self, status=None):
+        if not self.state_path.exists():
+            return []
+        shards = json.loads(self.state_path.read_text(encoding="utf-8"))
+        return [shard for shard in shards if status is None or shard["status"] == status]
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _owned(shards, shard_id, worker):
+        for shard in shards:
+            if shard["id"] == shard_id and shard["worker"] == worker and shard["status"] == CLAIMED:
+                return shard
+        return None
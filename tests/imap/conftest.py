@@ -0,0 +1,264 @@
+import email
+import re
+import socketserver
+import threading
+import time
+import zlib
+
+import pytest
+
+
+class _Session:
+    """One client connection, switched to raw deflate after COMPRESS DEFLATE."""
+
+    def __init__(self, handler):
+        self.rfile = handler.rfile
+        self.wfile = handler.wfile
+        self.inflate = None
+        self.deflate = None
+        self.buffer = b""
+
+    def start_compression(self):
+        self.inflate = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.deflate = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    def readline(self):
+        if self.inflate is None:
+            return self.rfile.readline()
+        while b"\n" not in self.buffer:
+            data = self.rfile.read1(65536)
+            if not data:
+                return b""
+            self.buffer += self.inflate.decompress(data)
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line + b"\n"
+
+    def write(self, data):
+        if self.deflate is not None:
+            data = self.deflate.compress(data) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.wfile.write(data)
+
+
+class FakeIMAPServer:
+    """
+    Minimal IMAP4rev1 server on localhost for client tests, with fault injection:
+    fail("UID FETCH", "drop") closes the connection instead of answering,
+    fail("UID FETCH", "hang", delay=2) answers late, refuse=True closes new
+    connections before the greeting.
+    Add "COMPRESS=DEFLATE", "ENABLE", "CONDSTORE" or "QRESYNC" to
+    capabilities to turn the extensions on.
+    """
+
+    def __init__(self, messages=None):
+        # uid -> raw email
+        self.messages = messages or {1: b"Subject: Hello\r\n\r\nFirst", 2: b"Subject: Bye\r\n\r\nSecond"}
+        self.uidvalidity = 42
+        self.capabilities = ["IMAP4rev1"]
+        # uid -> mod-sequence, every message starts as a change
+        self.modseqs = {uid: index + 1 for index, uid in enumerate(sorted(self.messages))}
+        self.compressed_sessions = 0
+        self.refuse = False
+        self.connections = 0
+        self.commands = []
+        # argument lines of the SEARCH commands received
+        self.searches = []
+        self._faults = []
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    server._serve(self)
+                except OSError:
+                    # the client gave up on a hung or dropped exchange
+                    pass
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail(self, command, action="drop", times=1, delay=0):
+        """Inject a fault on the next `times` occurrences of a command."""
+        with self._lock:
+            self._faults.append({"command": command, "action": action, "times": times, "delay": delay})
+
+    def add_message(self, raw):
+        uid = max(self.messages, default=0) + 1
+        self.messages[uid] = raw
+        self.modseqs[uid] = self._highestmodseq() + 1
+        return uid
+
+    def _highestmodseq(self):
+        return max(self.modseqs.values(), default=0)
+
+    def count(self, command):
+        with self._lock:
+            return self.commands.count(command)
+
+    def _take_fault(self, command):
+        with self._lock:
+            for fault in self._faults:
+                if fault["command"] == command and fault["times"] > 0:
+                    fault["times"] -= 1
+                    return fault
+        return None
+
+    def _serve(self, handler):
+        with self._lock:
+            self.connections += 1
+        if self.refuse:
+            return
+        session = _Session(handler)
+        session.write(b"* OK fake IMAP4rev1 ready\r\n")
+
+        while True:
+            line = session.readline()
+            if not line:
+                return
+            tag, _, rest = line.rstrip(b"\r\n").decode().partition(" ")
+            words = rest.split(" ")
+            command = words[0].upper()
+            args = words[1:]
+            if command == "UID":
+                command = f"UID {args[0].upper()}"
+                args = args[1:]
+            with self._lock:
+                self.commands.append(command)
+
+            fault = self._take_fault(command)
+            if fault:
+                if fault["action"] == "drop":
+                    return
+                time.sleep(fault["delay"])
+
+            if not self._respond(session, tag, command, args):
+                return
+
+    def _respond(self, session, tag, command, args):
+        write = session.write
+        condstore = {"CONDSTORE", "QRESYNC"} & set(self.capabilities)
+        if command == "CAPABILITY":
+            write(f"* CAPABILITY {' '.join(self.capabilities)}\r\n".encode())
+        elif command == "COMPRESS" and "COMPRESS=DEFLATE" in self.capabilities:
+            write(f"{tag} OK DEFLATE active\r\n".encode())
+            session.start_compression()
+            with self._lock:
+                self.compressed_sessions += 1
+            return True
+        elif command == "ENABLE" and "ENABLE" in self.capabilities:
+            write(f"* ENABLED {' '.join(args)}\r\n".encode())
+        elif command == "SELECT":
+            write(f"* {len(self.messages)} EXISTS\r\n".encode())
+            write(f"* OK [UIDVALIDITY {self.uidvalidity}] UIDs valid\r\n".encode())
+            if condstore:
+                write(f"* OK [HIGHESTMODSEQ {self._highestmodseq()}] Highest\r\n".encode())
+            write(f"{tag} OK [READ-WRITE] SELECT completed\r\n".encode())
+            return True
+        elif command in ("SEARCH", "UID SEARCH"):
+            with self._lock:
+                self.searches.append(" ".join(args))
+            uids = sorted(self.messages)
+            suffix = ""
+            if args[0].upper() == "MODSEQ":
+                since = int(args[1])
+                uids = [uid for uid in uids if self.modseqs[uid] >= since]
+                if uids:
+                    suffix = f" (MODSEQ {max(self.modseqs[uid] for uid in uids)})"
+            write(f"* SEARCH {' '.join(str(uid) for uid in uids)}{suffix}\r\n".encode())
+        elif command in ("FETCH", "UID FETCH"):
+            items = " ".join(args[1:])
+            for uid in self._uids(args[0]):
+                raw = self.messages[uid]
+                if "BODYSTRUCTURE" in items:
+                    structure = _bodystructure(email.message_from_bytes(raw))
+                    write(f"* {uid} FETCH (UID {uid} BODYSTRUCTURE {structure})\r\n".encode())
+                    continue
+                sections = re.findall(r"BODY\.PEEK\[([^\]]*)\]", items)
+                if not sections:
+                    sections = [None]
+                write(f"* {uid} FETCH (UID {uid}".encode())
+                for section in sections:
+                    data = raw if section is None else _section(raw, section)
+                    name = "RFC822" if section is None else f"BODY[{section}]"
+                    write(f" {name} {{{len(data)}}}\r\n".encode() + data)
+                write(b")\r\n")
+        elif command in ("STORE", "UID STORE"):
+            for uid in self._uids(args[0]):
+                with self._lock:
+                    self.modseqs[uid] = self._highestmodseq() + 1
+                write(f"* {uid} FETCH (UID {uid} FLAGS (\\Seen))\r\n".encode())
+        elif command == "LOGOUT":
+            write(b"* BYE logging out\r\n")
+            write(f"{tag} OK LOGOUT completed\r\n".encode())
+            return False
+        elif command not in ("LOGIN", "NOOP"):
+            write(f"{tag} BAD unknown command\r\n".encode())
+            return True
+        write(f"{tag} OK {command} completed\r\n".encode())
+        return True
+
+    def _uids(self, sequence_set):
+        uids = set()
+        for part in sequence_set.split(","):
+            match = re.fullmatch(r"(\d+)(?::(\d+|\*))?", part)
+            first = int(match.group(1))
+            last = match.group(2)
+            last = max(self.messages) if last == "*" else int(last or first)
+            uids.update(uid for uid in self.messages if first <= uid <= last)
+        return sorted(uids)
+
+
+def _bodystructure(message):
+    """BODYSTRUCTURE of a parsed email (leaf fields the client reads only)."""
+    if message.is_multipart():
+        children = "".join(_bodystructure(part) for part in message.get_payload())
+        return f'({children} "{message.get_content_subtype()}")'
+    params = " ".join(f'"{name}" "{value}"' for name, value in message.get_params()[1:])
+    body = message.get_payload().encode()
+    disposition = "NIL"
+    if message.get_content_disposition():
+        filename = message.get_filename()
+        disposition = f'("{message.get_content_disposition()}" ' + (
+            f'("filename" "{filename}"))' if filename else "NIL)"
+        )
+    encoding = message.get("Content-Transfer-Encoding", "7bit")
+    fields = (
+        f'"{message.get_content_maintype()}" "{message.get_content_subtype()}" '
+        f'{f"({params})" if params else "NIL"} NIL NIL "{encoding}" {len(body)}'
+    )
+    if message.get_content_maintype() == "text":
+        fields += f" {len(body.splitlines())}"
+    return f"({fields} NIL {disposition} NIL NIL)"
+
+
+def _section(raw, section):
+    """BODY[section] of an email: HEADER, a part number or its n.MIME header."""
+    message = email.message_from_bytes(raw)
+    if section == "HEADER":
+        return raw.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+    for index in section.replace(".MIME", "").split("."):
+        message = message.get_payload()[int(index) - 1]
+    if section.endswith(".MIME"):
+        header = message.as_bytes().partition(b"\n\n")[0]
+        return header.replace(b"\n", b"\r\n") + b"\r\n\r\n"
+    return message.get_payload().encode()
+
+
+@pytest.fixture
+def imap_server():
+    server = FakeIMAPServer().start()
+    yield server
+    server.stop()
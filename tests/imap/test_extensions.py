@@ -0,0 +1,179 @@
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+from imap import IMAPClient
+from imap.bodystructure import parse_bodystructure
+from parser import EmailParser, EmailClassifier
+from pipeline import EmailProcessor, MailboxRun
+from reporting import AttachmentHandler, AttachmentPolicy, ReportGenerator, EmailDatabase
+from utils import metrics
+
+
+def make_client(server, **kwargs):
+    return IMAPClient(
+        server="127.0.0.1",
+        port=server.port,
+        email="test@test.com",
+        password="password",
+        use_ssl=False,
+        use_uid=True,
+        retry_delay=0,
+        keepalive_interval=0,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def processor(tmp_path):
+    processor = EmailProcessor(
+        EmailParser(),
+        EmailClassifier(),
+        AttachmentHandler(base_path=tmp_path / "attachments"),
+        ReportGenerator(base_path=tmp_path / "reports"),
+        EmailDatabase(db_path=tmp_path / "emails.db"),
+    )
+    yield processor
+    processor.database.close()
+
+
+def test_compress_deflate_is_negotiated(imap_server):
+    body = b"Invoice line repeated for compression\r\n" * 5000
+    imap_server.capabilities.append("COMPRESS=DEFLATE")
+    uid = imap_server.add_message(b"Subject: Big\r\n\r\n" + body)
+    metrics.reset()
+
+    with make_client(imap_server) as client:
+        assert client.compressed
+        client.select_mailbox("INBOX")
+        assert client.fetch_email(str(uid).encode()).endswith(body)
+        assert client.search("ALL") == [b"1", b"2", b"3"]
+
+    assert imap_server.compressed_sessions == 1
+    assert metrics.get("imap.compressed_bytes") * 10 < metrics.get("imap.decompressed_bytes")
+
+
+def test_without_compress_capability_falls_back(imap_server):
+    with make_client(imap_server) as client:
+        assert not client.compressed
+        client.select_mailbox("INBOX")
+        assert client.fetch_email(b"1") == b"Subject: Hello\r\n\r\nFirst"
+
+    assert imap_server.count("COMPRESS") == 0
+
+
+def test_compression_can_be_disabled(imap_server):
+    imap_server.capabilities.append("COMPRESS=DEFLATE")
+
+    with make_client(imap_server, compress=False) as client:
+        assert not client.compressed
+
+    assert imap_server.compressed_sessions == 0
+
+
+def test_condstore_search_changed_since(imap_server):
+    imap_server.capabilities += ["ENABLE", "CONDSTORE"]
+
+    with make_client(imap_server) as client:
+        client.select_mailbox("INBOX")
+        assert client.condstore
+        assert client.highestmodseq == 2
+        uid = imap_server.add_message(b"Subject: New\r\n\r\nThird")
+        assert client.search("ALL", changed_since=2) == [str(uid).encode()]
+
+    assert imap_server.count("ENABLE") == 1
+
+
+def test_without_condstore_searches_everything(imap_server):
+    with make_client(imap_server) as client:
+        client.select_mailbox("INBOX")
+        assert client.highestmodseq is None
+        assert client.search("ALL", changed_since=2) == [b"1", b"2"]
+
+
+def test_incremental_run_only_fetches_changed_emails(imap_server, processor):
+    imap_server.capabilities += ["COMPRESS=DEFLATE", "ENABLE", "QRESYNC"]
+
+    def run_once():
+        with make_client(imap_server) as client:
+            run = MailboxRun(processor, "INBOX", "ALL", incremental=True)
+            run.start(client)
+            run.process_batch(client)
+            run.finish()
+
+    run_once()
+    assert processor.database.get_highest_modseq("INBOX", "ALL", "42") == 2
+
+    imap_server.add_message(b"Subject: Team meeting\r\n\r\nAgenda")
+    run_once()
+
+    assert imap_server.count("UID FETCH") == 3
+    assert processor.database.get_total_count() == 3
+    assert processor.database.get_highest_modseq("INBOX", "ALL", "42") == 3
+    # another UIDVALIDITY epoch starts over
+    assert processor.database.get_highest_modseq("INBOX", "ALL", "43") is None
+
+
+def test_parse_bodystructure_with_literals():
+    data = [
+        (b'7 (UID 7 BODYSTRUCTURE (("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 12 1 '
+         b'NIL NIL NIL NIL)(("text" "html" NIL NIL NIL "quoted-printable" 30 2 NIL NIL NIL NIL) '
+         b'"alternative")("application" "pdf" ("name" {9}', b"r(1).pdf"),
+        b') NIL NIL "base64" 4000 NIL ("attachment" ("filename*" "utf-8\'\'r%C3%A9sum%C3%A9.pdf")) '
+        b'NIL NIL) "mixed" ("boundary" "xyz") NIL NIL NIL))',
+    ]
+    parts = parse_bodystructure(data)
+
+    assert [part.section for part in parts] == ["1", "2.1", "3"]
+    assert [part.content_type for part in parts] == ["text/plain", "text/html", "application/pdf"]
+    assert not parts[0].is_attachment
+    assert parts[2].is_attachment
+    assert parts[2].filename == "r\u00e9sum\u00e9.pdf"
+    assert parts[2].decoded_size == 3000
+
+
+def test_policy_prunes_attachments_before_download(imap_server, tmp_path):
+    msg = MIMEMultipart()
+    msg["Subject"] = "Invoice and holiday video"
+    msg["From"] = "billing@shop.com"
+    msg.attach(MIMEText("Invoice attached"))
+    for name, data in (("invoice.pdf", b"%PDF" * 10), ("holiday.mp4", b"\0" * 200_000)):
+        part = MIMEApplication(data, "pdf" if name.endswith(".pdf") else "octet-stream")
+        if name.endswith(".mp4"):
+            part.replace_header("Content-Type", "video/mp4")
+        part.add_header("Content-Disposition", "attachment", filename=name)
+        msg.attach(part)
+    imap_server.messages = {1: msg.as_bytes().replace(b"\n", b"\r\n")}
+    imap_server.modseqs = {1: 1}
+
+    processor = EmailProcessor(
+        EmailParser(),
+        EmailClassifier(),
+        AttachmentHandler(
+            base_path=tmp_path / "attachments",
+            policy=AttachmentPolicy({"max_size": "100K"}),
+        ),
+        ReportGenerator(base_path=tmp_path / "reports"),
+        EmailDatabase(db_path=tmp_path / "emails.db"),
+    )
+    with make_client(imap_server) as client:
+        run = MailboxRun(processor, "INBOX", "ALL")
+        run.start(client)
+        run.process_batch(client)
+        run.finish()
+
+    database = processor.database
+    rows = database.conn.execute(
+        "SELECT filename, file_path IS NOT NULL AS saved, skipped_reason FROM attachments"
+    ).fetchall()
+    email_row = database.conn.execute("SELECT subject, attachment_count FROM emails").fetchone()
+    processor.close(generate_reports=False)
+
+    # the video never crossed the wire
+    assert imap_server.count("UID FETCH") == 2
+    assert sorted(tuple(row)[:2] for row in rows) == [("holiday.mp4", 0), ("invoice.pdf", 1)]
+    # estimated from the encoded size in BODYSTRUCTURE
+    assert rows[0]["skipped_reason"].endswith("over 102400 bytes")
+    assert tuple(email_row) == ("Invoice and holiday video", 2)
+    assert (tmp_path / "attachments").rglob("invoice.pdf")
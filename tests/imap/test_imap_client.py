@@ -28,6 +28,7 @@ def test_init_ok(env_vars):
 @patch("imaplib.IMAP4_SSL")
 def test_connect_success(mock_imap, env_vars):
     mock_conn = MagicMock()
+    mock_conn.capability.return_value = ("OK", [b"IMAP4rev1"])
     mock_imap.return_value = mock_conn
 
     client = IMAPClient()
@@ -105,7 +106,7 @@ def test_fetch_email_fail_status(env_vars):
 
 
 def test_fetch_email_reconnect(env_vars):
-    client = IMAPClient()
+    client = IMAPClient(retry_delay=0)
     client.conn = MagicMock()
 
     # first call: abort error
@@ -134,3 +135,26 @@ def test_ensure_connection_fail(env_vars):
 
     with pytest.raises(IMAPClientError):
         client._ensure_connection()
+
+
+def test_uid_mode_uses_uid_commands(env_vars):
+    client = IMAPClient(use_uid=True)
+    client.conn = MagicMock()
+    client.conn.select.return_value = ("OK", [])
+    client.conn.response.return_value = ("UIDVALIDITY", [b"1234"])
+    client.conn.uid.side_effect = [
+        ("OK", [b"10 11"]),
+        ("OK", [(b"10 (UID 10 RFC822 {3}", b"RAW")]),
+        ("OK", []),
+    ]
+
+    client.select_mailbox("INBOX")
+    assert client.uidvalidity == "1234"
+    assert client.search("UNSEEN") == [b"10", b"11"]
+    assert client.fetch_email(b"10") == b"RAW"
+    client.mark_as_read(b"10")
+
+    client.conn.uid.assert_any_call("SEARCH", "UNSEEN")
+    client.conn.uid.assert_any_call("FETCH", b"10", "(RFC822)")
+    client.conn.uid.assert_any_call("STORE", b"10", "+FLAGS", "\\Seen")
+    client.conn.search.assert_not_called()
@@ -0,0 +1,123 @@
+import time
+
+import pytest
+from imap import IMAPClient, IMAPClientError, CircuitOpenError, UIDValidityChangedError
+from utils import CircuitBreaker, backoff_delay
+
+
+def make_client(server, **kwargs):
+    options = {"retry_delay": 0, "keepalive_interval": 0, "use_uid": True}
+    options.update(kwargs)
+    return IMAPClient(
+        server="127.0.0.1",
+        port=server.port,
+        email="test@test.com",
+        password="password",
+        use_ssl=False,
+        **options,
+    )
+
+
+def test_fetch_reconnects_and_reselects_after_drop(imap_server):
+    imap_server.fail("UID FETCH", "drop")
+
+    with make_client(imap_server) as client:
+        client.select_mailbox("INBOX")
+        assert client.fetch_email(b"1") == b"Subject: Hello\r\n\r\nFirst"
+
+    assert imap_server.connections == 2
+    assert imap_server.count("SELECT") == 2
+
+
+def test_reconnect_refuses_a_changed_uidvalidity(imap_server):
+    imap_server.fail("UID FETCH", "drop")
+
+    with make_client(imap_server) as client:
+        client.select_mailbox("INBOX")
+        # the mailbox is recreated while the connection is down
+        imap_server.uidvalidity = 43
+        with pytest.raises(UIDValidityChangedError):
+            client.fetch_email(b"1")
+        assert client.uidvalidity == "43"
+
+    # the stale UID was not fetched again
+    assert imap_server.count("UID FETCH") == 1
+
+
+def test_retries_are_bounded(imap_server):
+    imap_server.fail("UID FETCH", "drop", times=10)
+
+    client = make_client(imap_server, max_retries=2)
+    client.connect()
+    client.select_mailbox("INBOX")
+    with pytest.raises(IMAPClientError):
+        client.fetch_email(b"1")
+
+    assert imap_server.count("UID FETCH") == 3
+
+
+def test_read_timeout_on_hung_server(imap_server):
+    imap_server.fail("UID FETCH", "hang", delay=2)
+
+    client = make_client(imap_server, read_timeout=0.2, max_retries=0)
+    client.connect()
+    client.select_mailbox("INBOX")
+    started = time.monotonic()
+    with pytest.raises(IMAPClientError):
+        client.fetch_email(b"1")
+
+    assert time.monotonic() - started < 1.5
+
+
+def test_circuit_opens_on_unreachable_server(imap_server):
+    imap_server.refuse = True
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    for _ in range(2):
+        with pytest.raises(IMAPClientError):
+            make_client(imap_server, breaker=breaker).connect()
+    with pytest.raises(CircuitOpenError):
+        make_client(imap_server, breaker=breaker).connect()
+
+    # the open circuit did not reach the server
+    assert imap_server.connections == 2
+
+
+def test_keepalive_sends_noop_while_idle(imap_server):
+    client = make_client(imap_server, keepalive_interval=0.1)
+    client.connect()
+    time.sleep(0.5)
+    client.logout()
+
+    assert imap_server.count("NOOP") >= 1
+
+
+def test_circuit_breaker_half_open():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 10
+
+    now[0] = 10
+    # a single trial call once the timeout is over
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_backoff_jitter_stays_in_bounds():
+    for attempt in range(1, 6):
+        delay = backoff_delay(attempt, 1, max_delay=8, jitter=True)
+        full = min(2 ** (attempt - 1), 8)
+        assert full / 2 <= delay <= full
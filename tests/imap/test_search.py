@@ -0,0 +1,77 @@
+from datetime import date, datetime
+
+import pytest
+from imap import IMAPClient, build_search_criteria
+from imap.search import parse_header_filter, search_value
+from utils import parse_size
+
+
+def test_status_only():
+    assert build_search_criteria("UNSEEN") == "UNSEEN"
+    assert build_search_criteria(None) == "ALL"
+
+
+def test_filters_compile_into_one_expression():
+    criteria = build_search_criteria(
+        "UNSEEN",
+        since="2024-06-03",
+        before=datetime(2024, 6, 10, 8, 30),
+        sender="billing@shop.com",
+        larger=1024,
+        smaller=5 * 1024 * 1024,
+        headers=[("List-Id", "announce.example.com")],
+    )
+
+    assert criteria == (
+        'UNSEEN SINCE 03-Jun-2024 BEFORE 10-Jun-2024 FROM "billing@shop.com" '
+        'LARGER 1024 SMALLER 5242880 HEADER "List-Id" "announce.example.com"'
+    )
+
+
+def test_values_are_quoted():
+    assert build_search_criteria("ALL", sender='say "hi" \\ bye') == (
+        'ALL FROM "say \\"hi\\" \\\\ bye"'
+    )
+    with pytest.raises(ValueError):
+        build_search_criteria("ALL", sender="été")
+    with pytest.raises(ValueError):
+        build_search_criteria("ALL", headers=[("Subject", "a\r\nb")])
+
+
+def test_dates_ignore_locale_month_names():
+    assert build_search_criteria("ALL", since=date(2024, 12, 1)) == "ALL SINCE 01-Dec-2024"
+
+
+def test_parse_cli_values():
+    assert parse_size("500") == 500
+    assert parse_size("20K") == 20 * 1024
+    assert parse_size("5mb") == 5 * 1024 * 1024
+    with pytest.raises(ValueError):
+        parse_size("lots")
+    assert parse_header_filter("X-Priority: 1") == ("X-Priority", "1")
+    with pytest.raises(ValueError):
+        parse_header_filter("no separator")
+    # rejected as a usage error, before the run creates anything
+    with pytest.raises(ValueError):
+        parse_header_filter("Subject: café")
+    with pytest.raises(ValueError):
+        search_value("josé@example.com")
+
+
+def test_server_receives_the_compiled_search(imap_server):
+    criteria = build_search_criteria("UNSEEN", since="2024-06-03", sender="shop.com")
+
+    client = IMAPClient(
+        server="127.0.0.1",
+        port=imap_server.port,
+        email="test@test.com",
+        password="password",
+        use_ssl=False,
+        use_uid=True,
+        keepalive_interval=0,
+    )
+    with client:
+        client.select_mailbox("INBOX")
+        client.search(criteria)
+
+    assert imap_server.searches == ['UNSEEN SINCE 03-Jun-2024 FROM "shop.com"']
@@ -1,6 +1,8 @@
 import pytest
 import os
-from parser import EmailClassifier
+from parser import DomainMatcher, EmailClassifier
+from parser.language import detect_language
+from utils import metrics
 
 # Initialize handlers
 classifier_en = EmailClassifier()
@@ -290,6 +292,17 @@ def test_internal_domain_detection():
     assert cls.classify_email(data) == "Internal"
 
 
+def test_internal_domain_is_matched_on_the_address_domain():
+    cls = EmailClassifier()
+    cls.internal_domains = DomainMatcher.parse("@mycompany.com, *.mycompany.com")
+    data = {"subject": "Invoice", "body": "", "sender": "Bob <bob@eu.mycompany.com>"}
+    assert cls.classify_email(data) == "Internal"
+
+    # the domain only appears as a prefix of the real one
+    data["sender"] = "billing@mycompany.com.evil.io"
+    assert cls.classify_email(data) == "Finance"
+
+
 def test_french_subject_weighting():
     """
     Verify French scoring: Subject (3pts) > Body (1pt).
@@ -309,3 +322,98 @@ def test_language_fallback():
     cls_weird = EmailClassifier(language="unknown")
     data = {"subject": "Invoice", "body": "", "sender": "x@y.com"}
     assert cls_weird.classify_email(data) == "Finance"
+
+
+def test_quoted_reply_is_not_scanned():
+    """
+    Keywords only present in the quoted previous message or the signature
+    must not drive the classification.
+    """
+    data = {
+        "subject": "Re: hello",
+        "body": "Sounds good.\n\nOn Mon, 3 Jun 2024, Bob wrote:\n> Your invoice is attached\n"
+        "-- \nSent from the flight",
+        "sender": "friend@gmail.com",
+    }
+    assert classifier_en.classify_email(data) == "General"
+
+
+def test_long_body_scans_head_and_tail_only():
+    cls = EmailClassifier(max_body_chars=100)
+    truncated_before = metrics.get("classifier.body_truncated")
+    filler = "lorem ipsum " * 10_000
+    data = {"subject": "Digest", "body": filler + "hotel" + filler, "sender": "x@y.com"}
+    assert cls.classify_email(data) == "General"
+
+    data = {"subject": "Digest", "body": filler + "hotel", "sender": "x@y.com"}
+    assert cls.classify_email(data) == "Travel"
+    assert metrics.get("classifier.body_truncated") == truncated_before + 2
+
+
+def test_quoted_reply_stripping_is_bounded(monkeypatch):
+    from parser import classification
+
+    lengths = []
+    strip = classification.strip_quoted_reply
+    monkeypatch.setattr(
+        classification, "strip_quoted_reply", lambda text: lengths.append(len(text)) or strip(text)
+    )
+    cls = EmailClassifier(max_body_chars=100)
+    data = {"subject": "Digest", "body": "hotel " + "lorem ipsum " * 100_000, "sender": "x@y.com"}
+
+    assert cls.classify_email(data) == "Travel"
+    assert lengths == [201]
+
+
+@pytest.mark.parametrize(
+    "subject, body, expected",
+    [
+        ("Votre facture", "Bonjour, merci pour votre commande.", "fr"),
+        ("Your invoice", "Hello, thank you for your order.", "en"),
+        ("Réservation", "", "fr"),
+        ("", "", "en"),
+    ],
+)
+def test_language_detection(subject, body, expected):
+    assert detect_language(subject, body) == expected
+
+
+def test_auto_language_picks_the_ruleset_per_email():
+    cls = EmailClassifier(language="auto")
+    french = {
+        "subject": "Votre colis",
+        "body": "Bonjour, votre livraison est prévue pour demain.",
+        "sender": "noreply@shop.fr",
+    }
+    english = {
+        "subject": "Your flight",
+        "body": "Your booking is confirmed, see you at the gate.",
+        "sender": "noreply@air.com",
+    }
+    assert cls.classify_email(french) == "Achats & Services"
+    assert cls.classify_email(english) == "Travel"
+
+    # both rulesets at once: categories of either language compete
+    both = EmailClassifier(language="both").classify(english)
+    assert both.category == "Travel"
+    assert "Travel" in both.scores
+
+
+def test_explained_result():
+    cls = EmailClassifier(explain=True)
+    result = cls.classify({
+        "subject": "Invoice for your flight",
+        "body": "Payment received, hotel booking attached",
+        "sender": "noreply@air.com",
+    })
+
+    assert result.scores == {"Finance": 4, "Travel": 5}
+    assert result.category == "Travel"
+    assert result.runner_up == "Finance"
+    assert result.margin == 1
+    assert ("Finance", "invoice", "subject", 0) in result.matches
+    assert ("Travel", "hotel", "body", 18) in result.matches
+    assert result.explanation["runner_up"] == "Finance"
+
+    # not explained by default
+    assert classifier_en.classify({"subject": "Invoice", "body": "", "sender": ""}).explanation is None
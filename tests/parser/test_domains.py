@@ -0,0 +1,33 @@
+import pytest
+from parser import DomainMatcher
+
+matcher = DomainMatcher.parse("@mycompany.com, *.subsidiary.com subsidiary.fr")
+
+
+@pytest.mark.parametrize(
+    "sender, expected",
+    [
+        ("boss@mycompany.com", True),
+        ("Big Boss <Boss@MyCompany.com>", True),
+        ("boss@mycompany.com.evil.io", False),
+        ("evil.io <boss@mycompany.com.evil.io>", False),
+        ("\"boss@mycompany.com\" <x@evil.io>", False),
+        ("boss@notmycompany.com", False),
+        ("boss@eu.mycompany.com", False),
+        ("ops@eu.subsidiary.com", True),
+        ("ops@a.b.subsidiary.com", True),
+        # the wildcard covers subdomains only
+        ("ops@subsidiary.com", False),
+        ("ops@subsidiary.fr", True),
+        ("mycompany.com", False),
+        ("", False),
+    ],
+)
+def test_internal_senders(sender, expected):
+    assert matcher.matches(sender) is expected
+
+
+def test_empty_matcher():
+    assert not DomainMatcher.parse("")
+    assert not DomainMatcher.parse(None).matches("a@b.com")
+    assert len(matcher) == 3
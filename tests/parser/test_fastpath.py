@@ -0,0 +1,172 @@
+import random
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+from parser import EmailParser
+from parser.fastpath import scan_email
+
+fast_parser = EmailParser()
+full_parser = EmailParser(fast=False)
+
+SUBJECTS = ["Invoice 42", "  Hello  there ", "Re: meeting\ttomorrow", "", "a;b=c \"q\"",
+            "=?utf-8?q?caf=C3=A9?=", "Café", "x" * 90]
+SENDERS = ["billing@shop.com", "John Doe <j@x.com>", "\"Doe, J\" <j@x.com>", "J. Doe <j@x.com>",
+           "<j@x.com>", "j@x.com (Jo)", "a@b, c@d", "=?utf-8?q?Jos=C3=A9?= <j@x.com>",
+           "Jo  Do <j@x.com>", "not an address", ""]
+DATES = ["Mon, 3 Jun 2024 10:00:00 +0200", "3 Jun 2024 10:00 -0700", "garbage", "",
+         "Mon, 3 Jun 2024 10:00:00 GMT", "Tue, 31 Feb 2024 10:00:00 +0000"]
+BODIES = ["Payment due tomorrow", "line1\nline2\n\n", "café crème",
+          "<p>Hello <b>world</b></p>", "--x\n-- \nsig", "=3D qp-like =\n", ""]
+MESSAGE_IDS = ["<1@x.com>", " <a.b@host> ", "<1@x.com> <2@x.com>\r\n <3@x.com>", "no-brackets@x",
+               "<=?utf-8?q?x?=@x>", "<a b@x>", "<>", "(comment) <c@x.com>", ""]
+FILENAMES = ["report.pdf", "a b.txt", "  spaced.doc ", "naïve.pdf", "x;y.pdf", ""]
+INSERTIONS = [b"\r\n", b"\n", b" ", b"\t", b"--", b":", b";", b'"', b"=?", b"\xe9", b"\r",
+              b"\n\n", b"From "]
+
+
+def random_leaf(rng):
+    body = rng.choice(BODIES)
+    kind = rng.random()
+    if kind < 0.45:
+        charset = rng.choice(["utf-8", "iso-8859-1"] + (["us-ascii"] if body.isascii() else []))
+        return MIMEText(body, rng.choice(["plain", "html"]), charset)
+    if kind < 0.6:
+        part = MIMEText(body, "plain", "utf-8")
+        part.replace_header(
+            "Content-Transfer-Encoding",
+            rng.choice(["quoted-printable", "8bit", "7bit", " base64", "x-custom"]),
+        )
+        part.set_payload(body.encode("utf-8").decode("latin-1"))
+        return part
+
+    part = MIMEApplication(b"\x00\x01data" * rng.randint(0, 20))
+    name = rng.choice(FILENAMES)
+    disposition = rng.choice(["attachment", "inline", "ATTACHMENT", "attachment; size=12"])
+    if name:
+        part.add_header("Content-Disposition", disposition, filename=name)
+    else:
+        part.add_header("Content-Disposition", disposition)
+    if rng.random() < 0.2:
+        del part["Content-Disposition"]
+        part.set_param("name", name or "noname.bin")
+    return part
+
+
+def random_entity(rng, depth=0):
+    if depth < 3 and rng.random() < 0.5:
+        container = MIMEMultipart(rng.choice(["mixed", "alternative", "related"]))
+        for _ in range(rng.randint(0, 4)):
+            container.attach(random_entity(rng, depth + 1))
+        return container
+    return random_leaf(rng)
+
+
+def random_email(rng):
+    msg = random_entity(rng)
+    for name, values in (("Subject", SUBJECTS), ("From", SENDERS), ("Date", DATES)):
+        if rng.random() < 0.9:
+            msg[name] = rng.choice(values)
+    for name in ("Message-ID", "In-Reply-To", "References"):
+        if rng.random() < 0.4:
+            msg[name] = rng.choice(MESSAGE_IDS)
+    try:
+        raw = msg.as_bytes()
+    except UnicodeEncodeError:
+        # 8bit payloads set as text
+        raw = msg.as_string().encode("utf-8", "surrogateescape")
+    if rng.random() < 0.5:
+        raw = raw.replace(b"\n", b"\r\n")
+    return raw
+
+
+def mutate(rng, raw):
+    data = bytearray(raw)
+    for _ in range(rng.randint(1, 3)):
+        if not data:
+            break
+        choice = rng.random()
+        index = rng.randrange(len(data))
+        if choice < 0.25:
+            del data[index:index + rng.randint(1, 8)]
+        elif choice < 0.5:
+            data[index:index] = rng.choice(INSERTIONS)
+        elif choice < 0.7:
+            data[index] = rng.randrange(256)
+        elif choice < 0.85:
+            # duplicated headers, boundaries...
+            data[index:index] = data[index:index + rng.randint(1, 60)]
+        else:
+            del data[index:]
+    return bytes(data)
+
+
+def fuzzed_corpus(seed, count):
+    rng = random.Random(seed)
+    for _ in range(count):
+        raw = random_email(rng)
+        yield raw
+        yield mutate(rng, raw)
+
+
+def outcome(parser, raw):
+    try:
+        parsed = parser.parse_email(raw)
+    except Exception as e:
+        return type(e).__name__
+    date = parsed["date"]
+    return (
+        parsed["subject"],
+        parsed["sender"],
+        None if date is None else str(date),
+        parsed["body"],
+        parsed["attachments"],
+        parsed["message_id"],
+        parsed["in_reply_to"],
+        parsed["references"],
+    )
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_fast_path_matches_email_package_on_fuzzed_corpus(seed):
+    fast_hits = 0
+    for raw in fuzzed_corpus(seed, 80):
+        if scan_email(raw) is not None:
+            fast_hits += 1
+        assert outcome(fast_parser, raw) == outcome(full_parser, raw), raw
+    # the corpus exercises the fast path, not only the fallback
+    assert fast_hits > 10
+
+
+EDGE_CASES = [
+    # folded headers, LF line endings, no Date
+    b"Subject: Hello\n  folded\tpart\nFrom: Bob Smith <bob@corp.com>\n\nBody",
+    # headers only
+    b"Subject: No body\r\nFrom: a@b.com\r\n",
+    # preamble, epilogue, lookalike boundaries, part without headers
+    b"From: a@b.com\r\nContent-Type: multipart/mixed; boundary=b1\r\n\r\n"
+    b"preamble\r\n--b1\r\n\r\nno headers\r\n--b1x\r\nstill the first part\r\n"
+    b"--b1 \t\r\nContent-Type: text/plain\r\n\r\nsecond\r\n--b1--\r\nepilogue",
+    # quoted-printable soft breaks and base64 split over lines
+    b"Content-Type: multipart/alternative; boundary=\"b1\"\r\n\r\n--b1\r\n"
+    b"Content-Type: text/plain; charset=UTF-8\r\nContent-Transfer-Encoding: quoted-printable\r\n\r\n"
+    b"caf=C3=A9 cr=\r\n=C3=A8me\r\n--b1\r\nContent-Type: text/html\r\n"
+    b"Content-Transfer-Encoding: base64\r\n\r\nPHA+SGVs\r\nbG88L3A+\r\n--b1--",
+    # no closing delimiter: full parser
+    b"Content-Type: multipart/mixed; boundary=b1\r\n\r\n--b1\r\n\r\nunterminated",
+    # mbox separator line: full parser
+    b"From a@b.com Mon Jun  3 10:00:00 2024\nSubject: mbox\n\nbody",
+]
+
+
+@pytest.mark.parametrize("raw", EDGE_CASES)
+def test_fast_path_edge_cases(raw):
+    assert outcome(fast_parser, raw) == outcome(full_parser, raw)
+
+
+def test_unusual_emails_fall_back_to_email_package():
+    assert scan_email(EDGE_CASES[0]) is not None
+    assert scan_email(EDGE_CASES[4]) is None
+    assert scan_email(b"Subject: =?utf-8?q?caf=C3=A9?=\r\n\r\nx") is None
+    assert scan_email(b"From: \"Doe, J\" <j@x.com>\r\n\r\nx") is None
@@ -118,3 +118,80 @@ def test_header_decoding(subject, sender):
 
     assert isinstance(result["subject"], str)
     assert isinstance(result["sender"], str)
+
+
+def test_html_only_email_body_is_plain_text():
+    msg = MIMEText(
+        "<style>body { color: red; }</style><p>Your <i>order</i> shipped</p>", "html"
+    )
+    msg["Subject"] = "HTML only"
+
+    result = parser.parse_email(msg.as_bytes())
+
+    assert result["body"] == "Your order shipped"
+
+
+def test_parsed_email_behaves_like_a_dict():
+    msg = MIMEText("Body")
+    msg["Subject"] = "Hello"
+    msg["From"] = "friend@test.com"
+
+    result = parser.parse_email(msg.as_bytes())
+
+    assert dict(result) == {
+        "subject": "Hello",
+        "sender": "friend@test.com",
+        "date": None,
+        "body": "Body",
+        "attachments": [],
+        "message_id": "",
+        "in_reply_to": "",
+        "references": [],
+    }
+    assert result.get("missing", "default") == "default"
+    assert not hasattr(result, "__dict__")
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_threading_headers(fast):
+    msg = MIMEText("Sounds good")
+    msg["Subject"] = "Re: Invoice"
+    msg["From"] = "friend@test.com"
+    msg["Message-ID"] = "<3@test.com>"
+    msg["In-Reply-To"] = "<2@shop.com>"
+    msg["References"] = "<1@shop.com>\n <2@shop.com>"
+
+    result = EmailParser(fast=fast).parse_email(msg.as_bytes())
+
+    assert result["message_id"] == "<3@test.com>"
+    assert result["in_reply_to"] == "<2@shop.com>"
+    assert result["references"] == ["<1@shop.com>", "<2@shop.com>"]
+
+
+def test_header_decoding_matches_email_header_and_is_cached():
+    from email.header import decode_header, make_header
+    from parser.email_parser import _decode_encoded_words
+
+    values = ["Bob Smith <bob@corp.com>", "Café", "=?utf-8?q?Jos=C3=A9?= <j@x.com>",
+              "=?iso-8859-1?q?caf=E9?= =?utf-8?b?Y3LDqG1l?="]
+    for value in values:
+        assert parser._decode_str(value) == str(make_header(decode_header(value)))
+
+    hits = _decode_encoded_words.cache_info().hits
+    parser._decode_str("=?utf-8?q?Jos=C3=A9?= <j@x.com>")
+    assert _decode_encoded_words.cache_info().hits == hits + 1
+
+
+@pytest.mark.parametrize(
+    "charset, payload, expected",
+    [
+        (None, b"plain ascii", "plain ascii"),
+        ("UTF-8", "café".encode(), "café"),
+        ("latin1", "café".encode("latin-1"), "café"),
+        ("x-unknown", "café".encode(), "café"),
+        # not a text encoding: decoded as UTF-8 like an unknown charset
+        ("base64", b"Y2Fm", "Y2Fm"),
+    ],
+)
+def test_payload_charsets(charset, payload, expected):
+    assert parser._decode_payload(payload, charset) == expected
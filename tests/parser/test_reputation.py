@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from parser import SenderReputation
+from parser.text import sender_address
+
+NOW = datetime(2024, 6, 3, 12, 0)
+
+
+def history(sender, category, count, days_ago=0):
+    return [(sender, category, (NOW - timedelta(days=days_ago)).isoformat())] * count
+
+
+def test_sender_address_is_normalized():
+    assert sender_address("Billing <Billing@Shop.com>") == "billing@shop.com"
+    assert sender_address("billing@shop.com") == "billing@shop.com"
+    assert sender_address("") == ""
+
+
+def test_only_consistent_senders_are_known():
+    reputation = SenderReputation(threshold=0.9, min_count=5).fit(
+        history("Shop <billing@shop.com>", "Finance", 10)
+        + history("mixed@x.com", "Finance", 5) + history("mixed@x.com", "Travel", 5)
+        + history("rare@x.com", "Travel", 2)
+        + history("someone@x.com", "General", 10),
+        now=NOW,
+    )
+
+    category, confidence, weight = reputation.lookup("billing@shop.com")
+    assert (category, confidence, weight) == ("Finance", 1.0, 10)
+    assert reputation.lookup("mixed@x.com") is None
+    assert reputation.lookup("rare@x.com") is None
+    # General says nothing about a sender
+    assert reputation.lookup("someone@x.com") is None
+
+    reputation.observe("rare@x.com", "Travel")
+    reputation.observe("rare@x.com", "Travel")
+    reputation.observe("rare@x.com", "Travel")
+    assert reputation.lookup("Rare <RARE@x.com>")[0] == "Travel"
+
+
+def test_old_history_decays():
+    rows = history("news@x.com", "Marketing", 10, days_ago=360) + history("news@x.com", "Finance", 6)
+
+    assert SenderReputation(threshold=0.7, min_count=5).fit(rows, now=NOW).lookup("news@x.com") is None
+
+    # 4 half-lives: the old Marketing emails weigh 10/16
+    reputation = SenderReputation(threshold=0.7, min_count=5, half_life_days=90).fit(rows, now=NOW)
+    category, confidence, _ = reputation.lookup("news@x.com")
+    assert category == "Finance"
+    assert round(confidence, 3) == round(6 / 6.625, 3)
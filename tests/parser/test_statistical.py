@@ -0,0 +1,80 @@
+import os
+import timeit
+
+import pytest
+from parser import NaiveBayesClassifier
+
+TRAINING = [
+    ({"subject": "Your invoice", "body": "Payment due", "sender": "billing@shop.com"}, "Finance"),
+    ({"subject": "Receipt for order", "body": "Amount paid", "sender": "billing@shop.com"}, "Finance"),
+    ({"subject": "Flight booked", "body": "Boarding pass", "sender": "air@travel.com"}, "Travel"),
+    ({"subject": "Hotel stay", "body": "Check-in at noon", "sender": "stay@travel.com"}, "Travel"),
+]
+
+
+@pytest.fixture
+def model():
+    return NaiveBayesClassifier().fit(TRAINING)
+
+
+def test_untrained_falls_back_to_general():
+    model = NaiveBayesClassifier()
+    assert model.predict({"subject": "x", "body": "y", "sender": "z"}) is None
+    assert model.classify_email({"subject": "x", "body": "y", "sender": "z"}) == "General"
+
+
+def test_predicts_from_history(model):
+    data = {"subject": "Monthly statement", "body": "Amount paid", "sender": "billing@shop.com"}
+    assert model.classify_email(data) == "Finance"
+
+    data = {"subject": "Trip details", "body": "Your boarding pass", "sender": "no-reply@travel.com"}
+    assert model.classify_email(data) == "Travel"
+
+
+def test_non_content_categories_are_not_learned():
+    model = NaiveBayesClassifier()
+    model.partial_fit({"subject": "hi", "body": "", "sender": ""}, "General")
+    model.partial_fit({"subject": "hi", "body": "", "sender": ""}, "Internal")
+    assert not model.is_trained
+
+
+def test_partial_fit_updates_predictions(model):
+    data = {"subject": "Zoom sync", "body": "Agenda attached", "sender": "cal@corp.com"}
+    assert model.classify_email(data) != "Meetings"
+
+    for _ in range(3):
+        model.partial_fit(data, "Meetings")
+
+    assert model.classify_email(data) == "Meetings"
+
+
+def test_save_and_load_roundtrip(model, tmp_path):
+    path = tmp_path / "model.json"
+    model.save(path)
+    loaded = NaiveBayesClassifier.load(path)
+
+    for data, _ in TRAINING:
+        assert loaded.classify_email(data) == model.classify_email(data)
+    assert loaded.doc_counts == model.doc_counts
+
+
+@pytest.mark.skipif(
+    not os.environ.get("EMAIL_SORTER_BENCHMARKS"),
+    reason="wall-clock benchmark, set EMAIL_SORTER_BENCHMARKS=1 to run it",
+)
+def test_inference_is_fast(model):
+    words = ["amount", "paid", "order", "shipping", "invoice", "refund", "hello", "thanks"]
+    body = " ".join(words[i % len(words)] + str(i) for i in range(300))[:2000]
+    data = {"subject": "Receipt", "body": body, "sender": "billing@shop.com"}
+    runs = 1000
+    best = min(
+        timeit.timeit(lambda: model.predict(data), number=runs) / runs for _ in range(5)
+    )
+    # best of 5 repeats, so a busy machine does not flake
+    assert best < 50e-6
+
+
+def test_ascii_tokens_match_the_token_pattern(model):
+    text = "Re: Order #42 -- paid_in_full, thanks!! (see https://shop.com/x?id=7)"
+    assert model._tokens(text) == NaiveBayesClassifier.TOKEN_PATTERN.findall(text.lower())
+    assert model._tokens("Facture réglée") == ["facture", "réglée"]
@@ -0,0 +1,33 @@
+from parser.text import html_to_text, strip_quoted_reply
+from utils import head_tail
+
+
+def test_strip_quoted_lines_and_signature():
+    body = "Hello\n> quoted line\nBye\n-- \nJohn Doe\nCEO"
+    assert strip_quoted_reply(body) == "Hello\nBye"
+
+
+def test_strip_reply_header_fr():
+    body = "Merci !\n\nLe 3 juin 2024, Alice a écrit :\nancien message"
+    assert strip_quoted_reply(body) == "Merci !"
+
+
+def test_head_tail_window():
+    assert head_tail("abcdef", None) == ("abcdef", False)
+    assert head_tail("abcdef", 10) == ("abcdef", False)
+    assert head_tail("abcdefghij", 4) == ("ab\nij", True)
+    assert head_tail(b"abcdefghij", 4) == (b"ab\nij", True)
+
+
+def test_html_to_text_drops_markup_styles_and_scripts():
+    html = (
+        "<html><head><style>.promo { margin: 0 off; }</style></head>"
+        "<body><!-- tracking --><script>var off = 1;</script>"
+        "<p>Hello&nbsp;<b>world</b></p><div>Second   line</div>"
+        '<img src="data:image/png;base64,iVBORw0KGgo="></body></html>'
+    )
+    assert html_to_text(html) == "Hello world\nSecond line"
+
+
+def test_html_to_text_empty():
+    assert html_to_text("") == ""
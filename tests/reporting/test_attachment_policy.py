@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from reporting import AttachmentHandler, AttachmentPolicy, EmailDatabase
+
+from test_attachment_writer import email_with_attachments
+
+POLICY = {
+    "default": {"max_size": "1K", "denied_types": ["video/*"], "denied_extensions": ["exe"]},
+    "categories": {
+        "Finance": {"max_size": "10M", "allowed_extensions": [".pdf", ".XLSX"]},
+        "Newsletter": {"metadata_only": True},
+    },
+}
+
+
+def test_category_rules_override_the_default():
+    policy = AttachmentPolicy(POLICY["default"], POLICY["categories"])
+
+    assert policy.check("General", "a.pdf", "application/pdf", 100) is None
+    assert policy.check("General", "a.pdf", "application/pdf", 5000) == "size 5000 over 1024 bytes"
+    assert policy.check("General", "clip.mp4", "video/mp4", 10) == "type video/mp4 denied"
+    assert policy.check("General", "setup.EXE", None, 10) == "extension .exe denied"
+    assert policy.check("Finance", "a.pdf", "application/pdf", 5000) is None
+    assert policy.check("Finance", "b.xlsx", "application/vnd.ms-excel", 10) is None
+    assert policy.check("Finance", "c.zip", "application/zip", 10) == "extension .zip not allowed"
+    # the default denials still apply to the categories
+    assert policy.check("Finance", "d.pdf", "video/mp4", 10) == "type video/mp4 denied"
+    assert policy.check("Newsletter", "a.pdf", "application/pdf", 10) == "metadata only"
+
+
+def test_reject_everywhere_needs_every_category_to_reject():
+    policy = AttachmentPolicy(POLICY["default"], POLICY["categories"])
+
+    assert policy.filters_before_download
+    assert policy.reject_everywhere("clip.mp4", "video/mp4", 10) == "type video/mp4 denied"
+    # Finance would keep a 5 KB pdf
+    assert policy.reject_everywhere("a.pdf", "application/pdf", 5000) is None
+    assert policy.reject_everywhere("a.bin", "application/octet-stream", 50 * 1024 ** 2) == (
+        f"size {50 * 1024 ** 2} over 1024 bytes"
+    )
+    assert not AttachmentPolicy({}, {"Newsletter": {"metadata_only": True}}).filters_before_download
+
+
+def test_unknown_keys_are_rejected(tmp_path):
+    path = tmp_path / "policy.json"
+    path.write_text(json.dumps({"default": {"max_bytes": 10}}))
+    with pytest.raises(ValueError, match="max_bytes"):
+        AttachmentPolicy.load(path)
+
+
+def test_skipped_attachments_are_recorded(tmp_path):
+    policy = AttachmentPolicy({"allowed_extensions": [".pdf"]})
+    handler = AttachmentHandler(base_path=tmp_path / "attachments", policy=policy)
+    database = EmailDatabase(db_path=tmp_path / "emails.db")
+
+    infos = handler.submit_attachments(email_with_attachments("a.pdf", "b.zip"), "Finance")
+    saved = handler.saved_paths(infos)
+    handler.close()
+    database.insert_attachments(
+        1,
+        [(info.filename, None, info.size, info.content_type, info.skipped_reason)
+         for info in infos if info.skipped_reason],
+        "Finance",
+    )
+
+    assert [path.rsplit("/", 1)[-1] for path in saved] == ["a.pdf"]
+    assert not (tmp_path / "attachments" / "Finance" / "b.zip").exists()
+    skipped = database.get_skipped_attachments()
+    database.close()
+    assert [(row["filename"], row["file_path"], row["size"], row["skipped_reason"])
+            for row in skipped] == [("b.zip", None, 500, "extension .zip not allowed")]
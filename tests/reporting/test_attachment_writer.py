@@ -0,0 +1,115 @@
+import os
+import threading
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from reporting import AttachmentHandler
+from reporting.attachment_writer import AttachmentWriter
+
+
+def email_with_attachments(*names):
+    msg = MIMEMultipart()
+    msg["Subject"] = "Invoice"
+    msg["From"] = "billing@shop.com"
+    msg.attach(MIMEText("see attached"))
+    for name in names:
+        part = MIMEApplication(name.encode() * 100)
+        part.add_header("Content-Disposition", "attachment", filename=name)
+        msg.attach(part)
+    return msg.as_bytes()
+
+
+def test_concurrent_writes_never_overwrite(tmp_path):
+    writer = AttachmentWriter(max_workers=8)
+    futures = [writer.write(tmp_path, "report.pdf", bytes([i])) for i in range(20)]
+    paths = [future.result() for future in futures]
+    writer.close()
+
+    assert len(set(paths)) == 20
+    assert sorted(os.listdir(tmp_path))[:3] == ["report.pdf", "report_1.pdf", "report_10.pdf"]
+    # every payload landed in exactly one file, no temporary file left
+    assert sorted(open(path, "rb").read() for path in paths) == [bytes([i]) for i in range(20)]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_concurrent_writes_without_hard_links(tmp_path, monkeypatch):
+    def no_link(src, dst):
+        raise PermissionError("hard links not supported")
+
+    monkeypatch.setattr(os, "link", no_link)
+    writer = AttachmentWriter(max_workers=8)
+    futures = [writer.write(tmp_path, "report.pdf", bytes([i])) for i in range(20)]
+    paths = [future.result() for future in futures]
+    writer.close()
+
+    assert len(set(paths)) == 20
+    assert sorted(open(path, "rb").read() for path in paths) == [bytes([i]) for i in range(20)]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_leftover_temporary_files_do_not_block_writes(tmp_path):
+    # left by a crashed run whose pid is reused, e.g. PID 1 in a container
+    for counter in range(3):
+        (tmp_path / f".attachment-{os.getpid()}-{counter}.tmp").write_bytes(b"partial")
+    writers = [AttachmentWriter(max_workers=1), AttachmentWriter(max_workers=1)]
+    paths = [writer.write(tmp_path, "a.txt", b"data").result() for writer in writers]
+    for writer in writers:
+        writer.close()
+
+    assert sorted(os.path.basename(path) for path in paths) == ["a.txt", "a_1.txt"]
+
+
+def test_back_pressure_bounds_pending_writes(tmp_path):
+    release = threading.Event()
+    writer = AttachmentWriter(max_workers=1, max_pending=2)
+    original = writer._write
+
+    def slow_write(*args):
+        release.wait()
+        return original(*args)
+
+    writer._write = slow_write
+    writer.write(tmp_path, "a.txt", b"a")
+    writer.write(tmp_path, "b.txt", b"b")
+
+    third = threading.Thread(target=writer.write, args=(tmp_path, "c.txt", b"c"))
+    third.start()
+    third.join(timeout=0.2)
+    # blocked until one of the first two writes completes
+    assert third.is_alive()
+
+    release.set()
+    third.join(timeout=5)
+    writer.close()
+    assert sorted(os.listdir(tmp_path)) == ["a.txt", "b.txt", "c.txt"]
+
+
+def test_fsync_batches_directory_syncs(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(AttachmentWriter, "_sync_dirs", staticmethod(lambda dirs: synced.append(set(dirs))))
+    writer = AttachmentWriter(max_workers=1, fsync=True, fsync_batch=3)
+
+    for i in range(4):
+        writer.write(tmp_path, f"{i}.txt", b"x").result()
+    assert synced == [{str(tmp_path)}]
+
+    writer.close()
+    assert synced == [{str(tmp_path)}, {str(tmp_path)}]
+
+
+def test_handler_creates_category_folder_once(tmp_path, monkeypatch):
+    handler = AttachmentHandler(base_path=tmp_path)
+    created = []
+    original_mkdir = type(tmp_path).mkdir
+    monkeypatch.setattr(
+        type(tmp_path), "mkdir", lambda self, *a, **k: created.append(self) or original_mkdir(self, *a, **k)
+    )
+
+    for _ in range(3):
+        futures = handler.submit_attachments(email_with_attachments("a.pdf", "b.pdf"), "Finance", b"7")
+        assert len(handler.saved_paths(futures)) == 2
+    handler.close()
+
+    assert created == [tmp_path / "Finance"]
+    assert len(os.listdir(tmp_path / "Finance")) == 6
@@ -0,0 +1,178 @@
+import pytest
+from reporting import EmailDatabase, ReportGenerator
+from reporting.database import FETCHED, STORED, ATTACHMENTS_SAVED, FLAGGED
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = EmailDatabase(db_path=tmp_path / "emails.db")
+    yield db
+    db.close()
+
+
+EMAIL = {
+    "sender": "billing@shop.com",
+    "subject": "Invoice",
+    "date": "Mon, 3 Jun 2024 10:00:00 +0000",
+    "body": "Payment due",
+    "attachments": ["invoice.pdf"],
+}
+
+
+def test_insert_and_statistics(database):
+    database.insert_email(EMAIL, "Finance", has_attachments=True)
+    database.insert_email(EMAIL, "ERROR", error="boom")
+
+    assert database.get_total_count() == 2
+    assert database.get_error_count() == 1
+    assert database.get_statistics() == [
+        {"category": "Finance", "count": 1, "attachment_count": 1}
+    ]
+
+
+def test_summary_tables_are_updated_incrementally(database):
+    email_id = database.insert_email(EMAIL, "Finance", has_attachments=True)
+    database.insert_attachments(email_id, [
+        ("invoice.pdf", "/out/invoice.pdf", 1200, "application/pdf", None),
+        ("big.iso", None, 9000, "application/octet-stream", "too large"),
+    ], "Finance")
+    database.insert_email(dict(EMAIL, sender="bob@x.com"), "Finance")
+    database.insert_email(EMAIL, "ERROR", error="boom")
+
+    assert database.get_sender_statistics() == [
+        {"sender": "billing@shop.com", "emails": 1, "errors": 1},
+        {"sender": "bob@x.com", "emails": 1, "errors": 0},
+    ]
+    assert database.get_attachment_statistics() == [
+        {"category": "Finance", "files": 1, "bytes": 1200, "skipped": 1, "skipped_bytes": 9000}
+    ]
+    (day,) = {row["day"] for row in database.get_daily_statistics()}
+    assert len(day) == 10
+    assert database.rebuild_statistics() is True
+
+    database.delete_email(email_id)
+    assert database.get_statistics() == [
+        {"category": "Finance", "count": 1, "attachment_count": 0}
+    ]
+    assert database.get_attachment_statistics()[0]["bytes"] == 0
+    assert database.rebuild_statistics() is True
+
+
+def test_rebuild_statistics_repairs_drift(database):
+    database.insert_email(EMAIL, "Finance")
+    database.conn.execute("UPDATE stats_category SET emails = 7")
+
+    assert database.rebuild_statistics() is False
+    assert database.get_total_count() == 1
+    assert database.rebuild_statistics() is True
+
+
+def test_stored_body_is_bounded(tmp_path):
+    db = EmailDatabase(db_path=tmp_path / "emails.db", max_stored_body=10)
+    db.insert_email(dict(EMAIL, body="a" * 50 + "b" * 50), "Finance")
+    body = db.get_emails_by_category("Finance")[0]["body"]
+    db.close()
+
+    assert body == "aaaaa\nbbbbb"
+
+
+def test_checkpoint_journal_lifecycle(database):
+    run_id = database.start_run("INBOX", "UNSEEN", uidvalidity="7")
+    database.set_checkpoint(run_id, "42", FETCHED)
+    row_id = database.insert_email(EMAIL, "Finance", checkpoint=(run_id, "42"))
+
+    checkpoint = database.get_checkpoints(run_id)["42"]
+    assert checkpoint["state"] == STORED
+    assert checkpoint["email_row_id"] == row_id
+    assert checkpoint["category"] == "Finance"
+
+    database.insert_attachments(
+        row_id, [("invoice.pdf", "out/invoice.pdf")], "Finance", checkpoint=(run_id, "42")
+    )
+    database.set_checkpoint(run_id, "42", FLAGGED)
+    checkpoint = database.get_checkpoints(run_id)["42"]
+    assert checkpoint["state"] == FLAGGED
+    assert checkpoint["email_row_id"] == row_id
+
+
+def test_find_resumable_run(database):
+    run_id = database.start_run("INBOX", "UNSEEN", uidvalidity="7")
+
+    assert database.find_resumable_run("INBOX", "UNSEEN", "7") == run_id
+    assert database.find_resumable_run("Archive", "UNSEEN", "7") is None
+    # another UIDVALIDITY epoch: the journaled UIDs are meaningless
+    assert database.find_resumable_run("INBOX", "UNSEEN", "8") is None
+
+    database.finish_run(run_id)
+    assert database.find_resumable_run("INBOX", "UNSEEN", "7") is None
+
+
+def test_report_counters_restored_from_journal(database, tmp_path):
+    run_id = database.start_run("INBOX", "UNSEEN")
+    database.insert_email(EMAIL, "Finance", has_attachments=True, checkpoint=(run_id, "1"))
+    database.insert_email(EMAIL, "ERROR", error="boom", checkpoint=(run_id, "2"))
+    database.insert_email(EMAIL, "Travel")  # not part of the run
+
+    report = ReportGenerator(base_path=tmp_path / "reports")
+    report.restore(database.get_run_emails(run_id))
+
+    assert len(report.processed_emails) == 2
+    assert dict(report.category_counts) == {"Finance": 1}
+    assert report.error_count == 1
+    assert report.attachment_count == 1
+
+
+def test_replies_are_grouped_into_threads(database):
+    first = database.insert_email(dict(EMAIL, message_id="<1@shop.com>"), "Finance")
+    reply = dict(EMAIL, message_id="<2@x.com>", in_reply_to="<1@shop.com>",
+                 references=["<1@shop.com>"])
+    second = database.insert_email(reply, "General")
+    # the reply of an unprocessed message still joins its thread
+    sibling = dict(EMAIL, message_id="<3@x.com>", references=["<0@shop.com>", "<1@shop.com>"])
+    third = database.insert_email(sibling, "Finance")
+    other = database.insert_email(dict(EMAIL, message_id="<9@other.com>"), "Travel")
+
+    thread_id = database.get_thread_id(first)
+    assert database.get_thread_id(second) == database.get_thread_id(third) == thread_id
+    assert database.get_thread_id(other) != thread_id
+
+    threads = database.get_threads()
+    assert [(t["root_message_id"], t["category"], t["message_count"]) for t in threads] == [
+        ("<1@shop.com>", "Finance", 3),
+        ("<9@other.com>", "Travel", 1),
+    ]
+    assert database.find_thread_category({"in_reply_to": "<3@x.com>"}) == "Finance"
+    assert database.find_thread_category({"in_reply_to": "<unknown@x.com>"}) is None
+    # not a reply
+    assert database.find_thread_category({"message_id": "<1@shop.com>"}) is None
+
+
+def test_explanations_are_stored_as_compact_json(database):
+    explanation = {"scores": {"Finance": 3}, "matches": [["Finance", "invoice", "subject", 0]],
+                   "runner_up": None, "margin": 3}
+    email_id = database.insert_email(EMAIL, "Finance", explanation=explanation)
+    database.insert_email(EMAIL, "Finance")
+
+    stored = database.conn.execute(
+        "SELECT explanation FROM emails WHERE id = ?", (email_id,)
+    ).fetchone()[0]
+    assert " " not in stored
+    assert list(database.iter_explanations()) == [("Finance", explanation)]
+
+
+def test_dead_letters_are_compressed_and_scheduled(database):
+    raw = b"Subject: hi\r\n\r\n" + b"x" * 10_000
+    letter_id = database.add_dead_letter(raw, ValueError("bad"), mailbox="INBOX", uid="5")
+
+    stored = database.conn.execute(
+        "SELECT raw_email FROM dead_letters WHERE id = ?", (letter_id,)
+    ).fetchone()["raw_email"]
+    assert len(stored) < len(raw)
+
+    (letter,) = database.get_due_dead_letters()
+    assert letter["raw_email"] == raw
+    assert letter["error_class"] == "ValueError"
+    assert letter["attempts"] == 1
+
+    database.reschedule_dead_letter(letter_id, KeyError("again"), retry_in=3600)
+    assert database.get_due_dead_letters() == []
@@ -0,0 +1,107 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
+import pytest
+from reporting import EmailDatabase, export_database, open_exporter
+from reporting.export import NDJSONExporter, read_ndjson
+
+EMAIL = {
+    "sender": "billing@shop.com",
+    "subject": "Invoice",
+    "date": "Mon, 3 Jun 2024 10:00:00 +0200",
+    "body": "Payment due",
+    "attachments": ["invoice.pdf"],
+}
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = EmailDatabase(db_path=tmp_path / "emails.db")
+    db.insert_email(EMAIL, "Finance", has_attachments=True)
+    db.insert_email({**EMAIL, "date": "Tue, 11 Jun 2024 09:00:00 +0000"}, "Finance")
+    db.insert_email({**EMAIL, "date": "not a date", "attachments": []}, "Job Market")
+    yield db
+    db.close()
+
+
+def test_ndjson_export_is_partitioned_and_typed(tmp_path, database):
+    path = tmp_path / "export"
+    assert export_database(database, NDJSONExporter(path, row_group_size=2)) == 3
+
+    files = sorted(p.relative_to(path).parent.as_posix() for p in path.rglob("*.ndjson.gz"))
+    today = datetime.now().strftime("%Y-W%W")
+    assert files == [
+        "category=Finance/week=2024-W23",
+        "category=Finance/week=2024-W24",
+        f"category=Job Market/week={today}",
+    ]
+    schema = json.loads((path / "_schema.json").read_text())
+    assert {"name": "has_attachments", "type": "bool"} in schema["columns"]
+
+    rows = sorted(read_ndjson(path), key=lambda row: row["id"])
+    assert rows[0]["has_attachments"] is True
+    assert rows[0]["attachment_count"] == 1
+    assert rows[0]["sent_at"] == datetime(2024, 6, 3, 8, 0, tzinfo=timezone.utc)
+    assert isinstance(rows[0]["timestamp"], datetime)
+    assert rows[1]["has_attachments"] is False
+    assert rows[2]["sent_at"] is None
+    assert rows[2]["error"] is None
+
+
+def test_rows_are_written_in_row_groups(tmp_path):
+    exporter = NDJSONExporter(tmp_path, row_group_size=2)
+    for index in range(5):
+        exporter.write({"id": index, "category": "Tech", "date": EMAIL["date"]})
+    [file_path] = tmp_path.rglob("*.ndjson.gz")
+    # two full row groups written, one row still buffered
+    with gzip.open(file_path, "rt") as f:
+        assert len(f.readlines()) == 4
+
+    exporter.close()
+    with gzip.open(file_path, "rt") as f:
+        assert [json.loads(line)["id"] for line in f] == [0, 1, 2, 3, 4]
+
+
+def test_parquet_export_keeps_dtypes(tmp_path, database):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "export"
+    export_database(database, open_exporter(path, "parquet"))
+
+    table = pq.read_table(path / "category=Finance")
+    assert str(table.schema.field("has_attachments").type) == "bool"
+    assert str(table.schema.field("sent_at").type) == "timestamp[us, tz=UTC]"
+    assert sorted(table.column("attachment_count").to_pylist()) == [1, 1]
+
+
+def test_parquet_writers_stay_under_the_open_file_cap(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from reporting.export import ParquetExporter
+
+    exporter = ParquetExporter(tmp_path, row_group_size=1, max_open_files=2)
+    for index, category in enumerate(["A", "B", "C", "A", "B", "C"]):
+        exporter.write({"id": index, "category": category, "date": EMAIL["date"]})
+        assert len(exporter._writers) <= 2
+    exporter.close()
+
+    # A and B were closed to open C, then continued in a second part file
+    assert len(list(tmp_path.glob("category=A/*/*.parquet"))) == 2
+    ids = [
+        index for file_path in tmp_path.rglob("*.parquet")
+        for index in pq.read_table(file_path).column("id").to_pylist()
+    ]
+    assert sorted(ids) == list(range(6))
+
+
+def test_auto_format_falls_back_without_pyarrow(tmp_path, monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def no_pyarrow(name, *args, **kwargs):
+        if name.startswith("pyarrow"):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_pyarrow)
+    assert isinstance(open_exporter(tmp_path, "auto"), NDJSONExporter)
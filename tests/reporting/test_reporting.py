@@ -0,0 +1,85 @@
+import csv
+
+from reporting import ReportGenerator, ReportRecord
+
+
+EMAIL = {
+    "sender": "billing@shop.com",
+    "subject": "Invoice",
+    "date": "Mon, 3 Jun 2024 10:00:00 +0000",
+    "body": "Payment due",
+    "attachments": ["invoice.pdf"],
+}
+
+
+def test_records_and_detail_report(tmp_path):
+    report = ReportGenerator(base_path=tmp_path)
+    report.record_email(EMAIL, "Finance", has_attachments=True)
+    report.record_email({**EMAIL, "subject": "Oops"}, "ERROR", error="boom")
+
+    assert report.record_count == 2
+    assert report.error_count == 1
+    assert report.attachment_count == 1
+
+    first = report.processed_emails[0]
+    assert isinstance(first, ReportRecord)
+    assert first.sender == "billing@shop.com"
+    assert first.attachment_count == 1
+    assert first.has_attachments is True
+
+    detail_path, summary_path, thread_path = report.generate_reports()
+    with open(detail_path, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["category"] for row in rows] == ["ERROR", "Finance"]
+    assert rows[0]["error"] == "boom"
+    assert rows[1]["has_attachments"] == "True"
+    assert summary_path.exists()
+    # no email belongs to a thread
+    assert thread_path is None
+
+    report.reset()
+    assert report.record_count == 0
+    assert report.generate_detail_report() is None
+
+
+def test_thread_report(tmp_path):
+    report = ReportGenerator(base_path=tmp_path)
+    report.record_email(EMAIL, "Finance", thread_id=7)
+    report.record_email({**EMAIL, "sender": "me@corp.com", "subject": "Re: Invoice"},
+                        "Finance", thread_id=7)
+    report.record_email({**EMAIL, "subject": "Trip"}, "Travel", thread_id=8)
+    report.record_email({**EMAIL, "subject": "Alone"}, "General")
+
+    thread_path = report.generate_thread_report()
+    with open(thread_path, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [
+        (row["thread_id"], row["subject"], row["category"], row["message_count"],
+         row["participants"]) for row in rows
+    ] == [
+        ("7", "Invoice", "Finance", "2", "2"),
+        ("8", "Trip", "Travel", "1", "1"),
+    ]
+
+
+def test_rule_report(tmp_path):
+    report = ReportGenerator(base_path=tmp_path)
+    explanations = [
+        ("Finance", {"matches": [["Finance", "invoice", "subject", 0],
+                                 ["Finance", "invoice", "body", 4],
+                                 ["Travel", "hotel", "body", 10]]}),
+        ("Travel", {"matches": [["Travel", "hotel", "subject", 0]]}),
+    ]
+    keywords = [("en", "Finance", "invoice"), ("en", "Travel", "hotel"), ("en", "Travel", "uber")]
+
+    with open(report.generate_rule_report(explanations, keywords), encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [
+        (row["keyword"], row["emails_matched"], row["subject_hits"], row["body_hits"],
+         row["decisive"], row["hit_rate"]) for row in rows
+    ] == [
+        ("hotel", "2", "1", "1", "1", "100.00%"),
+        ("invoice", "1", "1", "1", "1", "50.00%"),
+        ("uber", "0", "0", "0", "0", "0.00%"),
+    ]
+    assert report.generate_rule_report([], keywords) is None
@@ -0,0 +1,132 @@
+import gzip
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from reporting import BodyArchive, EmailDatabase, RetentionPolicy, RetentionRun
+
+POLICY = {
+    "default": {"archive_after_days": 30, "attachments_after_days": 30, "attachments": "compress"},
+    "categories": {
+        "Newsletter": {"delete_after_days": 30, "attachments": "delete"},
+        "Finance": {"archive_after_days": None, "attachments": "keep"},
+    },
+}
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = EmailDatabase(db_path=tmp_path / "emails.db")
+    yield db
+    db.close()
+
+
+def store(database, tmp_path, category, body, filename=None):
+    email_id = database.insert_email(
+        {"sender": "a@x.com", "subject": "s", "body": body}, category,
+        has_attachments=filename is not None,
+    )
+    if filename:
+        path = tmp_path / "attachments" / category / filename
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"report " * 200)
+        database.insert_attachments(
+            email_id, [(filename, str(path), 1400, "text/plain", None)], category
+        )
+    return email_id
+
+
+def test_policy_rules_and_validation():
+    policy = RetentionPolicy(POLICY["default"], POLICY["categories"])
+
+    assert policy.rule("General")["archive_after_days"] == 30
+    assert policy.rule("Finance")["archive_after_days"] is None
+    assert policy.rule("Newsletter") == {
+        "archive_after_days": 30, "delete_after_days": 30,
+        "attachments_after_days": 30, "attachments": "delete",
+    }
+    with pytest.raises(ValueError):
+        RetentionPolicy({"keep_days": 3})
+    with pytest.raises(ValueError):
+        RetentionPolicy({"attachments": "shred"})
+
+
+def test_retention_run_archives_deletes_and_compresses(database, tmp_path):
+    general = store(database, tmp_path, "General", "old body", "notes.txt")
+    finance = store(database, tmp_path, "Finance", "invoice body", "invoice.txt")
+    store(database, tmp_path, "Newsletter", "weekly news", "news.txt")
+    archive = BodyArchive(tmp_path / "archive.db")
+
+    counts = RetentionRun(
+        database, RetentionPolicy(POLICY["default"], POLICY["categories"]), archive,
+        tmp_path / "attachments", batch_size=1, now=datetime.now() + timedelta(days=31),
+    ).run()
+
+    assert counts["archived"] == 1
+    assert counts["deleted"] == 1
+    assert counts["attachments_compressed"] == 1
+    assert counts["orphan_files"] == 0
+    assert database.get_emails_by_category("General")[0]["body"] is None
+    assert archive.get(general) == "old body"
+    assert database.get_emails_by_category("Finance")[0]["body"] == "invoice body"
+    assert archive.get(finance) is None
+    assert database.get_emails_by_category("Newsletter") == []
+    assert not (tmp_path / "attachments" / "Newsletter" / "news.txt").exists()
+
+    (compressed,) = database.get_attachment_paths([general])
+    assert compressed.endswith("notes.txt.gz")
+    with gzip.open(compressed) as f:
+        assert f.read() == b"report " * 200
+    # the summary tables followed the deletions
+    assert database.get_total_count() == 2
+    assert database.rebuild_statistics() is True
+    archive.close()
+
+
+def test_missing_attachment_files_are_synced(database, tmp_path):
+    email_id = store(database, tmp_path, "General", "body", "gone.txt")
+    (tmp_path / "attachments" / "General" / "gone.txt").unlink()
+    (tmp_path / "attachments" / "General" / "stray.bin").write_bytes(b"x")
+    archive = BodyArchive(tmp_path / "archive.db")
+
+    counts = RetentionRun(
+        database, RetentionPolicy(), archive, tmp_path / "attachments"
+    ).run()
+    archive.close()
+
+    assert counts["attachments_missing"] == 1
+    assert counts["orphan_files"] == 1
+    assert database.get_attachment_paths([email_id]) == []
+    assert database.get_attachment_statistics()[0]["files"] == 0
+    assert database.rebuild_statistics() is True
+
+
+def test_attachment_removed_meanwhile_is_missing(database, tmp_path, monkeypatch):
+    store(database, tmp_path, "General", "body", "notes.txt")
+    (attachment,) = database.find_attachments_before("General", "9999", 10)
+    # another prune deletes the file between the exists() check and the removal
+    os.remove(attachment["file_path"])
+    monkeypatch.setattr(os.path, "exists", lambda path: True)
+    run = RetentionRun(database, RetentionPolicy(), BodyArchive(tmp_path / "archive.db"))
+
+    assert run._expire_file(attachment, "delete") == (attachment["id"], None, "missing")
+    assert run._expire_file(attachment, "compress") == (attachment["id"], None, "missing")
+    assert run.counts["attachments_missing"] == 2
+    run.archive.close()
+
+
+def test_older_databases_are_only_converted_on_request(tmp_path):
+    db_path = tmp_path / "old.db"
+    # created before incremental auto-vacuum was the default
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("CREATE TABLE legacy (id INTEGER)")
+    conn.close()
+    database = EmailDatabase(db_path=db_path)
+    mode = "PRAGMA auto_vacuum"
+
+    assert database.incremental_vacuum(10) == 0
+    assert database.conn.execute(mode).fetchone()[0] == 0
+    database.incremental_vacuum(10, convert=True)
+    assert database.conn.execute(mode).fetchone()[0] == 2
+    database.close()
@@ -0,0 +1,74 @@
+import io
+import json
+import logging
+
+import pytest
+from utils import log_sampling, setup_logger, stop_logger
+
+
+@pytest.fixture
+def log_stream():
+    stream = io.StringIO()
+    yield stream
+    stop_logger()
+    log_sampling.rate = 1.0
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def lines(stream):
+    # the listener thread has written everything once stopped
+    stop_logger()
+    return stream.getvalue().splitlines()
+
+
+def test_json_records_carry_email_id_and_stage(log_stream):
+    setup_logger(level="DEBUG", json_format=True, stream=log_stream)
+    # configured: a plain call keeps the configuration
+    setup_logger()
+    logging.info("Category: Finance", extra={"email_id": "42", "stage": "classify"})
+    logging.debug("plain")
+
+    first, second = [json.loads(line) for line in lines(log_stream)]
+    assert first["message"] == "Category: Finance"
+    assert (first["level"], first["email_id"], first["stage"]) == ("INFO", "42", "classify")
+    assert second["message"] == "plain"
+    assert "email_id" not in second
+
+
+def test_json_exception_field(log_stream):
+    setup_logger(json_format=True, stream=log_stream)
+    try:
+        raise ValueError("bad header")
+    except ValueError:
+        logging.error("boom %s", "7", exc_info=True)
+
+    (entry,) = [json.loads(line) for line in lines(log_stream)]
+    assert entry["message"] == "boom 7"
+    assert entry["exception"].startswith("Traceback")
+    assert "ValueError: bad header" in entry["exception"]
+
+
+def test_per_email_lines_are_sampled_whole(log_stream):
+    setup_logger(sample_rate=0.5, stream=log_stream)
+    kept = [str(uid) for uid in range(200) if log_sampling.keeps(str(uid))]
+    assert 60 < len(kept) < 140
+
+    for uid in range(200):
+        logging.info(f"Subject of {uid}", extra={"email_id": str(uid), "stage": "classify"})
+        logging.info(f"Category of {uid}", extra={"email_id": str(uid), "stage": "classify"})
+    logging.warning("Failed", extra={"email_id": "1000", "stage": "failed"})
+    logging.info("Run summary")
+
+    output = lines(log_stream)
+    assert len(output) == 2 * len(kept) + 2
+    assert any(line.endswith(f"Subject of {kept[0]}") for line in output)
+    assert any(line.endswith(f"Category of {kept[0]}") for line in output)
+    assert output[-2].endswith("Failed")
+    assert output[-1].endswith("Run summary")
+
+
+def test_quiet_level(log_stream):
+    setup_logger(level="WARNING", stream=log_stream)
+    logging.info("hidden")
+    logging.warning("shown")
+    assert [line.rsplit("| ", 1)[1] for line in lines(log_stream)] == ["shown"]
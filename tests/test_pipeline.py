@@ -0,0 +1,357 @@
+from email.mime.text import MIMEText
+
+import pytest
+from imap import CircuitOpenError
+from parser import DomainMatcher, EmailParser, EmailClassifier, SenderReputation
+from pipeline import EmailProcessor, MailboxRun
+from reporting import AttachmentHandler, ReportGenerator, EmailDatabase
+from reporting.database import ATTACHMENTS_SAVED, FETCHED, FLAGGED, POISONED, RESOLVED
+from reporting.export import NDJSONExporter, read_ndjson
+
+
+class FlakyClassifier(EmailClassifier):
+    """Fails the first `failures` calls."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def classify(self, email_data):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("transient")
+        return super().classify(email_data)
+
+
+def make_processor(tmp_path, classifier):
+    return EmailProcessor(
+        EmailParser(),
+        classifier,
+        AttachmentHandler(base_path=tmp_path / "attachments"),
+        ReportGenerator(base_path=tmp_path / "reports"),
+        EmailDatabase(db_path=tmp_path / "emails.db"),
+    )
+
+
+@pytest.fixture
+def raw_email():
+    msg = MIMEText("Payment due tomorrow")
+    msg["Subject"] = "Invoice"
+    msg["From"] = "billing@shop.com"
+    return msg.as_bytes()
+
+
+def dead_letter_statuses(database):
+    rows = database.conn.execute("SELECT status, attempts FROM dead_letters").fetchall()
+    return [tuple(row) for row in rows]
+
+
+def test_failed_email_is_dead_lettered_then_retried(tmp_path, raw_email):
+    processor = make_processor(tmp_path, FlakyClassifier(failures=1))
+    database = processor.database
+
+    with pytest.raises(RuntimeError):
+        processor.process(raw_email, b"7")
+    assert processor.record_failure(raw_email, b"7", RuntimeError("transient"), mailbox="INBOX")
+    assert database.get_error_count() == 1
+
+    assert processor.retry_dead_letters() == (1, 0, 0)
+    assert dead_letter_statuses(database) == [(RESOLVED, 1)]
+    # the ERROR row is replaced by the successfully processed one
+    assert database.get_error_count() == 0
+    assert [row["subject"] for row in database.get_emails_by_category("Finance")] == ["Invoice"]
+    database.close()
+
+
+def test_failed_retry_leaves_no_row_and_resolves_the_journal(tmp_path, raw_email):
+    processor = make_processor(tmp_path, EmailClassifier())
+    database = processor.database
+    run_id = database.start_run("work/INBOX", "UNSEEN")
+    database.set_checkpoint(run_id, "7", FETCHED)
+    processor.record_failure(raw_email, b"7", RuntimeError("boom"), run_id, mailbox="INBOX")
+
+    def failing_store(pending):
+        raise OSError("disk full")
+
+    store = processor.store_attachments
+    processor.store_attachments = failing_store
+    processor.retry_dead_letters(base_delay=0)
+    processor.retry_dead_letters(base_delay=0)
+    # only the ERROR row, no row left behind by the failed retries
+    assert database.get_total_count() == 1
+
+    processor.store_attachments = store
+    assert processor.retry_dead_letters(base_delay=0) == (1, 0, 0)
+    checkpoint = database.get_checkpoints(run_id)["7"]
+    assert checkpoint["state"] == FLAGGED
+    assert checkpoint["category"] == "Finance"
+    assert database.get_run_emails(run_id)[0]["subject"] == "Invoice"
+    (mailbox,) = database.conn.execute("SELECT mailbox FROM dead_letters").fetchone()
+    assert mailbox == "INBOX"
+    database.close()
+
+
+def test_merged_dead_letter_retry_leaves_the_local_journal_alone(tmp_path, raw_email):
+    shard = make_processor(tmp_path / "shard", EmailClassifier())
+    shard_run = shard.database.start_run("shard-1", "UID 1:10 UNSEEN")
+    shard.database.set_checkpoint(shard_run, "7", FETCHED)
+    shard.record_failure(raw_email, b"7", RuntimeError("boom"), shard_run, mailbox="INBOX")
+    shard.database.close()
+
+    processor = make_processor(tmp_path, EmailClassifier())
+    database = processor.database
+    # an unrelated local run with the same id as the shard's run
+    local_run = database.start_run("INBOX", "UNSEEN")
+    assert local_run == shard_run
+    database.merge_from(tmp_path / "shard" / "emails.db")
+
+    assert processor.retry_dead_letters(base_delay=0) == (1, 0, 0)
+    assert database.get_checkpoints(local_run) == {}
+    assert [row["subject"] for row in database.get_emails_by_category("Finance")] == ["Invoice"]
+    database.close()
+
+
+def test_poison_message_stops_being_retried(tmp_path, raw_email):
+    processor = make_processor(tmp_path, FlakyClassifier(failures=10))
+    database = processor.database
+    processor.record_failure(raw_email, b"7", RuntimeError("transient"))
+
+    # base_delay=0 so every retry is immediately due again
+    assert processor.retry_dead_letters(max_attempts=3, base_delay=0) == (0, 1, 0)
+    assert processor.retry_dead_letters(max_attempts=3, base_delay=0) == (0, 0, 1)
+    assert processor.retry_dead_letters(max_attempts=3, base_delay=0) == (0, 0, 0)
+    assert dead_letter_statuses(database) == [(POISONED, 3)]
+    database.close()
+
+
+def test_fetch_failure_is_not_dead_lettered(tmp_path):
+    processor = make_processor(tmp_path, EmailClassifier())
+    assert not processor.record_failure(None, b"7", TimeoutError("fetch"))
+    assert processor.database.get_due_dead_letters() == []
+    processor.database.close()
+
+
+class DownServerClient:
+    """Lists two emails, then refuses every fetch with an open circuit."""
+
+    uidvalidity = "1"
+
+    def select_mailbox(self, mailbox):
+        pass
+
+    def search(self, criteria):
+        return [b"1", b"2"]
+
+    def fetch_email(self, uid):
+        raise CircuitOpenError("server unavailable")
+
+
+def test_open_circuit_keeps_emails_pending(tmp_path):
+    processor = make_processor(tmp_path, EmailClassifier())
+    client = DownServerClient()
+    run = MailboxRun(processor)
+    run.start(client)
+
+    with pytest.raises(CircuitOpenError):
+        run.process_batch(client)
+
+    # not recorded as failed emails, retried by the next batch
+    assert run.pending == [b"1", b"2"]
+    assert processor.database.get_error_count() == 0
+    processor.database.close()
+
+
+def test_filtered_unseen_search_still_marks_emails_read(tmp_path):
+    processor = make_processor(tmp_path, EmailClassifier())
+
+    assert MailboxRun(processor, status='UNSEEN FROM "shop.com"').marks_read
+    assert not MailboxRun(processor, status="ALL SINCE 03-Jun-2024").marks_read
+    processor.database.close()
+
+
+class AttachmentsClient:
+    """Serves emails with one attachment each; mark_as_read can fail with an open circuit."""
+
+    uidvalidity = "1"
+
+    def __init__(self, raw_emails):
+        self.raw_emails = raw_emails
+        self.circuit_open = False
+        self.read = []
+
+    def select_mailbox(self, mailbox):
+        pass
+
+    def search(self, criteria):
+        return [str(uid).encode() for uid in range(1, len(self.raw_emails) + 1)]
+
+    def fetch_email(self, uid):
+        return self.raw_emails[int(uid) - 1]
+
+    def mark_as_read(self, uid):
+        if self.circuit_open:
+            raise CircuitOpenError("server unavailable")
+        self.read.append(uid)
+
+
+def attachment_email(name):
+    from email.mime.application import MIMEApplication
+    from email.mime.multipart import MIMEMultipart
+
+    msg = MIMEMultipart()
+    msg["Subject"] = "Invoice"
+    msg["From"] = "billing@shop.com"
+    msg.attach(MIMEText("Payment due"))
+    part = MIMEApplication(b"%PDF" * 1000)
+    part.add_header("Content-Disposition", "attachment", filename=name)
+    msg.attach(part)
+    return msg.as_bytes()
+
+
+def test_attachments_are_recorded_before_flagging(tmp_path):
+    processor = make_processor(tmp_path, EmailClassifier())
+    client = AttachmentsClient([attachment_email(f"invoice{i}.pdf") for i in range(5)])
+    run = MailboxRun(processor)
+    run.start(client)
+    run.process_batch(client)
+
+    database = processor.database
+    rows = database.conn.execute("SELECT file_path FROM attachments").fetchall()
+    assert len(rows) == 5
+    assert all((tmp_path / "attachments" / "Finance" / f"invoice{i}.pdf").exists() for i in range(5))
+    assert sorted(client.read) == [b"1", b"2", b"3", b"4", b"5"]
+    assert {row["state"] for row in database.get_checkpoints(run.run_id).values()} == {FLAGGED}
+    processor.close(generate_reports=False)
+
+
+def test_open_circuit_while_flagging_does_not_store_twice(tmp_path):
+    processor = make_processor(tmp_path, EmailClassifier())
+    client = AttachmentsClient([attachment_email("invoice.pdf")])
+    run = MailboxRun(processor)
+    run.start(client)
+
+    client.circuit_open = True
+    with pytest.raises(CircuitOpenError):
+        run.process_batch(client)
+    assert run.checkpoints["1"]["state"] == ATTACHMENTS_SAVED
+
+    client.circuit_open = False
+    run.process_batch(client)
+
+    database = processor.database
+    assert database.conn.execute("SELECT COUNT(*) FROM attachments").fetchone()[0] == 1
+    assert database.get_total_count() == 1
+    assert client.read == [b"1"]
+    processor.close(generate_reports=False)
+
+
+def test_live_export_matches_database_rows(tmp_path, raw_email):
+    processor = make_processor(tmp_path, EmailClassifier())
+    processor.exporter = NDJSONExporter(tmp_path / "export")
+
+    processor.process(raw_email, b"1")
+    processor.record_failure(raw_email, b"2", RuntimeError("boom"))
+    processor.close(generate_reports=False)
+
+    rows = sorted(read_ndjson(tmp_path / "export"), key=lambda row: row["id"])
+    assert [(row["id"], row["category"], row["error"]) for row in rows] == [
+        (1, "Finance", None),
+        (2, "ERROR", "boom"),
+    ]
+
+
+def test_replies_reuse_the_thread_category(tmp_path):
+    class CountingClassifier(EmailClassifier):
+        calls = 0
+
+        def classify(self, email_data):
+            self.calls += 1
+            return super().classify(email_data)
+
+    classifier = CountingClassifier()
+    processor = make_processor(tmp_path, classifier)
+
+    msg = MIMEText("Payment due tomorrow")
+    msg["Subject"] = "Invoice"
+    msg["From"] = "billing@shop.com"
+    msg["Message-ID"] = "<1@shop.com>"
+    assert processor.process(msg.as_bytes(), b"1") == "Finance"
+
+    reply = MIMEText("Thanks, flight booked")
+    reply["Subject"] = "Re: Trip"
+    reply["From"] = "friend@test.com"
+    reply["Message-ID"] = "<2@test.com>"
+    reply["In-Reply-To"] = "<1@shop.com>"
+    assert processor.process(reply.as_bytes(), b"2") == "Finance"
+    assert classifier.calls == 1
+
+    rows = processor.database.get_emails_by_category("Finance")
+    assert [row["engine"] for row in rows] == ["rules", "thread"]
+    assert rows[0]["thread_id"] == rows[1]["thread_id"]
+
+    # the internal domain check comes before the thread
+    classifier.internal_domains = DomainMatcher.parse("@mycompany.com")
+    internal = MIMEText("Forwarding to accounting")
+    internal["Subject"] = "Re: Invoice"
+    internal["From"] = "colleague@mycompany.com"
+    internal["Message-ID"] = "<4@mycompany.com>"
+    internal["In-Reply-To"] = "<1@shop.com>"
+    assert processor.process(internal.as_bytes(), b"4") == "Internal"
+
+    processor.thread_reuse = False
+    reply.replace_header("Message-ID", "<3@test.com>")
+    assert processor.process(reply.as_bytes(), b"3") == "Travel"
+    processor.close(generate_reports=False)
+
+
+def test_known_senders_skip_the_keyword_scan(tmp_path, raw_email):
+    class CountingClassifier(EmailClassifier):
+        calls = 0
+
+        def classify(self, email_data):
+            self.calls += 1
+            return super().classify(email_data)
+
+    classifier = CountingClassifier()
+    processor = make_processor(tmp_path, classifier)
+    for _ in range(2):
+        processor.process(raw_email, b"1")
+    processor.database.insert_email({"sender": "billing@shop.com"}, "ERROR", error="boom")
+
+    processor.sender_reputation = SenderReputation(threshold=0.9, min_count=2).fit(
+        processor.database.get_sender_history()
+    )
+    assert processor.process(raw_email, b"2") == "Finance"
+    assert classifier.calls == 2
+    rows = processor.database.get_emails_by_category("Finance")
+    assert [row["engine"] for row in rows] == ["rules", "rules", "sender"]
+    processor.close(generate_reports=False)
+
+
+def test_explanations_are_stored_with_the_email(tmp_path, raw_email):
+    processor = make_processor(tmp_path, EmailClassifier(explain=True))
+    processor.process(raw_email, b"1")
+
+    [(category, explanation)] = processor.database.iter_explanations()
+    assert category == "Finance"
+    assert explanation["scores"] == {"Finance": 4}
+    assert ["Finance", "invoice", "subject", 0] in explanation["matches"]
+    processor.close(generate_reports=False)
+
+
+def test_bulk_logging_reports_aggregate_counters(tmp_path, raw_email, caplog, monkeypatch):
+    from utils import log_sampling
+
+    monkeypatch.setattr(log_sampling, "rate", 0.0)
+    monkeypatch.setattr(log_sampling, "summary_every", 2)
+    processor = make_processor(tmp_path, EmailClassifier())
+
+    with caplog.at_level("INFO"):
+        processor.process(raw_email, b"1")
+        processor.process(raw_email, b"2")
+    processor.close(generate_reports=False)
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert not any(message.startswith("Subject:") for message in messages)
+    [summary] = [message for message in messages if "emails processed" in message]
+    assert summary.startswith("2 emails processed: {'Finance': 2}, 0 errors")
@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+from email.mime.text import MIMEText
+
+import pytest
+import scheduler
+from parser import EmailParser, EmailClassifier
+from pipeline import EmailProcessor
+from reporting import AttachmentHandler, ReportGenerator, EmailDatabase
+
+
+def make_email(subject):
+    msg = MIMEText("body")
+    msg["Subject"] = subject
+    msg["From"] = "someone@test.com"
+    return msg.as_bytes()
+
+
+class FakeIMAPClient:
+    """In-memory account: {email address: {folder: [subjects]}}."""
+
+    accounts = {}
+    open_connections = {}
+    max_seen = {}
+    lock = threading.Lock()
+
+    def __init__(self, server=None, port=None, email=None, password=None, use_uid=False,
+                 breaker=None):
+        self.email = email
+        self.uidvalidity = "1"
+        self.folder = None
+
+    def connect(self):
+        with self.lock:
+            count = self.open_connections.get(self.email, 0) + 1
+            self.open_connections[self.email] = count
+            self.max_seen[self.email] = max(self.max_seen.get(self.email, 0), count)
+
+    def logout(self):
+        with self.lock:
+            self.open_connections[self.email] -= 1
+
+    def select_mailbox(self, mailbox):
+        self.folder = mailbox
+
+    def search(self, criteria):
+        subjects = self.accounts[self.email][self.folder]
+        return [str(i).encode() for i in range(1, len(subjects) + 1)]
+
+    def fetch_email(self, uid):
+        return make_email(self.accounts[self.email][self.folder][int(uid) - 1])
+
+    def mark_as_read(self, uid):
+        pass
+
+
+@pytest.fixture
+def processor(tmp_path):
+    processor = EmailProcessor(
+        EmailParser(),
+        EmailClassifier(),
+        AttachmentHandler(base_path=tmp_path / "attachments"),
+        ReportGenerator(base_path=tmp_path / "reports"),
+        EmailDatabase(db_path=tmp_path / "emails.db"),
+    )
+    yield processor
+    processor.database.close()
+
+
+def test_load_fleet_config(tmp_path, monkeypatch):
+    monkeypatch.setenv("SUPPORT_PASSWORD", "secret")
+    path = tmp_path / "accounts.json"
+    path.write_text(
+        json.dumps(
+            {
+                "accounts": [
+                    {
+                        "name": "support",
+                        "server": "imap.test.com",
+                        "email": "support@test.com",
+                        "password_env": "SUPPORT_PASSWORD",
+                        "folders": ["INBOX", "Billing"],
+                    },
+                    {"server": "imap.test.com", "email": "x@test.com", "password": "p"},
+                ]
+            }
+        )
+    )
+
+    support, other = scheduler.load_fleet_config(path)
+
+    assert support["password"] == "secret"
+    assert support["folders"] == ["INBOX", "Billing"]
+    assert support["max_connections"] == 2
+    assert other["name"] == "x@test.com"
+    assert other["folders"] == ["INBOX"]
+
+
+def test_fleet_processes_every_mailbox_within_connection_limits(processor, monkeypatch):
+    monkeypatch.setattr(scheduler, "IMAPClient", FakeIMAPClient)
+    FakeIMAPClient.accounts = {
+        "a@test.com": {"INBOX": ["Invoice"] * 40, "Travel": ["Flight"] * 3},
+        "b@test.com": {"INBOX": ["Meeting"] * 5},
+    }
+    FakeIMAPClient.open_connections = {}
+    FakeIMAPClient.max_seen = {}
+    accounts = [
+        {"name": "a", "server": "s", "port": 993, "email": "a@test.com",
+         "password": "p", "max_connections": 1, "folders": ["INBOX", "Travel"]},
+        {"name": "b", "server": "s", "port": 993, "email": "b@test.com",
+         "password": "p", "max_connections": 2, "folders": ["INBOX"]},
+    ]
+
+    scheduler.FleetScheduler(processor, accounts, workers=4, batch_size=4).run()
+
+    stats = {row["category"]: row["count"] for row in processor.database.get_statistics()}
+    assert stats == {"Finance": 40, "Travel": 3, "Meetings": 5}
+    assert FakeIMAPClient.max_seen["a@test.com"] == 1
+    assert FakeIMAPClient.open_connections == {"a@test.com": 0, "b@test.com": 0}
+    # every mailbox run is journaled and closed
+    rows = processor.database.conn.execute("SELECT mailbox, finished_at FROM runs").fetchall()
+    assert sorted(row["mailbox"] for row in rows) == ["a/INBOX", "a/Travel", "b/INBOX"]
+    assert all(row["finished_at"] for row in rows)
+
+
+def test_deferred_mailbox_does_not_hold_a_worker(processor, monkeypatch):
+    from imap import CircuitOpenError
+
+    finished = {}
+    start = time.monotonic()
+
+    class DownOnceClient(FakeIMAPClient):
+        failed = False
+
+        def connect(self):
+            if self.email == "down@test.com" and not DownOnceClient.failed:
+                DownOnceClient.failed = True
+                raise CircuitOpenError("server unavailable")
+            super().connect()
+
+        def mark_as_read(self, uid):
+            finished[self.email] = time.monotonic() - start
+
+    monkeypatch.setattr(scheduler, "IMAPClient", DownOnceClient)
+    FakeIMAPClient.accounts = {
+        "down@test.com": {"INBOX": ["Invoice"]},
+        "up@test.com": {"INBOX": ["Meeting"] * 3},
+    }
+    FakeIMAPClient.open_connections = {}
+    accounts = [
+        {"name": name, "server": "s", "port": 993, "email": f"{name}@test.com",
+         "password": "p", "max_connections": 1, "folders": ["INBOX"]}
+        for name in ("down", "up")
+    ]
+
+    # one worker: the healthy account is processed during the 1s backoff
+    scheduler.FleetScheduler(processor, accounts, workers=1, batch_size=1).run()
+
+    assert finished["up@test.com"] < 0.9
+    assert finished["down@test.com"] >= 1
+    assert processor.database.get_total_count() == 4
@@ -0,0 +1,212 @@
+import json
+import os
+import socket
+import time
+from email.mime.text import MIMEText
+
+import pytest
+from imap import IMAPClientError
+from parser import EmailParser, EmailClassifier
+from pipeline import EmailProcessor
+from reporting import AttachmentHandler, ReportGenerator, EmailDatabase
+from sharding import ShardWorker, merge_shards, publish_shards
+from workqueue import (
+    CLAIMED,
+    DONE,
+    FAILED,
+    MERGED,
+    PENDING,
+    FileWorkQueue,
+    SQLiteWorkQueue,
+    split_into_shards,
+)
+
+SUBJECTS = {uid: subject for uid, subject in enumerate(["Invoice", "Flight", "Meeting"] * 4, 1)}
+
+
+class FakeIMAPClient:
+    """UID-mode client over SUBJECTS, understanding 'UID first:last <status>' searches."""
+
+    uidvalidity = "1"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def select_mailbox(self, mailbox):
+        pass
+
+    def search(self, criteria):
+        uids = sorted(SUBJECTS)
+        if criteria.startswith("UID "):
+            first, last = map(int, criteria.split()[1].split(":"))
+            uids = [uid for uid in uids if first <= uid <= last]
+        return [str(uid).encode() for uid in uids]
+
+    def fetch_email(self, uid):
+        msg = MIMEText("body")
+        msg["Subject"] = SUBJECTS[int(uid)]
+        msg["From"] = "someone@test.com"
+        return msg.as_bytes()
+
+    def mark_as_read(self, uid):
+        pass
+
+
+@pytest.fixture(params=["sqlite", "file"])
+def work_queue(request, tmp_path):
+    if request.param == "sqlite":
+        queue = SQLiteWorkQueue(tmp_path / "queue.db")
+    else:
+        queue = FileWorkQueue(tmp_path / "queue")
+    yield queue
+    queue.close()
+
+
+def make_processor(tmp_path, db_path):
+    return EmailProcessor(
+        EmailParser(),
+        EmailClassifier(),
+        AttachmentHandler(base_path=tmp_path / "attachments"),
+        ReportGenerator(base_path=tmp_path / "reports"),
+        EmailDatabase(db_path=db_path),
+    )
+
+
+def test_split_into_shards():
+    assert split_into_shards([b"7", b"1", b"3", b"9", b"12"], 2) == [(1, 3), (7, 9), (12, 12)]
+    assert split_into_shards([], 2) == []
+
+
+def test_leases_and_reclaim(work_queue):
+    work_queue.publish("INBOX", "ALL", [(1, 10), (11, 20)])
+
+    first = work_queue.claim("w1", lease_seconds=60)
+    second = work_queue.claim("w2", lease_seconds=0.01)
+    assert (first["first_uid"], second["first_uid"]) == (1, 11)
+    assert work_queue.claim("w3", lease_seconds=60) is None
+
+    # w2 dies: its lease expires and w3 takes the shard over
+    time.sleep(0.02)
+    reclaimed = work_queue.claim("w3", lease_seconds=60)
+    assert reclaimed["id"] == second["id"]
+    assert reclaimed["attempts"] == 2
+    assert not work_queue.renew(second["id"], "w2", 60)
+    assert not work_queue.complete(second["id"], "w2", "late.db")
+
+    assert work_queue.complete(first["id"], "w1", "shard_1.db")
+    assert [s["status"] for s in work_queue.shards()] == [DONE, CLAIMED]
+
+
+def test_coordinator_workers_and_merge(work_queue, tmp_path):
+    publish_shards(FakeIMAPClient(), work_queue, "INBOX", "ALL", shard_size=5)
+
+    workers = [
+        ShardWorker(
+            work_queue,
+            FakeIMAPClient,
+            lambda db_path: make_processor(tmp_path, db_path),
+            shard_dir=tmp_path / "shards",
+            batch_size=2,
+            worker_id=f"w{i}",
+        )
+        for i in range(2)
+    ]
+    assert workers[0].process_shard(work_queue.claim("w0", 60))
+    assert workers[1].run() == 2
+    assert workers[0].run() == 0
+
+    main = make_processor(tmp_path, tmp_path / "emails.db")
+    assert merge_shards(work_queue, main.database, main.report_generator) == 3
+    assert merge_shards(work_queue, main.database, main.report_generator) == 0
+
+    stats = {row["category"]: row["count"] for row in main.database.get_statistics()}
+    assert stats == {"Finance": 4, "Travel": 4, "Meetings": 4}
+    assert len(main.report_generator.processed_emails) == 12
+    assert {s["status"] for s in work_queue.shards()} == {MERGED}
+    main.database.close()
+
+
+def test_worker_releases_a_shard_on_imap_errors(work_queue, tmp_path):
+    publish_shards(FakeIMAPClient(), work_queue, "INBOX", "ALL", shard_size=12)
+    attempts = []
+
+    class FailingOnceClient(FakeIMAPClient):
+        def search(self, criteria):
+            attempts.append(criteria)
+            if len(attempts) == 1:
+                raise IMAPClientError("Search failed")
+            return super().search(criteria)
+
+    worker = ShardWorker(
+        work_queue, FailingOnceClient, lambda db_path: make_processor(tmp_path, db_path),
+        shard_dir=tmp_path / "shards", poll_interval=0, worker_id="w0",
+    )
+    assert worker.run() == 1
+    (shard,) = work_queue.shards()
+    assert (shard["status"], shard["attempts"]) == (DONE, 2)
+    # the result was published under its final name, no lease file left behind
+    assert [path.name for path in (tmp_path / "shards").iterdir()] == ["shard_1.db"]
+
+
+def test_permanent_imap_errors_fail_the_shard_and_stop_the_worker(work_queue, tmp_path):
+    publish_shards(FakeIMAPClient(), work_queue, "INBOX", "ALL", shard_size=6)
+
+    class DeletedMailboxClient(FakeIMAPClient):
+        def select_mailbox(self, mailbox):
+            raise IMAPClientError(f"Cannot select mailbox: {mailbox}")
+
+    def worker(max_failures):
+        return ShardWorker(
+            work_queue, DeletedMailboxClient, lambda db_path: make_processor(tmp_path, db_path),
+            shard_dir=tmp_path / "shards", poll_interval=0, worker_id="w0",
+            max_attempts=2, max_failures=max_failures,
+        )
+
+    # the worker gives up after three failures in a row, leaving a shard pending
+    assert worker(max_failures=3).run() == 0
+    assert [(s["status"], s["attempts"]) for s in work_queue.shards()] == [
+        (FAILED, 2), (PENDING, 1),
+    ]
+    # failed shards do not keep the run from ending
+    assert worker(max_failures=10).run() == 0
+    assert {s["status"] for s in work_queue.shards()} == {FAILED}
+
+
+def test_lost_lease_writes_its_own_file(work_queue, tmp_path):
+    publish_shards(FakeIMAPClient(), work_queue, "INBOX", "ALL", shard_size=12)
+    first = work_queue.claim("w1", lease_seconds=0.01)
+    time.sleep(0.02)
+    second = work_queue.claim("w2", lease_seconds=60)
+
+    def worker(worker_id):
+        return ShardWorker(
+            work_queue, FakeIMAPClient, lambda db_path: make_processor(tmp_path, db_path),
+            shard_dir=tmp_path / "shards", batch_size=2, worker_id=worker_id,
+        )
+
+    assert not worker("w1").process_shard(first)
+    assert not (tmp_path / "shards" / "shard_1.db").exists()
+    assert worker("w2").process_shard(second)
+    assert work_queue.shards()[0]["result_path"].endswith("shard_1.db")
+
+
+def test_stale_file_queue_lock_is_broken(tmp_path):
+    queue = FileWorkQueue(tmp_path / "queue", lock_timeout=1)
+    # left by a crashed process: its pid no longer exists
+    queue.lock_path.write_text(
+        json.dumps({"host": socket.gethostname(), "pid": 2**22 + 1, "time": time.time()})
+    )
+    queue.publish("INBOX", "ALL", [(1, 10)])
+    assert len(queue.shards()) == 1
+    assert not queue.lock_path.exists()
+
+    # a live owner's recent lock is respected
+    queue.lock_path.write_text(
+        json.dumps({"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()})
+    )
+    queue.lock_timeout = 0.05
+    with pytest.raises(TimeoutError):
+        queue.claim("w1", 60)
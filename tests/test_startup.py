@@ -0,0 +1,129 @@
+"""
+Startup benchmark: the CLI is run by cron every minute, so `--help` and
+no-op runs must not pay for sqlite3, ssl, csv or the email package.
+"""
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parents[1] / "email_sorter"
+HEAVY_MODULES = {"sqlite3", "ssl", "csv", "email", "imaplib", "dotenv"}
+
+HELP_TARGET_SECONDS = 1.0
+EMPTY_RUN_TARGET_SECONDS = 0.5
+# emails already in the database of the no-op run
+POPULATED_EMAILS = 2000
+
+
+def imported_modules(*args):
+    """Run python -X importtime with args and return (imported modules, elapsed seconds)."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=PACKAGE_DIR.parent,
+        env=dict(os.environ, PYTHONPATH=str(PACKAGE_DIR)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed = time.perf_counter() - start
+    modules = {
+        line.rsplit("|", 1)[1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "|" in line
+    }
+    return modules, elapsed
+
+
+def test_help_skips_heavy_imports():
+    modules, elapsed = imported_modules("email_sorter", "--help")
+
+    assert not modules & HEAVY_MODULES
+    assert elapsed < HELP_TARGET_SECONDS
+
+
+def test_pipeline_modules_defer_heavy_imports():
+    modules, _ = imported_modules(
+        "-c", "import pipeline, scheduler, sharding, workqueue, imap, parser, reporting"
+    )
+
+    assert not modules & HEAVY_MODULES
+
+
+class EmptyMailbox:
+    uidvalidity = "1"
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def select_mailbox(self, mailbox):
+        pass
+
+    def search(self, criteria):
+        return []
+
+
+def load_cli(tmp_path, monkeypatch):
+    import imap
+
+    spec = importlib.util.spec_from_file_location("cli", PACKAGE_DIR / "__main__.py")
+    cli = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cli)
+    monkeypatch.setattr(imap, "IMAPClient", EmptyMailbox)
+    monkeypatch.chdir(tmp_path)
+    return cli
+
+
+def test_empty_mailbox_run_time(tmp_path, monkeypatch):
+    cli = load_cli(tmp_path, monkeypatch)
+
+    start = time.perf_counter()
+    cli.run_pipeline()
+    assert time.perf_counter() - start < EMPTY_RUN_TARGET_SECONDS
+
+
+def test_default_run_does_not_scan_the_history(tmp_path, monkeypatch):
+    from reporting import EmailDatabase
+
+    database = EmailDatabase(db_path=tmp_path / "output" / "emails.db")
+    for i in range(POPULATED_EMAILS):
+        database.insert_email(
+            {"sender": f"sender{i % 50}@shop.com", "subject": "Invoice", "body": "Payment due"},
+            "Finance",
+        )
+    database.close()
+
+    def full_scan(self, *args, **kwargs):
+        raise AssertionError("the default run read the whole email history")
+
+    monkeypatch.setattr(EmailDatabase, "get_sender_history", full_scan)
+    monkeypatch.setattr(sys, "argv", ["email_sorter"])
+    cli = load_cli(tmp_path, monkeypatch)
+
+    start = time.perf_counter()
+    cli.main()
+    assert time.perf_counter() - start < EMPTY_RUN_TARGET_SECONDS
+
+
+def test_programmatic_callers_still_load_the_env_file(monkeypatch):
+    import dotenv
+    from parser import EmailClassifier
+    from utils import env
+
+    monkeypatch.setattr(env, "_loaded", False)
+    # stands for a .env file holding INTERNAL_DOMAIN
+    monkeypatch.setattr(
+        dotenv, "load_dotenv", lambda: monkeypatch.setenv("INTERNAL_DOMAIN", "@corp.example")
+    )
+
+    # built without going through main()
+    assert EmailClassifier().is_internal("alice@corp.example")